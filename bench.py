@@ -0,0 +1,269 @@
+"""Benchmarks for the engine and asset pipeline.
+
+Run one with `python bench.py <name>`, see `python bench.py -h` for the list.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import objhelper
+
+
+def write_grid_obj(path, triangles, syntax="v/vt/vn"):
+    """write a flat grid mesh of about `triangles` triangles as an OBJ file,
+    using quads so the loader has to triangulate"""
+    side = max(1, int(np.sqrt(triangles / 2)))
+    n = side + 1
+    xs, zs = np.meshgrid(np.arange(n), np.arange(n))
+    ys = np.sin(xs * 0.1) * np.cos(zs * 0.1)
+    verts = np.stack([xs.ravel(), ys.ravel(), zs.ravel()], axis=1)
+
+    i, j = np.meshgrid(np.arange(side), np.arange(side))
+    a = (j * n + i).ravel() + 1
+    quads = np.stack([a, a + 1, a + n + 1, a + n], axis=1)
+
+    with open(path, "w") as f:
+        f.write("# grid benchmark mesh\n")
+        f.write("".join(f"v {x:.6f} {y:.6f} {z:.6f}\n" for x, y, z in verts))
+        f.write("vt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\nvn 0 1 0\n")
+        if syntax == "v":
+            fmt = "f {} {} {} {}\n"
+            rows = quads
+        elif syntax == "v//vn":
+            fmt = "f {}//1 {}//1 {}//1 {}//1\n"
+            rows = quads
+        else:
+            fmt = "f {}/1/1 {}/2/1 {}/3/1 {}/4/1\n"
+            rows = quads
+        f.write("".join(fmt.format(*q) for q in rows.tolist()))
+    return len(quads) * 2
+
+
+def bench_obj(args):
+    """OBJ loading throughput in MB/s on a generated multi-million triangle mesh"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "grid.obj")
+        tris = write_grid_obj(path, args.triangles, args.syntax)
+        size = os.path.getsize(path) / 1e6
+        print(f"mesh: {tris:,} triangles, {size:.1f} MB, faces as {args.syntax}")
+
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            mesh = objhelper.load_obj(path)
+            times.append(time.perf_counter() - start)
+        assert len(mesh.faces) == tris
+
+    best = min(times)
+    print(f"load_obj: best {best:.3f}s of {args.repeat}")
+    print(f"  {size / best:.1f} MB/s, {tris / best / 1e6:.2f} M triangles/s")
+
+
+BLOCK_TYPES = ["block", "slab", "stairs", "vslab", "model"]
+
+
+def make_blocks(mc, kind, count):
+    """make `count` blocks of one type packed into a cube"""
+    side = max(1, round(count ** (1 / 3)))
+    mesh = mc.Mesh.box((0, 0, 0), (1, 1, 1))  # shared by every model
+    color = (112, 168, 101)
+    blocks = []
+    for i in range(count):
+        pos = mc.Coordinate(i % side, i // side % side, i // side // side)
+        if kind == "block":
+            blocks.append(mc.Block(pos, color))
+        elif kind == "slab":
+            blocks.append(mc.BlockSlab(pos, color))
+        elif kind == "stairs":
+            blocks.append(mc.BlockStairs(pos, color))
+        elif kind == "vslab":
+            blocks.append(mc.BlockVerticalSlab(pos, color))
+        else:
+            blocks.append(mc.BlockModel.from_mesh(pos, color, mesh))
+    return blocks
+
+
+def bench_memory(args):
+    """memory per block and per face for worlds of each block type, with the
+    peak allocation while building them"""
+    import minecrafttest as mc
+
+    for kind in args.types:
+        for count in args.blocks:
+            tracemalloc.start()
+            start = time.perf_counter()
+            world = mc.World()
+            for block in make_blocks(mc, kind, count):
+                world.set_block(block)
+            built = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            sample = next(iter(world.blocks.values()))
+            faces = len(sample.get_faces()) * count
+            print(
+                f"{kind}: {count:,} blocks in {built:.2f}s, "
+                f"{current / count:,.0f} B/block, {current / faces:,.0f} B/face, "
+                f"peak {peak / 2**20:.1f} MiB"
+            )
+            if args.detail:
+                usage = mc.memory_usage(world)
+                for owner, (n, size) in sorted(usage.items(), key=lambda kv: -kv[1][1]):
+                    print(f"  {owner:<20} {n:>9,} {size / count:>9,.0f} B/block")
+            del world
+
+
+def bench_batch(args):
+    """EntityBatch step time for thousands of entities falling onto and
+    walking across a floor with half height blocks scattered on it"""
+    import minecrafttest as mc
+
+    world = mc.World()
+    half = args.floor // 2
+    for x in range(-half, half):
+        for z in range(-half, half):
+            world.set_block(mc.Block(mc.Coordinate(x, 0, z), (112, 168, 101)))
+    rng = np.random.default_rng(0)
+    step = mc.Mesh.box((0, 0, 0), (1, 0.5, 1))  # partial, swept exactly
+    for x, z in rng.integers(-half, half, (args.partial, 2)).tolist():
+        world.set_block(
+            mc.BlockModel.from_mesh(mc.Coordinate(x, 1, z), (0, 0, 0), step)
+        )
+
+    for count in args.entities:
+        batch = mc.EntityBatch(world)
+        pos = rng.uniform((-half, 1, -half), (half, 8, half), (count, 3))
+        vel = rng.uniform(-2, 2, (count, 2))
+        for (x, y, z), (vx, vz) in zip(pos.tolist(), vel.tolist()):
+            batch.spawn(mc.Coordinate(x, y, z), vel=mc.Coordinate(vx, 0, vz))
+        times = []
+        for _ in range(args.ticks):
+            start = time.perf_counter()
+            batch.step(1 / 20)
+            times.append(time.perf_counter() - start)
+        mean = sum(times) / len(times)
+        print(
+            f"{count:>6} entities: {mean * 1000:6.2f} ms/step, "
+            f"{mean / count * 1e6:.2f} us/entity, "
+            f"{int(batch.on_ground[: batch.count].sum()):,} on the ground"
+        )
+
+
+IMPORT_CHECK = """
+import time
+start = time.perf_counter()
+import {module}
+took = time.perf_counter() - start
+import pygame
+print(took, pygame.get_init(), pygame.display.get_init())
+"""
+
+
+def bench_import(args):
+    """cold import time of the engine in a fresh interpreter, checking that
+    importing it doesn't start pygame or open a window"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    for module in ["numpy", "pygame", "minecrafttest"]:
+        times = []
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", IMPORT_CHECK.format(module=module)],
+                cwd=here,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.split()
+            times.append(float(out[0]))
+        started = out[1] == "True" or out[2] == "True"
+        print(
+            f"import {module}: best {min(times) * 1000:.0f} ms of {args.repeat}"
+            + (", STARTED PYGAME" if started else "")
+        )
+
+
+def bench_server(args):
+    """bytes per tick and tick latency of the game server as clients are
+    added, with bots over localhost against a server in another process"""
+    import server
+
+    with socket.socket() as sock:  # find a free port
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    cmd = [sys.executable, "server.py", "serve", "--port", str(port)]
+    cmd += ["--floor", str(args.floor), "--interest", str(args.interest)]
+    proc = subprocess.Popen(cmd, cwd=here, env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        proc.stdout.readline()  # "serving on ...", once it's listening
+        for clients in args.clients:
+            bots = asyncio.run(
+                server.run_bots("127.0.0.1", port, clients, args.ticks, args.spread)
+            )
+            result = server.report(bots)
+            print(
+                f"{clients:>4} clients: {result['bytes']:>7.0f} B/tick each, "
+                f"{result['bytes'] * clients / 1024:>7.1f} KiB/tick total, "
+                f"latency {result['latency'] * 1000:.1f} ms "
+                f"(p95 {result['p95'] * 1000:.1f} ms), "
+                f"{result['seen']:.1f} entities in view"
+            )
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    obj = sub.add_parser("obj", help=bench_obj.__doc__)
+    obj.add_argument("--triangles", type=int, default=2_000_000)
+    obj.add_argument("--syntax", choices=["v", "v//vn", "v/vt/vn"], default="v/vt/vn")
+    obj.add_argument("--repeat", type=int, default=3)
+    obj.set_defaults(run=bench_obj)
+
+    memory = sub.add_parser("memory", help=bench_memory.__doc__)
+    memory.add_argument("--types", nargs="+", choices=BLOCK_TYPES, default=BLOCK_TYPES)
+    memory.add_argument("--blocks", nargs="+", type=int, default=[1000, 10_000])
+    memory.add_argument(
+        "--detail", action="store_true", help="break the memory down by object type"
+    )
+    memory.set_defaults(run=bench_memory)
+
+    batch = sub.add_parser("batch", help=bench_batch.__doc__)
+    batch.add_argument("--entities", nargs="+", type=int, default=[1000, 5000, 20_000])
+    batch.add_argument("--ticks", type=int, default=60)
+    batch.add_argument("--floor", type=int, default=64)
+    batch.add_argument("--partial", type=int, default=200)
+    batch.set_defaults(run=bench_batch)
+
+    imp = sub.add_parser("import", help=bench_import.__doc__)
+    imp.add_argument("--repeat", type=int, default=5)
+    imp.set_defaults(run=bench_import)
+
+    srv = sub.add_parser("server", help=bench_server.__doc__)
+    srv.add_argument("--clients", nargs="+", type=int, default=[1, 4, 16, 64])
+    srv.add_argument("--ticks", type=int, default=100)
+    srv.add_argument("--spread", type=float, default=64.0)
+    srv.add_argument("--floor", type=int, default=64)
+    srv.add_argument("--interest", type=float, default=32.0)
+    srv.set_defaults(run=bench_server)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,22 @@
+import argparse
+import heapq
+import json
 import math
-
+import os
+import queue
+import sys
+import threading
+import time
+import types
+import weakref
+from collections import OrderedDict, deque
+
+import numpy as np
 import pygame
 import pygame.gfxdraw
 
-pygame.init()
-screen_surf = pygame.display.set_mode(
-    (800, 600), pygame.RESIZABLE | pygame.DOUBLEBUF | pygame.HWSURFACE
-)
-pygame.display.set_caption("3D thingies")
-pygame.mouse.set_visible(False)
-pygame.event.set_grab(True)
-
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, 24)
+import objhelper
+from spatial import BVH, SpatialHash, outside_planes
 
 
 def cos(x):
@@ -27,6 +31,27 @@ def tan(x):
     return math.tan(math.radians(x))
 
 
+# baked lighting (World.bake_lighting, Mesh.shades): faces are lit by a fixed
+# sun plus some ambient light, and darkened in corners next to other blocks
+LIGHT_DIR = (0.3 / 1.03, 0.9 / 1.03, 0.4 / 1.03)  # unit vector towards the sun
+AMBIENT = 0.55  # brightness of faces turned away from the sun
+AO_STRENGTH = 0.4  # how much a fully enclosed corner darkens its face
+
+
+def _light(normal) -> float:
+    """brightness of a face with this (not necessarily unit) normal"""
+    length = math.sqrt(normal[0] ** 2 + normal[1] ** 2 + normal[2] ** 2)
+    if length == 0:
+        return 1.0
+    d = sum(normal[i] * LIGHT_DIR[i] for i in range(3)) / length
+    return AMBIENT + (1 - AMBIENT) * max(d, 0.0)
+
+
+def _shade_color(color, factor) -> tuple:
+    """scale the rgb of a color, keeping any extra channels as they are"""
+    return tuple(min(255, int(c * factor)) for c in color[:3]) + tuple(color[3:])
+
+
 class Coordinate:
     def __init__(self, x, y, z):
         self.x = x
@@ -85,6 +110,42 @@ class Face:
             v1.x * v2.y - v1.y * v2.x,
         )
 
+    def intersect_ray(self, origin: tuple, direction: tuple, max_t=math.inf):
+        """get the t where a ray crosses this face, or None if it misses"""
+        n = self.get_normal()
+        denom = n[0] * direction[0] + n[1] * direction[1] + n[2] * direction[2]
+        if denom == 0:
+            return None  # parallel (or degenerate face)
+        v0 = self.vertices[0]
+        t = (
+            n[0] * (v0.x - origin[0])
+            + n[1] * (v0.y - origin[1])
+            + n[2] * (v0.z - origin[2])
+        ) / denom
+        if t < 0 or t > max_t:
+            return None
+        hit = (
+            origin[0] + direction[0] * t,
+            origin[1] + direction[1] * t,
+            origin[2] + direction[2] * t,
+        )
+
+        # drop the normal's biggest axis and do a 2d crossing test,
+        # which also works for concave faces like the stair sides
+        ax = max(range(3), key=lambda i: abs(n[i]))
+        a, b = [i for i in range(3) if i != ax]
+        pts = [vert.get() for vert in self.vertices]
+        pa, pb = hit[a], hit[b]
+        inside = False
+        j = len(pts) - 1
+        for i in range(len(pts)):
+            ai, bi = pts[i][a], pts[i][b]
+            aj, bj = pts[j][a], pts[j][b]
+            if (bi > pb) != (bj > pb) and pa < (aj - ai) * (pb - bi) / (bj - bi) + ai:
+                inside = not inside
+            j = i
+        return t if inside else None
+
 
 class GenericBlock:
     """A generic block template"""
@@ -96,6 +157,8 @@ class GenericBlock:
         self.verts = None
         self.facemap = None
         self.faces = None
+        self.lit = False  # whether the faces have baked lighting (World.bake_lighting)
+        self._face_arrays = None  # see get_face_arrays
         self.hitbox = Hitbox(self.pos, Coordinate(0, 0, 0), Coordinate(1, 1, 1))
         # self.verts = self._calc_verts()
         # self.facemap = [
@@ -128,10 +191,58 @@ class GenericBlock:
         """get cached vertices of block"""
         return self.verts
 
+    def on_grid(self) -> bool:
+        """whether the block sits inside the grid cell at its position,
+        so it can be found with an exact World.get_block lookup"""
+        return (
+            float(self.pos.x).is_integer()
+            and float(self.pos.y).is_integer()
+            and float(self.pos.z).is_integer()
+            and self.hitbox.start.x >= 0
+            and self.hitbox.start.y >= 0
+            and self.hitbox.start.z >= 0
+            and self.hitbox.end.x <= 1
+            and self.hitbox.end.y <= 1
+            and self.hitbox.end.z <= 1
+        )
+
+    def fills_cell(self) -> bool:
+        """whether the hitbox is the whole grid cell, like a full Block's"""
+        h = self.hitbox
+        return h.start.get() == (0, 0, 0) and h.end.get() == (1, 1, 1)
+
     def get_faces(self):
         """get cached faces of block"""
         return self.faces
 
+    def get_face_arrays(self) -> tuple:
+        """(faces, vertices, sizes, centers, normals) of the cached faces, the
+        rest being arrays of the faces' vertices one after another, vertex
+        counts, centers and normals. for Screen's batched drawing, made once
+        since a block doesn't move"""
+        if self._face_arrays is None:
+            faces = [face for face in self.get_faces() if face is not None]
+            self._face_arrays = (
+                faces,
+                np.array(
+                    [v.get() for face in faces for v in face.get_vertices()],
+                    dtype=np.float64,
+                ).reshape(-1, 3),
+                np.array([len(face.get_vertices()) for face in faces], dtype=np.int64),
+                np.array(
+                    [face.get_center().get() for face in faces], dtype=np.float64
+                ).reshape(-1, 3),
+                np.array(
+                    [face.get_normal() for face in faces], dtype=np.float64
+                ).reshape(-1, 3),
+            )
+        return self._face_arrays
+
+    def get_state(self) -> dict:
+        """constructor arguments besides pos, color and transparent, so the
+        block can be saved and made again (World.save)"""
+        return {}
+
 
 class Block(GenericBlock):
     """A full cube block (1x1x1)"""
@@ -215,6 +326,9 @@ class BlockSlab(GenericBlock):
             self.pos.z + 0.5,
         )
 
+    def get_state(self):
+        return {"bottom": self.bottom}
+
 
 class BlockStairs(GenericBlock):
     """A stair block"""
@@ -282,6 +396,9 @@ class BlockStairs(GenericBlock):
     def get_center(self):  # varies based on direction/top/bottom
         return Coordinate(self.pos.x + 0.5, self.pos.y + 0.5, self.pos.z + 0.5)
 
+    def get_state(self):
+        return {"direction": self.direction, "bottom": self.bottom}
+
 
 class BlockVerticalSlab(GenericBlock):
     """A vertical slab that's half the width of a normal block (0.5x1x1)"""
@@ -332,40 +449,702 @@ class BlockVerticalSlab(GenericBlock):
             self.pos.z + 0.5,
         )
 
+    def get_state(self):
+        return {"left": self.left}
+
+
+class Mesh:
+    """Model geometry shared by every BlockModel (or entity) drawn with it.
+    vertices are offsets from an instance's position and are never changed,
+    so one mesh can be placed any number of times"""
+
+    def __init__(self, vertices, faces, lods=(), offsets=None):
+        # arrays are kept as they are (like objhelper.load_mesh's read-only
+        # views), anything else is turned into float64
+        self.vertices = np.asarray(vertices).reshape(-1, 3)
+        if self.vertices.dtype.kind != "f":
+            self.vertices = self.vertices.astype(np.float64)
+        # faces as a flat array of vertex indices, face i being
+        # indices[offsets[i]:offsets[i + 1]]. faces can be given as an
+        # (n, corners) array, a list of index sequences, or already flat with
+        # offsets (objhelper's polygon_indices and polygon_offsets)
+        if offsets is not None:
+            self.indices = np.asarray(faces)
+            self.offsets = np.asarray(offsets)
+        elif isinstance(faces, np.ndarray) and faces.ndim == 2:
+            self.indices = faces.reshape(-1)
+            n, corners = faces.shape
+            self.offsets = np.arange(0, n * corners + 1, corners)
+        else:
+            sizes = [len(face) for face in faces]
+            self.indices = np.array([i for face in faces for i in face], np.int64)
+            self.offsets = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+        # per-face centers and normals (vec 0->1 x vec 0->2, like Face)
+        starts = self.offsets[:-1]
+        sizes = np.diff(self.offsets)
+        pts = self.vertices[self.indices]
+        if len(starts):
+            self.centers = np.add.reduceat(pts, starts, axis=0) / sizes[:, None]
+            self.normals = np.cross(
+                pts[starts + 1] - pts[starts], pts[starts + 2] - pts[starts]
+            )
+        else:
+            self.centers = np.zeros((0, 3))
+            self.normals = np.zeros((0, 3))
+        self.bounds = (self.vertices.min(axis=0), self.vertices.max(axis=0))
+        # per-face sun brightness (see _light), baked once for every instance
+        length = np.linalg.norm(self.normals, axis=1)
+        facing = self.normals @ np.array(LIGHT_DIR) / np.where(length == 0, 1, length)
+        self.shades = np.where(
+            length == 0, 1.0, AMBIENT + (1 - AMBIENT) * np.maximum(facing, 0)
+        )
+        self._colors = {}  # color -> shaded face colors
+        # simplified versions of the mesh (see objhelper.build_lods), lods[0]
+        # being the mesh itself
+        self.lods = [self] + [Mesh(v, f) for v, f in lods]
+        self._face_lists = None  # see faces
+        self._faces = None
+
+    def get_colors(self, color) -> list:
+        """get the color of every face lit by its shade, cached per color"""
+        colors = self._colors.get(color)
+        if colors is None:
+            colors = self._colors[color] = [
+                _shade_color(color, shade) for shade in self.shades.tolist()
+            ]
+        return colors
+
+    @property
+    def faces(self) -> list:
+        """the faces as tuples of vertex indices, made the first time they're
+        needed (when the mesh is first drawn) rather than on load"""
+        if self._face_lists is None:
+            indices = self.indices.tolist()
+            offsets = self.offsets.tolist()
+            self._face_lists = [
+                tuple(indices[a:b]) for a, b in zip(offsets, offsets[1:])
+            ]
+        return self._face_lists
+
+    @classmethod
+    def from_arrays(cls, arrays: dict):
+        """make a mesh from compiled mesh arrays (objhelper.load_mesh), using
+        the arrays as they are"""
+        lods = []
+        while f"lod{len(lods) + 1}_faces" in arrays:
+            i = len(lods) + 1
+            lods.append((arrays[f"lod{i}_vertices"], arrays[f"lod{i}_faces"]))
+        if "polygon_offsets" in arrays:  # merged coplanar faces
+            return cls(
+                arrays["vertices"],
+                arrays["polygon_indices"],
+                lods,
+                arrays["polygon_offsets"],
+            )
+        return cls(arrays["vertices"], arrays["faces"], lods)
+
+    @classmethod
+    def box(cls, start, end):
+        """make a box mesh from start to end, winding like Block"""
+        (x0, y0, z0), (x1, y1, z1) = start, end
+        return cls(
+            [
+                (x0, y0, z0),
+                (x1, y0, z0),
+                (x1, y1, z0),
+                (x0, y1, z0),
+                (x0, y0, z1),
+                (x1, y0, z1),
+                (x1, y1, z1),
+                (x0, y1, z1),
+            ],
+            [
+                (0, 3, 2, 1),
+                (4, 5, 6, 7),
+                (0, 1, 5, 4),
+                (2, 3, 7, 6),
+                (1, 2, 6, 5),
+                (0, 4, 7, 3),
+            ],
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """rough memory used by the mesh and its LODs"""
+        total = 0
+        for mesh in self.lods:
+            total += mesh.vertices.nbytes + mesh.centers.nbytes + mesh.normals.nbytes
+            total += mesh.shades.nbytes + mesh.indices.nbytes + mesh.offsets.nbytes
+            if mesh._face_lists is not None:
+                # a tuple per face plus a pointer per corner
+                total += sum(56 + 8 * len(face) for face in mesh._face_lists)
+        return total
+
+    def get_faces(self) -> list[Face]:
+        """get the faces in model space, built once and shared by all instances"""
+        if self._faces is None:
+            verts = [Coordinate(*v) for v in self.vertices.tolist()]
+            self._faces = [Face([verts[i] for i in face]) for face in self.faces]
+        return self._faces
+
 
 class BlockModel(GenericBlock):
-    """A generic model block"""
+    """A generic model block, an instance of a shared Mesh at pos"""
 
-    def __init__(self, pos: Coordinate, color, facemap, verts, transparent=False):
+    def __init__(
+        self, pos: Coordinate, color, facemap, verts, transparent=False, mesh=None
+    ):
         super().__init__(pos, color, transparent)
-        self.facemap = facemap
-        self.offsets = verts
-        self.verts = self._calc_verts()
-        self.faces = self._calc_faces()
+        if mesh is None:
+            mesh = Mesh([v.get() for v in verts], facemap)
+        elif not isinstance(mesh, Mesh):
+            mesh = Mesh.from_arrays(mesh)
+        self._mesh = mesh
+        self.assets = None  # AssetRegistry the mesh comes from, see from_asset
+        self.asset = None
+        # fit the hitbox to the model instead of a unit cube
+        lo, hi = mesh.bounds
+        self.hitbox = Hitbox(
+            self.pos, Coordinate(*lo.tolist()), Coordinate(*hi.tolist())
+        )
 
-    def _calc_verts(self):
-        """calculate vertices of block for caching"""
-        return [self.pos + offset for offset in self.offsets]
+    @classmethod
+    def from_mesh(cls, pos: Coordinate, color, mesh, transparent=False):
+        """place a Mesh (or compiled mesh arrays). pass the same Mesh to every
+        copy of a model so they share its geometry"""
+        return cls(pos, color, None, None, transparent=transparent, mesh=mesh)
+
+    @classmethod
+    def from_asset(
+        cls, pos: Coordinate, color, assets: "AssetRegistry", name, transparent=False
+    ):
+        """place a mesh from an AssetRegistry by name. it starts loading in the
+        background if it isn't already, and a box is drawn until it's ready"""
+        model = cls(
+            pos, color, None, None, transparent, mesh=assets.get_placeholder(name)
+        )
+        model.assets = assets
+        model.asset = name
+        assets.acquire(name, model)
+        return model
+
+    @property
+    def mesh(self) -> Mesh:
+        if self.asset is not None:
+            mesh = self.assets.get(self.asset)
+            if mesh is not None:
+                return mesh
+        return self._mesh
+
+    @property
+    def lod_count(self) -> int:
+        return len(self.mesh.lods)
+
+    def get_vertices(self) -> list[Coordinate]:
+        """world space vertices, built on every call. rendering and raycasts
+        use the shared mesh instead"""
+        return [Coordinate(*v) for v in (self.mesh.vertices + self.pos.get()).tolist()]
+
+    def get_faces(self):
+        """world space faces, built on every call like get_vertices"""
+        verts = self.get_vertices()
+        return [
+            Face([verts[i] for i in face], color=self.color) for face in self.mesh.faces
+        ]
 
     def get_center(self):
         return Coordinate(self.pos.x + 0.5, self.pos.y + 0.5, self.pos.z + 0.5)
 
 
+# the player's box, shared by every Player and drawn with "player-model" debug
+PLAYER_MESH = Mesh(
+    [
+        (0.3, 1.8, 0.3),
+        (0.3, 0.0, 0.3),
+        (0.3, 0.0, -0.3),
+        (0.3, 1.8, -0.3),
+        (-0.3, 0.0, -0.3),
+        (-0.3, 1.8, -0.3),
+        (-0.3, 0.0, 0.3),
+        (-0.3, 1.8, 0.3),
+    ],
+    [
+        (2, 1, 0),
+        (0, 3, 2),
+        (4, 2, 3),
+        (3, 5, 4),
+        (6, 4, 5),
+        (5, 7, 6),
+        (7, 6, 1),
+        (1, 0, 7),
+        (3, 0, 7),
+        (7, 5, 3),
+        (1, 2, 4),
+        (4, 6, 1),
+    ],
+)
+
+
+class AssetRegistry:
+    """Named model meshes, loaded on a background thread the first time a
+    BlockModel asks for them. loaded meshes no model uses any more are dropped,
+    least recently used first, once they take up more than budget bytes"""
+
+    def __init__(self, budget=256 * 2**20):
+        self.budget = budget
+        self.sources = {}  # name -> OBJ path, or a function returning a Mesh
+        self.bounds = {}  # name -> (start, end) the model is expected to fill
+        self.meshes = OrderedDict()  # name -> Mesh, least recently used first
+        self.sizes = {}  # name -> Mesh.nbytes
+        self.memory = 0
+        self.users = {}  # name -> WeakSet of the BlockModels using it
+        self.loading = set()
+        # name -> the OSError or ValueError loading it raised, drawn as a
+        # placeholder instead of retried
+        self.failed = {}
+        self.placeholders = {}
+        self._requests = queue.Queue()
+        self._done = queue.Queue()
+        self._thread = None
+
+    def register(self, name, source, bounds=((0, 0, 0), (1, 1, 1))):
+        """add a model. source is an OBJ file path (compiled through the mesh
+        cache) or a function returning a Mesh. bounds is the box the model
+        fills, used for its hitbox and placeholder before it's loaded"""
+        self.sources[name] = source
+        self.bounds[name] = bounds
+        self.placeholders.pop(name, None)
+        self.failed.pop(name, None)
+
+    def get_placeholder(self, name) -> Mesh:
+        """get the box drawn in place of a model that's still loading"""
+        if name not in self.placeholders:
+            self.placeholders[name] = Mesh.box(*self.bounds[name])
+        return self.placeholders[name]
+
+    def acquire(self, name, model):
+        """note that model uses name, so it isn't evicted while model exists"""
+        self.users.setdefault(name, weakref.WeakSet()).add(model)
+        self.get(name)
+
+    def get(self, name) -> Mesh | None:
+        """get a loaded mesh, or start loading it and return None"""
+        mesh = self.meshes.get(name)
+        if mesh is not None:
+            self.meshes.move_to_end(name)
+            return mesh
+        if name not in self.loading and name not in self.failed:
+            self.loading.add(name)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, daemon=True)
+                self._thread.start()
+            self._requests.put(name)
+        return None
+
+    def _work(self):
+        while True:
+            name = self._requests.get()
+            source = self.sources[name]
+            try:
+                if callable(source):
+                    mesh = source()
+                else:
+                    path = objhelper.compile_obj(source)
+                    mesh = Mesh.from_arrays(objhelper.load_mesh(path))
+                self._done.put((name, mesh, None))
+            except (OSError, ValueError) as e:  # a missing or broken file
+                self._done.put((name, None, e))
+            except Exception as e:  # a bug, poll raises it on the main thread
+                self._done.put((name, None, e))
+
+    def poll(self):
+        """take in meshes the loader has finished, call once a frame from the
+        main thread. assets that fail to load with an OSError or ValueError go
+        in failed, any other error is raised here"""
+        while True:
+            try:
+                name, mesh, error = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self.loading.discard(name)
+            if error is not None:
+                self.failed[name] = error
+                if not isinstance(error, (OSError, ValueError)):
+                    raise error
+                continue
+            self.meshes[name] = mesh
+            self.sizes[name] = mesh.nbytes
+            self.memory += mesh.nbytes
+        self.evict()
+
+    def wait(self, timeout=30.0):
+        """block until nothing is loading, for when what's drawn mustn't depend
+        on how long loading takes (like replays)"""
+        deadline = time.perf_counter() + timeout
+        while self.loading and time.perf_counter() < deadline:
+            time.sleep(0.005)
+            self.poll()
+
+    def evict(self):
+        """drop unused meshes, least recently used first, until under budget"""
+        for name in list(self.meshes):
+            if self.memory <= self.budget:
+                break
+            if self.users.get(name):
+                continue  # still placed somewhere
+            del self.meshes[name]
+            self.memory -= self.sizes.pop(name)
+
+
+class RaycastHit:
+    """The result of a World.raycast"""
+
+    def __init__(self, block: GenericBlock, point: Coordinate, normal, distance):
+        self.block = block
+        self.point = point  # where the ray hit
+        self.normal = normal  # unit normal of the face hit, facing the ray
+        self.distance = distance
+
+    def get_adjacent(self) -> Coordinate:
+        """get the grid cell next to the face that was hit, for placing blocks.
+        None if the ray started inside the block, as no face was hit"""
+        if not any(self.normal):
+            return None
+        ax = max(range(3), key=lambda i: abs(self.normal[i]))
+        offset = [0, 0, 0]
+        offset[ax] = 1 if self.normal[ax] > 0 else -1
+        return Coordinate(
+            math.floor(self.block.pos.x) + offset[0],
+            math.floor(self.block.pos.y) + offset[1],
+            math.floor(self.block.pos.z) + offset[2],
+        )
+
+    def __str__(self):
+        return (
+            f"RaycastHit on {self.block.pos} at {self.point}, dist {self.distance:.2f}"
+        )
+
+
+def _raycast_block(block: GenericBlock, origin: tuple, direction: tuple, t, normal):
+    """refine a ray entering a block's cell at t against the block's shape,
+    returns (t, normal) or None if the ray passes through the cell"""
+    if type(block) is Block:
+        return t, normal  # the cell is the block
+    if isinstance(block, BlockModel):
+        # test the shared mesh in model space instead of building world faces
+        faces = block.mesh.get_faces()
+        origin = (
+            origin[0] - block.pos.x,
+            origin[1] - block.pos.y,
+            origin[2] - block.pos.z,
+        )
+    else:
+        faces = block.get_faces()
+    best = None
+    for face in faces:
+        th = face.intersect_ray(origin, direction, best[0] if best else math.inf)
+        if th is not None:
+            best = (th, face.get_normal())
+    if best is None:
+        return None
+    th, n = best
+    length = math.sqrt(n[0] ** 2 + n[1] ** 2 + n[2] ** 2)
+    if n[0] * direction[0] + n[1] * direction[1] + n[2] * direction[2] > 0:
+        length = -length  # make it face the ray
+    return th, (n[0] / length, n[1] / length, n[2] / length)
+
+
+CHUNK_SIZE = 16
+# boxes of up to this many cells are faster to look up a cell at a time than
+# through numpy, see World.get_blocks_in_box
+SMALL_BOX_CELLS = 32
+# what World.get_chunk_kinds has in a cell
+CELL_EMPTY, CELL_FULL, CELL_PARTIAL = 0, 1, 2
+_KEY_BIAS = 1 << 20  # keeps chunk keys positive when World.is_solid packs them
+# chunk faces in the order used by visibility masks, opposite faces are i ^ 1
+CHUNK_FACES = ((-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1))
+_ALL_FACES = (1 << 6) - 1
+
+
+def _chunk_of(pos: tuple) -> tuple:
+    """get the key of the chunk a point is in"""
+    return (
+        math.floor(pos[0]) // CHUNK_SIZE,
+        math.floor(pos[1]) // CHUNK_SIZE,
+        math.floor(pos[2]) // CHUNK_SIZE,
+    )
+
+
+def _chunks_in_box(box: tuple):
+    """get the keys of every chunk a box touches"""
+    lo = _chunk_of(box[:3])
+    hi = _chunk_of(box[3:])
+    for cx in range(lo[0], hi[0] + 1):
+        for cy in range(lo[1], hi[1] + 1):
+            for cz in range(lo[2], hi[2] + 1):
+                yield (cx, cy, cz)
+
+
+def _inside_planes(boxes, planes):
+    """outside_planes for an (n, 6) array of boxes at once, returns a mask of
+    the boxes not fully outside any plane"""
+    inside = np.ones(len(boxes), dtype=bool)
+    for nx, ny, nz, d in planes:
+        px = boxes[:, 3] if nx > 0 else boxes[:, 0]
+        py = boxes[:, 4] if ny > 0 else boxes[:, 1]
+        pz = boxes[:, 5] if nz > 0 else boxes[:, 2]
+        inside &= nx * px + ny * py + nz * pz + d >= 0
+    return inside
+
+
+def _chunk_visibility(opaque: bytearray) -> tuple:
+    """flood fill the open cells of a chunk (opaque[(x * n + y) * n + z] set
+    for cells that can't be seen through) and return, for each face, a mask of
+    the faces it connects to through open space"""
+    n = CHUNK_SIZE
+    nn = n * n
+    if not any(opaque):
+        return (_ALL_FACES,) * 6
+    seen = bytearray(opaque)
+    vis = [0] * 6
+    for first in range(n * nn):
+        if seen[first]:
+            continue
+        seen[first] = 1
+        stack = [first]
+        faces = 0
+        while stack:
+            i = stack.pop()
+            x, rest = divmod(i, nn)
+            y, z = divmod(rest, n)
+            if x == 0:
+                faces |= 1
+            elif not seen[i - nn]:
+                seen[i - nn] = 1
+                stack.append(i - nn)
+            if x == n - 1:
+                faces |= 2
+            elif not seen[i + nn]:
+                seen[i + nn] = 1
+                stack.append(i + nn)
+            if y == 0:
+                faces |= 4
+            elif not seen[i - n]:
+                seen[i - n] = 1
+                stack.append(i - n)
+            if y == n - 1:
+                faces |= 8
+            elif not seen[i + n]:
+                seen[i + n] = 1
+                stack.append(i + n)
+            if z == 0:
+                faces |= 16
+            elif not seen[i - 1]:
+                seen[i - 1] = 1
+                stack.append(i - 1)
+            if z == n - 1:
+                faces |= 32
+            elif not seen[i + 1]:
+                seen[i + 1] = 1
+                stack.append(i + 1)
+        for f in range(6):
+            if faces >> f & 1:
+                vis[f] |= faces
+    return tuple(vis)
+
+
+def _greedy_rects(mask) -> list:
+    """cover the set cells of a 2d bool array with rectangles (u0, v0, u1, v1),
+    growing each along v then u as far as it goes"""
+    mask = mask.copy()
+    nu, nv = mask.shape
+    rects = []
+    for u, v in zip(*np.nonzero(mask)):
+        if not mask[u, v]:
+            continue  # already in a rectangle
+        v1 = v + 1
+        while v1 < nv and mask[u, v1]:
+            v1 += 1
+        u1 = u + 1
+        while u1 < nu and mask[u1, v:v1].all():
+            u1 += 1
+        mask[u:u1, v:v1] = False
+        rects.append((int(u), int(v), int(u1), int(v1)))
+    return rects
+
+
+def _chunk_occluders(key, opaque) -> list:
+    """merge the faces of opaque cells that face open cells (or the chunk's
+    edge) into rectangles, see World.get_chunk_occluders"""
+    n = CHUNK_SIZE
+    origin = [c * n for c in key]
+    occluders = []
+    for axis in range(3):
+        b, c = [i for i in range(3) if i != axis]
+        cells = np.moveaxis(opaque, axis, 0)  # [along axis, along b, along c]
+        for low in (True, False):
+            # cells whose neighbour on this side is open
+            exposed = cells.copy()
+            if low:
+                exposed[1:] &= ~cells[:-1]
+            else:
+                exposed[:-1] &= ~cells[1:]
+            for i in np.flatnonzero(exposed.any(axis=(1, 2))).tolist():
+                plane = origin[axis] + i + (0 if low else 1)
+                for u0, v0, u1, v1 in _greedy_rects(exposed[i]):
+                    corners = []
+                    for u, v in ((u0, v0), (u1, v0), (u1, v1), (u0, v1)):
+                        pt = [0, 0, 0]
+                        pt[axis] = plane
+                        pt[b] = origin[b] + u
+                        pt[c] = origin[c] + v
+                        corners.append(pt)
+                    occluders.append((corners, axis, low, plane))
+    return occluders
+
+
+_NOT_DATA = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.MethodType,
+    types.BuiltinFunctionType,
+)
+
+
+def memory_usage(root, owner="World") -> dict:
+    """count the objects reachable from root and their bytes, as a dict of
+    owner name -> [count, bytes]. objects of classes are counted under their
+    class name, plain containers, numbers and arrays under the object holding
+    them (a Face's vertex list is part of the Face, not of 'list'), and
+    anything reachable more than once is counted once"""
+    usage = {}
+    seen = set()
+    stack = [(root, owner)]
+    while stack:
+        obj, owner = stack.pop()
+        if id(obj) in seen or isinstance(obj, _NOT_DATA):
+            continue
+        seen.add(id(obj))
+        size = sys.getsizeof(obj)
+        children = ()
+        if isinstance(obj, dict):
+            children = [*obj.keys(), *obj.values()]
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            children = obj
+        elif hasattr(obj, "__dict__") or hasattr(type(obj), "__slots__"):
+            owner = type(obj).__name__
+            children = []
+            if hasattr(obj, "__dict__"):
+                size += sys.getsizeof(obj.__dict__)
+                children += obj.__dict__.values()
+            for name in getattr(type(obj), "__slots__", ()):
+                if hasattr(obj, name):
+                    children.append(getattr(obj, name))
+        entry = usage.setdefault(owner, [0, 0])
+        entry[0] += type(obj).__name__ == owner
+        entry[1] += size
+        stack.extend((child, owner) for child in children)
+    return usage
+
+
 class World:
     def __init__(self):
         self.blocks = {}
         self.entities = {}
+        self.bvh = BVH()  # every block and entity by hitbox, for off-grid queries
+        self.offgrid = set()  # blocks the grid lookups can't find
+        self.partial = set()  # on-grid blocks whose hitbox doesn't fill the cell
+        self.entity_hash = SpatialHash()  # broadphase for entity-entity checks
+        self.listeners = []  # called with the position tuple of every block change
+        self.entity_listeners = []  # called with (entity, added) as they come and go
+        self.chunks = {}  # chunk key -> {position tuple: block}
+        self._chunk_vis = {}  # chunk key -> face visibility masks, lazily built
+        self._chunk_occluders = {}  # chunk key -> occluder rectangles, likewise
+        self._chunk_occupancy = {}  # chunk key -> bool grid of on-grid blocks
+        self._chunk_kinds = {}  # chunk key -> CELL_* grid of on-grid blocks
+        # heightmap of on-grid blocks, kept up to date on every change
+        self.columns = {}  # (x, z) -> set of the ys holding a block
+        self.heights = {}  # (x, z) -> y of the top block
+
+    def add_listener(self, fn):
+        """call fn(pos) whenever a block is set or removed at pos"""
+        self.listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self.listeners:
+            self.listeners.remove(fn)
+
+    def add_entity_listener(self, fn):
+        """call fn(entity, added) whenever an entity is added or removed"""
+        self.entity_listeners.append(fn)
+
+    def remove_entity_listener(self, fn):
+        if fn in self.entity_listeners:
+            self.entity_listeners.remove(fn)
+
+    def _block_changed(self, tpos):
+        self._chunk_vis.pop(_chunk_of(tpos), None)
+        self._chunk_occluders.pop(_chunk_of(tpos), None)
+        self._chunk_occupancy.pop(_chunk_of(tpos), None)
+        self._chunk_kinds.pop(_chunk_of(tpos), None)
+        # the block and its neighbours need their lighting baked again
+        x, y, z = (math.floor(c) for c in tpos)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    block = self.blocks.get((x + dx, y + dy, z + dz))
+                    if block is not None:
+                        block.lit = False
+        for fn in self.listeners:
+            fn(tpos)
 
     def add_entity(self, entity):
         self.entities[entity.id] = entity
+        if entity.hitbox is not None:
+            box = entity.hitbox.bounds()
+            self.bvh.insert(entity, box)
+            self.entity_hash.insert(entity, box)
+        for fn in self.entity_listeners:
+            fn(entity, True)
 
     def remove_entity(self, entity):
         eid = entity.id
         if eid in self.entities:
             del self.entities[eid]
+        self.bvh.remove(entity)
+        self.entity_hash.remove(entity)
+        for fn in self.entity_listeners:
+            fn(entity, False)
+
+    def update_entity(self, entity):
+        """refresh an entity's place in the spatial index after it moves"""
+        if entity.id in self.entities and entity.hitbox is not None:
+            box = entity.hitbox.bounds()
+            self.bvh.update(entity, box)
+            self.entity_hash.update(entity, box)
 
     def set_block(self, block: GenericBlock):
-        self.blocks[block.pos.get()] = block
+        tpos = block.pos.get()
+        old = self.blocks.get(tpos)
+        old_on_grid = old is not None and old not in self.offgrid
+        if old is not None:
+            self.bvh.remove(old)
+            self.offgrid.discard(old)
+            self.partial.discard(old)
+        self.blocks[tpos] = block
+        self.chunks.setdefault(_chunk_of(tpos), {})[tpos] = block
+        self.bvh.insert(block, block.hitbox.bounds())
+        if block.on_grid():
+            if not block.fills_cell():
+                self.partial.add(block)
+            if not old_on_grid:
+                self._column_add(tpos)
+        else:
+            self.offgrid.add(block)
+            if old_on_grid:
+                self._column_remove(tpos)
+        self._block_changed(tpos)
 
     def add_block(self, block: GenericBlock):
         if block.pos.get() not in self.blocks:
@@ -376,11 +1155,530 @@ class World:
     def remove_block(self, pos: Coordinate):
         tpos = pos.get()
         if tpos in self.blocks:
-            del self.blocks[tpos]
+            block = self.blocks.pop(tpos)
+            key = _chunk_of(tpos)
+            del self.chunks[key][tpos]
+            if not self.chunks[key]:
+                del self.chunks[key]
+            self.bvh.remove(block)
+            if block in self.offgrid:
+                self.offgrid.discard(block)
+            else:
+                self.partial.discard(block)
+                self._column_remove(tpos)
+            self._block_changed(tpos)
 
     def get_block(self, pos: Coordinate) -> GenericBlock | None:
         return self.blocks.get(pos.get(), None)
 
+    def get_block_at(self, x, y, z) -> GenericBlock | None:
+        """get_block without making a Coordinate, for integer cells"""
+        return self.blocks.get((x, y, z))
+
+    def _column_add(self, tpos):
+        x, y, z = (math.floor(c) for c in tpos)
+        self.columns.setdefault((x, z), set()).add(y)
+        if y > self.heights.get((x, z), y - 1):
+            self.heights[(x, z)] = y
+
+    def _column_remove(self, tpos):
+        x, y, z = (math.floor(c) for c in tpos)
+        ys = self.columns[(x, z)]
+        ys.discard(y)
+        if not ys:
+            del self.columns[(x, z)]
+            del self.heights[(x, z)]
+        elif self.heights[(x, z)] == y:
+            self.heights[(x, z)] = max(ys)
+
+    def get_height(self, x, z) -> int | None:
+        """get the y of the top on-grid block in the column at x, z, or None if
+        the column is empty"""
+        return self.heights.get((math.floor(x), math.floor(z)))
+
+    def get_top_block(self, x, z) -> GenericBlock | None:
+        """get the top on-grid block in the column at x, z"""
+        x, z = math.floor(x), math.floor(z)
+        y = self.heights.get((x, z))
+        return None if y is None else self.blocks[(x, y, z)]
+
+    def get_top_color(self, x, z) -> tuple | None:
+        """get the color of the top on-grid block in the column at x, z"""
+        block = self.get_top_block(x, z)
+        return None if block is None else block.color
+
+    def get_ground(self, x, z) -> float | None:
+        """get the height something standing on top of the column at x, z
+        would be at (the top of the top block's hitbox), for spawning and
+        physics. off-grid blocks aren't in the heightmap"""
+        block = self.get_top_block(x, z)
+        return None if block is None else block.pos.y + block.hitbox.end.y
+
+    def get_chunk_visibility(self, key) -> tuple:
+        """get which faces of a chunk can see each other through it, as a
+        mask of connected faces per face (see CHUNK_FACES). only opaque full
+        blocks stop sight, and it's rebuilt after the chunk changes"""
+        vis = self._chunk_vis.get(key)
+        if vis is None:
+            opaque = self.get_chunk_opaque(key)
+            vis = self._chunk_vis[key] = _chunk_visibility(bytearray(opaque.tobytes()))
+        return vis
+
+    def get_chunk_opaque(self, key):
+        """get a (CHUNK_SIZE,) * 3 bool array of the chunk's cells that can't be
+        seen through, which are the ones holding opaque full blocks"""
+        n = CHUNK_SIZE
+        opaque = np.zeros((n, n, n), dtype=bool)
+        ox, oy, oz = (c * n for c in key)
+        for (x, y, z), block in self.chunks.get(key, {}).items():
+            if type(block) is Block and not block.transparent:
+                if block not in self.offgrid:
+                    opaque[int(x) - ox, int(y) - oy, int(z) - oz] = True
+        return opaque
+
+    def _is_opaque(self, cell) -> bool:
+        """whether an integer cell holds an opaque full block, like
+        get_chunk_opaque"""
+        block = self.blocks.get(cell)
+        return (
+            type(block) is Block and not block.transparent and block not in self.offgrid
+        )
+
+    def _face_occlusion(self, face: Face, normal) -> float:
+        """ambient occlusion of a face, 1 when nothing is next to it. each
+        corner counts the blocks beside and diagonal to it in front of the
+        face, like in most voxel games, and the face gets the average since
+        it's drawn in one color. only faces on a cell boundary are darkened"""
+        ax = max(range(3), key=lambda i: abs(normal[i]))
+        u, v = [i for i in range(3) if i != ax]
+        if normal[u] or normal[v]:
+            return 1.0  # not axis aligned
+        pts = [vert.get() for vert in face.get_vertices()]
+        plane = pts[0][ax]
+        if not float(plane).is_integer():
+            return 1.0
+        # the layer of cells the face looks into, and the cell right in front
+        layer = int(plane) if normal[ax] > 0 else int(plane) - 1
+        fu = math.floor(sum(p[u] for p in pts) / len(pts))
+        fv = math.floor(sum(p[v] for p in pts) / len(pts))
+
+        def solid(cu, cv):
+            cell = [0, 0, 0]
+            cell[ax], cell[u], cell[v] = layer, cu, cv
+            return self._is_opaque(tuple(cell))
+
+        light = 0
+        for p in pts:
+            pu, pv = p[u], p[v]
+            if pu not in (fu, fu + 1) or pv not in (fv, fv + 1):
+                light += 3  # not on the front cell's corner
+                continue
+            # the neighbouring cells across the corner's edges
+            ou = fu - 1 if pu == fu else fu + 1
+            ov = fv - 1 if pv == fv else fv + 1
+            side1, side2 = solid(ou, fv), solid(fu, ov)
+            if side1 and side2:
+                continue  # fully enclosed, whatever the diagonal is
+            light += 3 - side1 - side2 - solid(ou, ov)
+        return 1 - AO_STRENGTH * (1 - light / (3 * len(pts)))
+
+    def bake_lighting(self, block: GenericBlock):
+        """bake sun light and ambient occlusion into the colors of a block's
+        cached faces. it's kept until the block or a neighbour changes"""
+        for face in block.get_faces():
+            if face is None:
+                continue
+            normal = face.get_normal()
+            factor = _light(normal) * self._face_occlusion(face, normal)
+            face.color = _shade_color(block.color, factor)
+        block.lit = True
+
+    def memory_report(self) -> str:
+        """a table of what the world's memory goes to, see memory_usage"""
+        usage = memory_usage(self)
+        total = sum(size for _, size in usage.values())
+        lines = [f"World memory: {total / 2**20:.2f} MiB, {len(self.blocks)} blocks"]
+        for owner, (count, size) in sorted(usage.items(), key=lambda kv: -kv[1][1]):
+            lines.append(f"  {owner:<20} {count:>9} {size / 2**20:>9.2f} MiB")
+        return "\n".join(lines)
+
+    def save(self, path):
+        """write the world's blocks to a JSON file, see load. models keep their
+        asset name, or their mesh if they don't come from an AssetRegistry or
+        their asset is made by a function, which can't be saved"""
+        blocks = []
+        meshes = []  # saved once however many models share them
+        mesh_ids = {}
+        assets = {}
+        for block in self.blocks.values():
+            data = {
+                "type": type(block).__name__,
+                "pos": list(block.pos.get()),
+                "color": list(block.color),
+                "transparent": block.transparent,
+            }
+            if isinstance(block, BlockModel):
+                source = None
+                if block.asset is not None:
+                    source = block.assets.sources[block.asset]
+                if source is not None and not callable(source):
+                    data["asset"] = block.asset
+                    assets[block.asset] = {
+                        "source": source,
+                        "bounds": block.assets.bounds[block.asset],
+                    }
+                else:
+                    mesh = block.mesh
+                    if source is not None and block.asset not in block.assets.meshes:
+                        mesh = source()  # not loaded yet, the placeholder won't do
+                    if id(mesh) not in mesh_ids:
+                        mesh_ids[id(mesh)] = len(meshes)
+                        meshes.append(
+                            {
+                                "vertices": mesh.vertices.tolist(),
+                                "faces": [list(face) for face in mesh.faces],
+                            }
+                        )
+                    data["mesh"] = mesh_ids[id(mesh)]
+            else:
+                data.update(block.get_state())
+            blocks.append(data)
+        with open(path, "w") as f:
+            json.dump({"blocks": blocks, "meshes": meshes, "assets": assets}, f)
+
+    @classmethod
+    def load(cls, path, assets: "AssetRegistry" = None) -> "World":
+        """read a world written by save. assets is where models from an
+        AssetRegistry get their meshes, and their sources are registered in it"""
+        with open(path) as f:
+            data = json.load(f)
+        if assets is None:
+            assets = AssetRegistry()
+        for name, asset in data.get("assets", {}).items():
+            if name not in assets.sources:
+                assets.register(name, asset["source"], asset["bounds"])
+        meshes = [Mesh(m["vertices"], m["faces"]) for m in data.get("meshes", [])]
+        kinds = (Block, BlockSlab, BlockStairs, BlockVerticalSlab)
+        kinds = {kind.__name__: kind for kind in kinds}
+        world = cls()
+        for b in data["blocks"]:
+            pos = Coordinate(*b.pop("pos"))
+            color = tuple(b.pop("color"))
+            kind = b.pop("type")
+            if kind == BlockModel.__name__:
+                if "asset" in b:
+                    if b["asset"] not in assets.sources:
+                        raise ValueError(
+                            f"{path} uses asset {b['asset']!r}, which isn't "
+                            "registered in the AssetRegistry it's loaded into"
+                        )
+                    block = BlockModel.from_asset(
+                        pos, color, assets, b["asset"], b["transparent"]
+                    )
+                else:
+                    block = BlockModel.from_mesh(
+                        pos, color, meshes[b["mesh"]], b["transparent"]
+                    )
+            else:
+                block = kinds[kind](pos, color, **b)
+            world.set_block(block)
+        return world
+
+    def get_chunk_occluders(self, key) -> list:
+        """get the outside faces of a chunk's opaque blocks, merged into as few
+        rectangles as it can, for Screen.cull_occluded. each one is (corners,
+        axis, low side, plane), and it's rebuilt after the chunk changes"""
+        occluders = self._chunk_occluders.get(key)
+        if occluders is None:
+            occluders = self._chunk_occluders[key] = _chunk_occluders(
+                key, self.get_chunk_opaque(key)
+            )
+        return occluders
+
+    def get_chunk_occupancy(self, key) -> np.ndarray:
+        """get a read-only (CHUNK_SIZE,) * 3 bool array of the chunk's cells
+        holding an on-grid block, kept until the chunk changes"""
+        occupancy = self._chunk_occupancy.get(key)
+        if occupancy is None:
+            n = CHUNK_SIZE
+            occupancy = np.zeros((n, n, n), dtype=bool)
+            ox, oy, oz = (c * n for c in key)
+            for (x, y, z), block in self.chunks.get(key, {}).items():
+                if block not in self.offgrid:
+                    occupancy[int(x) - ox, int(y) - oy, int(z) - oz] = True
+            occupancy.flags.writeable = False
+            self._chunk_occupancy[key] = occupancy
+        return occupancy
+
+    def get_chunk_kinds(self, key) -> np.ndarray:
+        """like get_chunk_occupancy, but a uint8 CELL_EMPTY, CELL_FULL or
+        CELL_PARTIAL (see World.partial) per cell"""
+        kinds = self._chunk_kinds.get(key)
+        if kinds is None:
+            n = CHUNK_SIZE
+            kinds = np.zeros((n, n, n), dtype=np.uint8)
+            ox, oy, oz = (c * n for c in key)
+            for (x, y, z), block in self.chunks.get(key, {}).items():
+                if block not in self.offgrid:
+                    kind = CELL_PARTIAL if block in self.partial else CELL_FULL
+                    kinds[int(x) - ox, int(y) - oy, int(z) - oz] = kind
+            kinds.flags.writeable = False
+            self._chunk_kinds[key] = kinds
+        return kinds
+
+    def get_solid_mask(self, lo, hi) -> np.ndarray:
+        """get a bool array of which integer cells lo <= cell < hi hold an
+        on-grid block, where mask[i, j, k] is the cell at lo + (i, j, k).
+        it's copied out of the chunk occupancy grids a chunk at a time"""
+        lo = tuple(math.floor(c) for c in lo)
+        hi = tuple(math.floor(c) for c in hi)
+        mask = np.zeros([max(hi[i] - lo[i], 0) for i in range(3)], dtype=bool)
+        if mask.size == 0:
+            return mask
+        n = CHUNK_SIZE
+        for key in _chunks_in_box(lo + tuple(c - 1 for c in hi)):
+            if key not in self.chunks:
+                continue
+            origin = [c * n for c in key]
+            start = [max(lo[i], origin[i]) for i in range(3)]
+            end = [min(hi[i], origin[i] + n) for i in range(3)]
+            dst = tuple(slice(start[i] - lo[i], end[i] - lo[i]) for i in range(3))
+            src = tuple(
+                slice(start[i] - origin[i], end[i] - origin[i]) for i in range(3)
+            )
+            mask[dst] = self.get_chunk_occupancy(key)[src]
+        return mask
+
+    def get_blocks_in_box(self, lo, hi) -> dict:
+        """get {cell: block} for the on-grid blocks in integer cells
+        lo <= cell < hi. small boxes are looked up cell by cell, bigger ones
+        go through get_solid_mask so empty space costs nothing"""
+        lo = tuple(math.floor(c) for c in lo)
+        hi = tuple(math.floor(c) for c in hi)
+        blocks, offgrid = self.blocks, self.offgrid
+        out = {}
+        volume = 1
+        for i in range(3):
+            volume *= max(hi[i] - lo[i], 0)
+        if volume <= SMALL_BOX_CELLS:
+            for x in range(lo[0], hi[0]):
+                for y in range(lo[1], hi[1]):
+                    for z in range(lo[2], hi[2]):
+                        block = blocks.get((x, y, z))
+                        if block is not None and block not in offgrid:
+                            out[(x, y, z)] = block
+            return out
+        cells = (np.argwhere(self.get_solid_mask(lo, hi)) + lo).tolist()
+        return {cell: blocks[cell] for cell in map(tuple, cells)}
+
+    def _read_cells(self, cells, grid_of, dtype=bool):
+        """look integer cells, an (n, 3) array, up in per-chunk grids from
+        grid_of(key). the cells are grouped by chunk, so nothing the size of
+        the whole world is built"""
+        cells = np.asarray(cells, dtype=np.int64)
+        flat = cells.reshape(-1, 3)
+        n = CHUNK_SIZE
+        keys = flat // n
+        local = flat - keys * n
+        local = (local[:, 0] * n + local[:, 1]) * n + local[:, 2]
+        # pack each chunk key into one int so they can be grouped quickly
+        packed = ((keys[:, 0] + _KEY_BIAS) << 42) | ((keys[:, 1] + _KEY_BIAS) << 21)
+        packed |= keys[:, 2] + _KEY_BIAS
+        _, first, inverse = np.unique(packed, return_index=True, return_inverse=True)
+        empty = np.zeros(n**3, dtype=dtype)
+        grids = [
+            grid_of(key).ravel() if key in self.chunks else empty
+            for key in map(tuple, keys[first].tolist())
+        ]
+        out = np.stack(grids)[inverse.ravel(), local] if grids else empty[:0]
+        return out.reshape(cells.shape[:-1])
+
+    def is_solid(self, cells):
+        """vectorized check of which integer cells, an (n, 3) array, hold an
+        on-grid block"""
+        return self._read_cells(cells, self.get_chunk_occupancy)
+
+    def get_cell_kinds(self, cells):
+        """vectorized get_chunk_kinds lookup of integer cells, an (n, 3) array"""
+        return self._read_cells(cells, self.get_chunk_kinds, np.uint8)
+
+    def query_box(self, start: Coordinate, end: Coordinate) -> list:
+        """get all blocks and entities whose hitbox overlaps the box start->end"""
+        return self.bvh.query_box((start.x, start.y, start.z, end.x, end.y, end.z))
+
+    def query_sphere(self, center: Coordinate, radius) -> list:
+        """get all blocks and entities whose hitbox overlaps the sphere"""
+        return self.bvh.query_sphere(center.get(), radius)
+
+    def query_ray(self, origin: Coordinate, direction: Coordinate, max_dist) -> list:
+        """get all (distance, block/entity) hit by a ray, nearest first"""
+        length = math.sqrt(direction.x**2 + direction.y**2 + direction.z**2)
+        if length == 0:
+            return []
+        return self.bvh.raycast(origin.get(), (direction / length).get(), max_dist)
+
+    def get_entities_near(self, center: Coordinate, radius) -> list:
+        """get the entities whose hitbox is within radius of center"""
+        return self.entity_hash.query_sphere(center.get(), radius)
+
+    def get_entities_in_box(self, start: Coordinate, end: Coordinate) -> list:
+        """get the entities whose hitbox overlaps the box start->end"""
+        return self.entity_hash.query_box(
+            (start.x, start.y, start.z, end.x, end.y, end.z)
+        )
+
+    def get_entity_collisions(self) -> list:
+        """get every pair of entities whose hitboxes overlap"""
+        return self.entity_hash.pairs()
+
+    def get_collision_boxes(self, box) -> list:
+        """get the hitbox bounds of every block overlapping box, from the grid
+        cells the box covers plus any off-grid blocks"""
+        lo = (math.floor(box[0]), math.floor(box[1]), math.floor(box[2]))
+        hi = (math.ceil(box[3]), math.ceil(box[4]), math.ceil(box[5]))
+        out = [
+            block.hitbox.bounds() for block in self.get_blocks_in_box(lo, hi).values()
+        ]
+        if self.offgrid:
+            out += [
+                self.bvh.get_box(obj)
+                for obj in self.bvh.query_box(tuple(box))
+                if obj in self.offgrid
+            ]
+        return out
+
+    def _raycast_offgrid(self, origin: tuple, direction: tuple, max_dist):
+        """nearest (t, normal, block) among off-grid blocks, via the bvh"""
+        best = None
+        for tb, obj in self.bvh.raycast(origin, direction, max_dist):
+            if best is not None and tb > best[0]:
+                break  # every box left starts past the best hit
+            if obj not in self.offgrid:
+                continue
+            hit = _raycast_block(obj, origin, direction, tb, (0, 0, 0))
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = (hit[0], hit[1], obj)
+        return best
+
+    def raycast(self, origin: Coordinate, direction: Coordinate, max_dist=8):
+        """get the first block a ray hits as a RaycastHit, or None.
+        walks only the grid cells the ray crosses (Amanatides & Woo), and
+        refines partial blocks like slabs and stairs against their faces"""
+        length = math.sqrt(direction.x**2 + direction.y**2 + direction.z**2)
+        if length == 0:
+            return None
+        o = origin.get()
+        d = (direction.x / length, direction.y / length, direction.z / length)
+
+        best = None
+        if self.offgrid:
+            best = self._raycast_offgrid(o, d, max_dist)
+            if best is not None:
+                max_dist = best[0]
+
+        x, y, z = math.floor(o[0]), math.floor(o[1]), math.floor(o[2])
+        step = [0, 0, 0]
+        t_max = [math.inf, math.inf, math.inf]  # t at the next boundary per axis
+        t_delta = [math.inf, math.inf, math.inf]  # t between boundaries per axis
+        for i, cell in enumerate((x, y, z)):
+            if d[i] > 0:
+                step[i] = 1
+                t_max[i] = (cell + 1 - o[i]) / d[i]
+                t_delta[i] = 1 / d[i]
+            elif d[i] < 0:
+                step[i] = -1
+                t_max[i] = (cell - o[i]) / d[i]
+                t_delta[i] = -1 / d[i]
+
+        t = 0.0
+        normal = (0, 0, 0)  # starting inside a block has no entry face
+        while t <= max_dist:
+            block = self.blocks.get((x, y, z))
+            if block is not None and block not in self.offgrid:
+                hit = _raycast_block(block, o, d, t, normal)
+                if hit is not None and hit[0] <= max_dist:
+                    best = (hit[0], hit[1], block)
+                    break
+            if t_max[0] < t_max[1] and t_max[0] < t_max[2]:
+                x += step[0]
+                t = t_max[0]
+                t_max[0] += t_delta[0]
+                normal = (-step[0], 0, 0)
+            elif t_max[1] < t_max[2]:
+                y += step[1]
+                t = t_max[1]
+                t_max[1] += t_delta[1]
+                normal = (0, -step[1], 0)
+            else:
+                z += step[2]
+                t = t_max[2]
+                t_max[2] += t_delta[2]
+                normal = (0, 0, -step[2])
+
+        if best is None:
+            return None
+        t, normal, block = best
+        point = Coordinate(o[0] + d[0] * t, o[1] + d[1] * t, o[2] + d[2] * t)
+        return RaycastHit(block, point, normal, t)
+
+    def raycast_many(self, origins, directions, max_dist=8):
+        """batched World.raycast for lots of rays at once (entity vision etc.).
+        origins and directions are (n, 3) arrays, all rays step through the
+        grid together. returns (dist, normals, blocks), where dist is inf and
+        blocks[i] is None for rays that hit nothing"""
+        o = np.asarray(origins, dtype=float).reshape(-1, 3)
+        d = np.asarray(directions, dtype=float).reshape(-1, 3)
+        n = len(o)
+        limit = np.broadcast_to(np.asarray(max_dist, dtype=float), (n,)).copy()
+        length = np.linalg.norm(d, axis=1)
+        valid = length > 0
+        d = d / np.where(valid, length, 1)[:, None]
+
+        dist = np.full(n, np.inf)
+        normals = np.zeros((n, 3))
+        blocks = [None] * n
+
+        if self.offgrid:
+            for i in np.nonzero(valid)[0].tolist():
+                best = self._raycast_offgrid(tuple(o[i]), tuple(d[i]), limit[i])
+                if best is not None:
+                    dist[i], normals[i], blocks[i] = best
+                    limit[i] = best[0]
+
+        cell = np.floor(o).astype(np.int64)
+        step = np.sign(d).astype(np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv = np.where(d != 0, 1 / d, np.inf)
+            t_max = np.where(d != 0, (cell + (step > 0) - o) * inv, np.inf)
+        t_delta = np.abs(inv)
+        t = np.zeros(n)
+        entry = np.zeros((n, 3))  # normal of the face each ray entered by
+        active = valid.copy()
+
+        while active.any():
+            # look up the current cell of every active ray
+            idx = np.nonzero(active)[0]
+            for i, key in zip(idx.tolist(), map(tuple, cell[idx].tolist())):
+                block = self.blocks.get(key)
+                if block is None or block in self.offgrid:
+                    continue
+                hit = _raycast_block(block, tuple(o[i]), tuple(d[i]), t[i], entry[i])
+                if hit is not None and hit[0] <= limit[i]:
+                    dist[i], normals[i], blocks[i] = hit[0], hit[1], block
+                    active[i] = False
+
+            # step every ray still going across its nearest boundary
+            idx = np.nonzero(active)[0]
+            axis = np.argmin(t_max[idx], axis=1)
+            t[idx] = t_max[idx, axis]
+            cell[idx, axis] += step[idx, axis]
+            t_max[idx, axis] += t_delta[idx, axis]
+            entry[idx] = 0
+            entry[idx, axis] = -step[idx, axis]
+            active[idx] = t[idx] <= limit[idx]
+
+        return dist, normals, blocks
+
 
 class Hitbox:
     def __init__(self, pos: Coordinate, start: Coordinate, end: Coordinate):
@@ -401,6 +1699,11 @@ class Hitbox:
     def get_end(self):
         return self.pos + self.end
 
+    def bounds(self) -> tuple:
+        """get the world-space box as (x0, y0, z0, x1, y1, z1)"""
+        p, s, e = self.pos, self.start, self.end
+        return (p.x + s.x, p.y + s.y, p.z + s.z, p.x + e.x, p.y + e.y, p.z + e.z)
+
     def __str__(self):
         return f"Hitbox at {self.pos} with start {self.pos + self.start} and end {self.pos + self.end}"
 
@@ -435,6 +1738,30 @@ class Hitbox:
         )
 
 
+COLLISION_EPSILON = 1e-7
+
+
+def _sweep_axis(box, axis, d, obstacles) -> float:
+    """clip a move of d along one axis so box stops at the first obstacle.
+    obstacles the box is already inside of are ignored so it can get out"""
+    a, b = [i for i in range(3) if i != axis]
+    lo, hi = box[axis], box[axis + 3]
+    for ob in obstacles:
+        # only obstacles lined up with the box on the other two axes matter
+        if not (
+            box[a] < ob[a + 3] - COLLISION_EPSILON
+            and ob[a] < box[a + 3] - COLLISION_EPSILON
+            and box[b] < ob[b + 3] - COLLISION_EPSILON
+            and ob[b] < box[b + 3] - COLLISION_EPSILON
+        ):
+            continue
+        if d > 0 and ob[axis] >= hi - COLLISION_EPSILON:
+            d = min(d, ob[axis] - hi)
+        elif d < 0 and ob[axis + 3] <= lo + COLLISION_EPSILON:
+            d = max(d, ob[axis + 3] - lo)
+    return d
+
+
 class Entity:
     def __init__(self, pos: Coordinate, world: World):
         self.pos = pos
@@ -443,75 +1770,79 @@ class Entity:
         self.yaw = 0  # left/right
         self.pitch = 0  # up/down
         self.cam_offset = None
+        self.cam = None
         self.hitbox = None
-        self.surrounding = None
+        self.fall_speed = 0.9  # blocks/s, same as the player's 0.03 per frame
+        self.mesh = None  # shared Mesh to draw the entity with, if any
 
     def initcam(self):
         self.cam = Camera(self.pos.copy() + self.cam_offset, self.yaw, self.pitch)
 
     def movecam(self, dx=0, dy=0, dz=0, dyaw=0, dpitch=0):
         """overloadable for custom camera movement"""
+        if self.cam is None:
+            return
         self.cam.move(dx, dy, dz)
         self.cam.rotate(dyaw, dpitch)
 
     def tpcam(self, pos: Coordinate):
         """overloadable for custom camera teleportation"""
+        if self.cam is None:
+            return
         self.cam.teleport(pos)
 
     def _xmove(self, dx):
         """move the entity by dx"""
         self.pos.x += dx
         self.movecam(dx=dx)
+        self.world.update_entity(self)
 
     def _ymove(self, dy):
         """move the entity by dy"""
         self.pos.y += dy
         self.movecam(dy=dy)
+        self.world.update_entity(self)
 
     def _zmove(self, dz):
         """move the entity by dz"""
         self.pos.z += dz
         self.movecam(dz=dz)
+        self.world.update_entity(self)
 
     def move(self, dx, dy, dz):
-        collided = False
-        snap_pos = Coordinate(
-            math.floor(self.pos.x + dx),
-            math.floor(self.pos.y + dy),
-            math.floor(self.pos.z + dz),
-        )
-        next_hitbox = self.hitbox.new(self.pos + Coordinate(dx, dy, dz))
-        for pos in self.surrounding:  # check for collision
-            blk = world.get_block(snap_pos + pos)
-            if blk is not None and blk.hitbox.collides(next_hitbox):
-                collided = True
-                break
-
-        if collided:  # check directional collision
-            next_hitbox_x = self.hitbox.new(self.pos + Coordinate(dx, 0, 0))
-            next_hitbox_y = self.hitbox.new(self.pos + Coordinate(0, dy, 0))
-            next_hitbox_z = self.hitbox.new(self.pos + Coordinate(0, 0, dz))
-            for pos in self.surrounding:
-                blk = world.get_block(snap_pos + pos)
-                if blk is not None and blk.hitbox.collides(
-                    next_hitbox_x
-                ):  # collides in X
-                    print("Collided in X")
-                    dx = 0
-                if blk is not None and blk.hitbox.collides(
-                    next_hitbox_y
-                ):  # collides in Y
-                    print("Collided in Y")
-                    dy = 0
-                if blk is not None and blk.hitbox.collides(
-                    next_hitbox_z
-                ):  # collides in Z
-                    print("Collided in Z")
-                    dz = 0
-
-        self._xmove(dx)
-        self._ymove(dy)
-        self._zmove(dz)
+        """move with swept collision, one axis at a time so the entity slides
+        along walls instead of stopping dead. returns the distance moved"""
+        box = self.hitbox.bounds()
+        moved = [0, 0, 0]
+        # everything the box could touch on the way, fetched once for all
+        # three axes
+        swept = list(box)
+        for axis, d in enumerate((dx, dy, dz)):
+            if d > 0:
+                swept[axis + 3] += d
+            else:
+                swept[axis] += d
+        obstacles = self.world.get_collision_boxes(swept)
+        for axis, d in enumerate((dx, dy, dz)):
+            if d == 0:
+                continue
+            d = _sweep_axis(box, axis, d, obstacles)
+            if d == 0:
+                continue
+            moved[axis] = d
+            box = list(box)
+            box[axis] += d
+            box[axis + 3] += d
+            (self._xmove, self._ymove, self._zmove)[axis](d)
+        return tuple(moved)
+
+    def update(self, dt) -> bool:
+        """overloadable per-tick behaviour, dt is the time in seconds since
+        this entity was last updated. return True if the entity is at rest
+        and can be put to sleep until something nearby changes"""
+        if self.hitbox is None:  # nothing to fall with
+            return True
+        return self.move(0, -self.fall_speed * dt, 0) == (0, 0, 0)
 
     def walk(self, f, r):
         self.move(
@@ -527,7 +1858,11 @@ class Entity:
 
     def teleport(self, pos: Coordinate):
         self.pos = pos.copy()
-        self.tpcam(pos + self.cam_offset)
+        if self.hitbox is not None:
+            self.hitbox.pos = self.pos  # keep the hitbox tied to the new pos
+        if self.cam is not None:
+            self.tpcam(pos + self.cam_offset)
+        self.world.update_entity(self)
 
     def get_pos(self):
         return self.pos
@@ -541,29 +1876,8 @@ class Player(Entity):
         self.hitbox = Hitbox(
             self.pos, Coordinate(-0.3, 0, -0.3), Coordinate(0.3, 1.8, 0.3)
         )  # hitbox tied to self.pos
-        self.surrounding = [
-            Coordinate(0, -1, 0),
-            Coordinate(0, 0, 0),
-            Coordinate(-1, 0, 0),
-            Coordinate(-1, 0, -1),
-            Coordinate(0, 0, -1),
-            Coordinate(1, 0, -1),
-            Coordinate(1, 0, 0),
-            Coordinate(1, 0, 1),
-            Coordinate(0, 0, 1),
-            Coordinate(-1, 0, 1),
-            Coordinate(0, 1, 0),
-            Coordinate(-1, 1, 0),
-            Coordinate(-1, 1, -1),
-            Coordinate(0, 1, -1),
-            Coordinate(1, 1, -1),
-            Coordinate(1, 1, 0),
-            Coordinate(1, 1, 1),
-            Coordinate(0, 1, 1),
-            Coordinate(-1, 1, 1),
-            Coordinate(0, 2, 0),
-        ]
         # end init
+        self.mesh = PLAYER_MESH
         self.cam3dist = 2
         self.cam3 = Camera(
             self.pos.copy() + self.cam_offset + Coordinate(0, 0, -self.cam3dist),
@@ -588,6 +1902,316 @@ class Player(Entity):
         self.cam.teleport(pos + self.cam_offset)
         self.cam3.teleport(pos + self.cam_offset + Coordinate(0, 0, -self.cam3dist))
 
+    def get_target(self, reach=5) -> "RaycastHit | None":
+        """get the block the player is looking at"""
+        return self.world.raycast(self.cam.pos, self.cam.get_forward(), reach)
+
+
+class EntityBatch:
+    """Struct-of-arrays storage for lots of simple (non-player) entities.
+
+    Positions, velocities, hitbox extents and flags live in NumPy arrays so
+    gravity, integration and voxel collision run as a few vectorized steps
+    per tick instead of Python method calls per entity. Scripted entities
+    should keep using Entity/Player. Collision is against on-grid blocks
+    only (World.get_cell_kinds), full ones as whole cells and partial ones
+    against their hitbox like Entity.move does; off-grid models are ignored
+    here.
+    """
+
+    GRAVITY = 20.0  # blocks/s^2
+    TERMINAL_VELOCITY = 40.0  # blocks/s
+
+    def __init__(self, world: World, capacity=64):
+        self.world = world
+        self.count = 0  # slots in use, dead slots are reused via free
+        self.free = []
+        self.pos = np.zeros((capacity, 3))
+        self.vel = np.zeros((capacity, 3))
+        self.start = np.zeros((capacity, 3))  # hitbox start offset from pos
+        self.end = np.zeros((capacity, 3))  # hitbox end offset from pos
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.on_ground = np.zeros(capacity, dtype=bool)
+        self.gravity = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def _grow(self):
+        cap = len(self.alive) * 2
+        for name in ("pos", "vel", "start", "end", "alive", "on_ground", "gravity"):
+            old = getattr(self, name)
+            new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def spawn(
+        self,
+        pos: Coordinate,
+        start: Coordinate = None,
+        end: Coordinate = None,
+        vel: Coordinate = None,
+        gravity=True,
+    ) -> int:
+        """add an entity and return its index. the hitbox runs from pos +
+        start to pos + end, a player sized one if they aren't given"""
+        if self.free:
+            i = self.free.pop()
+        else:
+            if self.count == len(self.alive):
+                self._grow()
+            i = self.count
+            self.count += 1
+        self.pos[i] = pos.get()
+        self.vel[i] = (0, 0, 0) if vel is None else vel.get()
+        self.start[i] = (-0.3, 0, -0.3) if start is None else start.get()
+        self.end[i] = (0.3, 1.8, 0.3) if end is None else end.get()
+        self.alive[i] = True
+        self.on_ground[i] = False
+        self.gravity[i] = gravity
+        return i
+
+    def kill(self, i):
+        """remove an entity, its index may be reused by a later spawn"""
+        if self.alive[i]:
+            self.alive[i] = False
+            self.vel[i] = 0
+            self.free.append(i)
+
+    def get_pos(self, i) -> Coordinate:
+        return Coordinate(*self.pos[i].tolist())
+
+    def set_velocity(self, i, vel: Coordinate):
+        self.vel[i] = vel.get()
+
+    def step(self, dt):
+        """advance every entity by dt seconds"""
+        n = self.count
+        alive = self.alive[:n]
+        vel = self.vel[:n]
+
+        # gravity
+        falling = alive & self.gravity[:n]
+        vel[falling, 1] = np.maximum(
+            vel[falling, 1] - self.GRAVITY * dt, -self.TERMINAL_VELOCITY
+        )
+
+        # integrate and collide one axis at a time, y first so things land
+        self.on_ground[:n] = False
+        for axis in (1, 0, 2):
+            d = vel[:, axis] * dt
+            moving = alive & (d != 0)
+            if not moving.any():
+                continue
+            idx = np.nonzero(moving)[0]
+            clipped, blocked = self._sweep(idx, axis, d[idx])
+            self.pos[idx, axis] += clipped
+            vel[idx[blocked], axis] = 0
+            if axis == 1:
+                self.on_ground[idx[blocked & (d[idx] < 0)]] = True
+
+    def _sweep(self, idx, axis, d):
+        """clip moves d along axis against solid cells for entities idx,
+        returns (clipped d, whether each was blocked)"""
+        eps = COLLISION_EPSILON
+        a, b = [i for i in range(3) if i != axis]
+        lo = self.pos[idx] + self.start[idx]
+        hi = self.pos[idx] + self.end[idx]
+        pos_dir = d > 0
+
+        # layers of cells along the axis the move passes into, nearest first
+        lead = np.where(pos_dir, hi[:, axis], lo[:, axis])
+        first = np.where(pos_dir, np.ceil(lead - eps), np.floor(lead + eps) - 1)
+        last = np.where(pos_dir, np.ceil(lead + d) - 1, np.floor(lead + d))
+        layers = (np.abs(last - first) + 1).astype(np.int64)
+        layers[(pos_dir & (last < first)) | (~pos_dir & (last > first))] = 0
+        step = np.where(pos_dir, 1, -1)
+
+        # cross section of cells the box covers on the other two axes
+        a0 = np.floor(lo[:, a] + eps).astype(np.int64)
+        b0 = np.floor(lo[:, b] + eps).astype(np.int64)
+        na = np.ceil(hi[:, a] - eps).astype(np.int64) - a0
+        nb = np.ceil(hi[:, b] - eps).astype(np.int64) - b0
+        # every (ia, ib) offset into a cross section
+        ia, ib = np.divmod(np.arange(int(na.max()) * int(nb.max())), int(nb.max()))
+        covers = (ia[:, None] < na) & (ib[:, None] < nb)
+
+        world = self.world
+        # a partial block can be in the layer the box's lead is already in,
+        # so with any around that layer is looked at too
+        partial = bool(world.partial)
+        blocked = np.zeros(len(idx), dtype=bool)
+        for k in range(-1 if partial else 0, int(layers.max(initial=0))):
+            in_layer = ~blocked & (k < layers)
+            if k < 0:  # a lead on a cell boundary has nothing of its own layer ahead
+                in_layer &= np.abs(lead - np.round(lead)) > eps
+            if not in_layer.any():
+                continue
+            layer = (first + k * step).astype(np.int64)
+            # the cells of this layer every box covers, in one lookup
+            offset, rows = np.nonzero(covers & in_layer)
+            cells = np.empty((len(rows), 3), dtype=np.int64)
+            cells[:, axis] = layer[rows]
+            cells[:, a] = a0[rows] + ia[offset]
+            cells[:, b] = b0[rows] + ib[offset]
+            kinds = world.get_cell_kinds(cells)
+            hit = np.zeros(len(idx), dtype=bool)
+            if k >= 0:
+                hit[rows[kinds == CELL_FULL]] = True
+            # stop at the face of the first solid layer
+            face = np.where(pos_dir, layer, layer + 1)
+            d = np.where(hit, face - lead, d)
+            blocked |= hit
+            part = kinds == CELL_PARTIAL
+            if part.any():
+                d = self._sweep_partial(
+                    rows[part], cells[part], axis, d, lo, hi, blocked
+                )
+        return d, blocked
+
+    def _sweep_partial(self, rows, cells, axis, d, lo, hi, blocked):
+        """clip moves d against the partial blocks in cells like _sweep_axis
+        does, rows being the entity for each cell. marks clipped ones blocked"""
+        # hitboxes of the (few) distinct partial blocks, then one per pair
+        unique, inverse = np.unique(cells, axis=0, return_inverse=True)
+        blocks = self.world.blocks
+        bounds = np.array(
+            [blocks[cell].hitbox.bounds() for cell in map(tuple, unique.tolist())]
+        )[inverse.ravel()]
+        eps = COLLISION_EPSILON
+        a, b = [i for i in range(3) if i != axis]
+        box_lo, box_hi, dr = lo[rows], hi[rows], d[rows]
+        lined_up = (
+            (box_lo[:, a] < bounds[:, a + 3] - eps)
+            & (bounds[:, a] < box_hi[:, a] - eps)
+            & (box_lo[:, b] < bounds[:, b + 3] - eps)
+            & (bounds[:, b] < box_hi[:, b] - eps)
+        )
+        ahead = lined_up & (dr > 0) & (bounds[:, axis] >= box_hi[:, axis] - eps)
+        behind = lined_up & (dr < 0) & (bounds[:, axis + 3] <= box_lo[:, axis] + eps)
+        clipped = d.copy()
+        np.minimum.at(clipped, rows[ahead], bounds[ahead, axis] - box_hi[ahead, axis])
+        np.maximum.at(
+            clipped, rows[behind], bounds[behind, axis + 3] - box_lo[behind, axis]
+        )
+        blocked |= clipped != d
+        return clipped
+
+
+class EntityScheduler:
+    """Spreads updates of the world's entities across frames.
+
+    Entities are kept in a priority queue by the frame they're next due,
+    and each is re-queued at an interval that grows with its distance from
+    the focus entity (usually the player). Entities at rest go to sleep
+    until a nearby block changes or something bumps into them. At most
+    `budget` entities are updated per frame, the rest wait their turn.
+    Entities added to or removed from the world are picked up as they are.
+    """
+
+    def __init__(
+        self, world: World, focus: Entity, budget=64, distance_step=16, max_interval=30
+    ):
+        self.world = world
+        self.focus = focus
+        self.budget = budget
+        self.distance_step = distance_step  # blocks per extra frame of interval
+        self.max_interval = max_interval
+        self.frame = 0
+        self.queue = []  # heap of (due frame, seq, entity id)
+        self.due = {}  # entity id -> due frame, missing if asleep
+        self.last_update = {}  # entity id -> frame last updated
+        self.sleeping = set()
+        self.wake_radius = 2
+        self._seq = 0
+        world.add_listener(self.on_block_change)
+        # follows the world's entities from here on
+        world.add_entity_listener(self.on_entity_change)
+        for entity in list(world.entities.values()):
+            self.on_entity_change(entity, True)
+
+    def get_interval(self, entity: Entity) -> int:
+        """frames between updates for an entity, based on distance to focus"""
+        d = self.focus.pos - entity.pos
+        dist = math.sqrt(d.x**2 + d.y**2 + d.z**2)
+        return min(1 + int(dist // self.distance_step), self.max_interval)
+
+    def _schedule(self, entity: Entity, frame):
+        self._seq += 1
+        self.due[entity.id] = frame
+        heapq.heappush(self.queue, (frame, self._seq, entity.id))
+
+    def add(self, entity: Entity):
+        """start scheduling an entity, staggered so new ones don't bunch up"""
+        self.last_update[entity.id] = self.frame
+        self.sleeping.discard(entity.id)
+        self._schedule(entity, self.frame + 1 + self._seq % self.get_interval(entity))
+
+    def remove(self, entity: Entity):
+        self.remove_id(entity.id)
+
+    def remove_id(self, eid):
+        self.due.pop(eid, None)  # the queue entry goes stale
+        self.last_update.pop(eid, None)
+        self.sleeping.discard(eid)
+
+    def sleep(self, entity: Entity):
+        self.due.pop(entity.id, None)
+        self.sleeping.add(entity.id)
+
+    def wake(self, entity: Entity):
+        if entity.id in self.sleeping:
+            self.sleeping.discard(entity.id)
+            self.last_update[entity.id] = self.frame
+            self._schedule(entity, self.frame + 1)
+
+    def wake_near(self, center: Coordinate, radius):
+        for entity in self.world.get_entities_near(center, radius):
+            self.wake(entity)
+
+    def on_entity_change(self, entity: Entity, added):
+        if entity is self.focus:  # moved by the game, not scheduled
+            return
+        if added:
+            self.add(entity)
+        else:
+            self.remove(entity)
+
+    def on_block_change(self, tpos):
+        self.wake_near(
+            Coordinate(tpos[0] + 0.5, tpos[1] + 0.5, tpos[2] + 0.5), self.wake_radius
+        )
+
+    def tick(self, dt):
+        """run one frame of updates, dt is the frame time in seconds.
+        returns how many entities were updated"""
+        self.frame += 1
+        entities = self.world.entities
+        updated = 0
+        while self.queue and self.queue[0][0] <= self.frame and updated < self.budget:
+            due, _, eid = heapq.heappop(self.queue)
+            entity = entities.get(eid)
+            if entity is None:
+                self.remove_id(eid)
+                continue
+            if self.due.get(eid) != due or entity is self.focus:
+                continue  # stale entry, or slept/rescheduled since
+            at_rest = entity.update((self.frame - self.last_update[eid]) * dt)
+            self.last_update[eid] = self.frame
+            updated += 1
+            if at_rest:
+                self.sleep(entity)
+            else:
+                self._schedule(entity, self.frame + self.get_interval(entity))
+                # anything it moved into wakes up too
+                if entity.hitbox is not None:
+                    for other in self.world.get_entities_in_box(
+                        entity.hitbox.get_start(), entity.hitbox.get_end()
+                    ):
+                        if other is not entity:
+                            self.wake(other)
+        return updated
+
 
 class Camera:
     # def __init__(self, plyr: Player):
@@ -645,6 +2269,29 @@ class Camera:
 
         return (normx, normy)
 
+    def to_view(self, pts):
+        """move an (n, 3) array of world points into camera space like
+        project() does, returns (n, 3) of (rx, ry, rz)"""
+        t = np.asarray(pts, dtype=np.float64).reshape(-1, 3) - self.pos.get()
+        cy, sy = cos(self.yaw), sin(self.yaw)
+        cp, sp = cos(self.pitch), sin(self.pitch)
+        out = np.empty_like(t)
+        out[:, 0] = t[:, 0] * cy - t[:, 2] * sy
+        rz = t[:, 0] * sy + t[:, 2] * cy
+        out[:, 1] = t[:, 1] * cp - rz * sp
+        out[:, 2] = t[:, 1] * sp + rz * cp
+        return out
+
+    def project_many(self, pts):
+        """project an (n, 3) array of points like project(), returns the (n, 2)
+        normalized points and a mask of the ones between the near/far planes"""
+        view = self.to_view(pts)
+        rx, ry, rz = view[:, 0], view[:, 1], view[:, 2]
+        visible = (rz >= self.near) & (rz <= self.far)
+        rz = np.where(visible, rz, 1.0)
+        f = tan(self.fov / 2)
+        return np.stack([rx / rz * f, ry / rz * f], axis=1), visible
+
     def project_face(self, face: Face):
         """project a face onto the 2d screen in this camera's view"""
         return [self.project(v) for v in face.get_vertices()]
@@ -683,6 +2330,50 @@ class Camera:
             sin(self.yaw) * cos(self.pitch),
         )
 
+    def get_forward(self) -> Coordinate:
+        """get the unit vector the camera is looking along"""
+        return Coordinate(
+            sin(self.yaw) * cos(self.pitch),
+            sin(self.pitch),
+            cos(self.yaw) * cos(self.pitch),
+        )
+
+    def get_frustum(self, bottom=1.0, far=None):
+        """get the view frustum as world-space planes (nx, ny, nz, d), where
+        a point p is in view if n.p + d >= 0 for every plane. bottom is how far
+        below the center the screen reaches in normalized units, far overrides
+        the camera's far plane"""
+        if far is None:
+            far = self.far
+        cy, sy = cos(self.yaw), sin(self.yaw)
+        cp, sp = cos(self.pitch), sin(self.pitch)
+        # camera space axes written in world space, matching project()
+        ex = (cy, 0, -sy)
+        ey = (-sp * sy, cp, -sp * cy)
+        ez = (cp * sy, sp, cp * cy)
+        k = 1 / tan(self.fov / 2)  # |normx| <= 1  <=>  |rx| <= k * rz
+
+        def plane(n, offset=0):
+            # n.(p - pos) + offset >= 0
+            return (
+                n[0],
+                n[1],
+                n[2],
+                offset - (n[0] * self.pos.x + n[1] * self.pos.y + n[2] * self.pos.z),
+            )
+
+        def combine(a, sa, b, sb):
+            return tuple(sa * a[i] + sb * b[i] for i in range(3))
+
+        return [
+            plane(ez, -self.near),  # near
+            plane((-ez[0], -ez[1], -ez[2]), far),  # far
+            plane(combine(ez, k, ex, -1)),  # right
+            plane(combine(ez, k, ex, 1)),  # left
+            plane(combine(ez, k, ey, -1)),  # top
+            plane(combine(ez, k * bottom, ey, 1)),  # bottom
+        ]
+
 
 class GameOptions:
     def __init__(self):
@@ -695,54 +2386,331 @@ class GameOptions:
             "player-hitbox": False,
             "player-model": False,
         }
+        # models smaller on screen than each of these (in screen widths) drop
+        # a level of detail
+        self.lod_thresholds = [0.25, 0.1, 0.04]
+        # quality settings, picked by the QualityGovernor when adaptive_quality
+        # is on to keep rendering under frame_target seconds
+        self.adaptive_quality = True
+        self.frame_target = 1 / 40
+        self.quality_level = 0
+        self.render_distance = 64
+        self.lod_bias = 1.0  # multiplies lod_thresholds, higher drops detail sooner
+        self.outlines = True
+        self.render_scale = 1.0  # fraction of the window's resolution drawn at
+        # skip chunks that can't be seen through the chunks around the camera
+        self.occlusion_culling = True
+        # skip things hidden behind nearer opaque blocks (Screen.cull_occluded)
+        self.coverage_culling = True
+        self.show_minimap = True
 
     def toggle_debug_info(self):
         self.show_debug_info = not self.show_debug_info
 
 
+class QualityGovernor:
+    """Steps GameOptions quality settings up and down to keep render time
+    under options.frame_target. it only drops a level after frames have been
+    slow for a while, and only raises one after they've been well under the
+    target for longer, so it settles instead of flipping back and forth"""
+
+    # (render_distance, lod_bias, outlines, render_scale), best first
+    LEVELS = [
+        (64, 1.0, True, 1.0),
+        (64, 1.0, False, 1.0),
+        (48, 1.5, False, 0.85),
+        (32, 2.0, False, 0.75),
+        (24, 3.0, False, 0.6),
+        (16, 4.0, False, 0.5),
+    ]
+
+    def __init__(
+        self, options: GameOptions, down_frames=10, up_frames=90, headroom=0.7
+    ):
+        self.options = options
+        self.down_frames = down_frames  # slow frames in a row before dropping
+        self.up_frames = up_frames  # fast frames in a row before raising
+        self.headroom = headroom  # fast means under this fraction of the target
+        self.average = None  # smoothed render time
+        self.slow = 0
+        self.fast = 0
+        if options.adaptive_quality:  # otherwise keep the settings as they are
+            self.apply(options.quality_level)
+
+    def apply(self, level):
+        """switch to a quality level, writing its settings into the options"""
+        level = max(0, min(level, len(self.LEVELS) - 1))
+        o = self.options
+        o.quality_level = level
+        o.render_distance, o.lod_bias, o.outlines, o.render_scale = self.LEVELS[level]
+        self.slow = self.fast = 0
+
+    def update(self, render_time):
+        """feed in how long the last frame took to render, in seconds"""
+        if not self.options.adaptive_quality:
+            return
+        if self.average is None:
+            self.average = render_time
+        self.average += (render_time - self.average) * 0.2
+        target = self.options.frame_target
+        if self.average > target:
+            self.slow += 1
+            self.fast = 0
+        elif self.average < target * self.headroom:
+            self.fast += 1
+            self.slow = 0
+        else:  # close to the target, leave it be
+            self.slow = self.fast = 0
+
+        level = self.options.quality_level
+        if self.slow >= self.down_frames and level < len(self.LEVELS) - 1:
+            self.apply(level + 1)
+        elif self.fast >= self.up_frames and level > 0:
+            self.apply(level - 1)
+
+
+COVERAGE_CELL = 16  # pixels per cell of Screen.cull_occluded's coverage buffer
+# box corners as indices into (x0, y0, z0, x1, y1, z1), in Mesh.box vertex order
+_BOX_CORNERS = [0, 1, 2, 3, 1, 2, 3, 4, 2, 0, 4, 2, 0, 1, 5, 3, 1, 5, 3, 4, 5, 0, 4, 5]
+
+
+class View:
+    """An extra camera drawn into part of the screen (picture in picture, a
+    rear view, split screen...), see Screen.add_view. rect is (x, y, width,
+    height) as fractions of the screen"""
+
+    def __init__(self, camera: Camera, rect=(0.68, 0.02, 0.3, 0.3), border=True):
+        self.camera = camera
+        self.rect = rect
+        self.border = border
+        self.enabled = True
+
+
+class Minimap:
+    """A top-down map of the world around a point, drawn from the World's
+    heightmap with +x to the right and +z up. it's cut into tiles of
+    CHUNK_SIZE x CHUNK_SIZE columns that are kept between frames and only
+    redrawn once a block in them changes"""
+
+    BACKGROUND = (20, 20, 20)
+
+    def __init__(self, world: World, scale=2, radius=64):
+        self.world = world
+        self.scale = scale  # pixels per column
+        self.radius = radius  # columns shown each way from the player
+        self.tiles = {}  # (tile x, tile z) -> Surface
+        self.dirty = set()  # tiles with a changed block since they were drawn
+        self.redrawn = 0  # tiles drawn by the last render
+        self._map = None
+        world.add_listener(self._block_changed)
+
+    def close(self):
+        """stop following changes to the world"""
+        self.world.remove_listener(self._block_changed)
+
+    def _block_changed(self, tpos):
+        x, z = math.floor(tpos[0]), math.floor(tpos[2])
+        self.dirty.add((x // CHUNK_SIZE, z // CHUNK_SIZE))
+
+    def _draw_tile(self, key) -> pygame.Surface:
+        scale = self.scale
+        tile = pygame.Surface((CHUNK_SIZE * scale, CHUNK_SIZE * scale))
+        tile.fill(self.BACKGROUND)
+        heights, blocks = self.world.heights, self.world.blocks
+        x0, z0 = key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE
+        for i in range(CHUNK_SIZE):
+            for j in range(CHUNK_SIZE):
+                y = heights.get((x0 + i, z0 + j))
+                if y is None:
+                    continue
+                # higher ground is lighter
+                shade = min(max(0.8 + 0.05 * y, 0.5), 1.3)
+                color = _shade_color(blocks[(x0 + i, y, z0 + j)].color[:3], shade)
+                rect = (i * scale, (CHUNK_SIZE - 1 - j) * scale, scale, scale)
+                tile.fill(color, rect)
+        return tile
+
+    def get_size(self) -> int:
+        """width and height of the map in pixels"""
+        return 2 * self.radius * self.scale
+
+    def render(self, surface: pygame.Surface, pos: Coordinate, yaw, corner=(10, 10)):
+        """draw the map centered on pos into surface with its top left at
+        corner, with a marker for the player facing yaw"""
+        size = self.get_size()
+        if self._map is None or self._map.get_width() != size:
+            self._map = pygame.Surface((size, size))
+        self._map.fill(self.BACKGROUND)
+        for key in self.dirty:
+            self.tiles.pop(key, None)
+        self.dirty.clear()
+
+        scale, half = self.scale, size / 2
+        lo_x = math.floor((pos.x - self.radius) / CHUNK_SIZE)
+        hi_x = math.floor((pos.x + self.radius) / CHUNK_SIZE)
+        lo_z = math.floor((pos.z - self.radius) / CHUNK_SIZE)
+        hi_z = math.floor((pos.z + self.radius) / CHUNK_SIZE)
+        tiles = {}
+        self.redrawn = 0
+        for tx in range(lo_x, hi_x + 1):
+            for tz in range(lo_z, hi_z + 1):
+                tile = self.tiles.get((tx, tz))
+                if tile is None:
+                    tile = self._draw_tile((tx, tz))
+                    self.redrawn += 1
+                tiles[(tx, tz)] = tile
+                left = half + (tx * CHUNK_SIZE - pos.x) * scale
+                top = half - ((tz + 1) * CHUNK_SIZE - pos.z) * scale
+                self._map.blit(tile, (round(left), round(top)))
+        self.tiles = tiles  # forget tiles that have gone out of range
+
+        fx, fz = sin(yaw), cos(yaw)
+        marker = [
+            (half + fx * 6, half - fz * 6),
+            (half - fx * 3 + fz * 3, half + fz * 3 + fx * 3),
+            (half - fx * 3 - fz * 3, half + fz * 3 - fx * 3),
+        ]
+        pygame.draw.polygon(self._map, (255, 255, 255), marker)
+        surface.blit(self._map, corner)
+        pygame.draw.rect(surface, (255, 255, 255), (corner, (size, size)), 1)
+
+
 class Screen:
     def __init__(self, surface: pygame.Surface, camera: Camera, options: GameOptions):
-        self.surface = surface
+        self.display = surface  # the window, see set_display
+        self.surface = surface  # what's drawn to, smaller with options.render_scale
         self.camera = camera
         self.options = options
+        self.width, self.height = surface.get_size()
+        self.half_width = self.width * 0.5
+        self._viewport = None  # (display size, scale) the above were set up for
+        self.render_time = 0  # seconds the last render() took
+        self.chunk_stats = (0, 0)  # (chunks reached, chunks in the world)
+        self.coverage = None  # coverage buffer of the last cull_occluded
+        self.draws_saved = 0  # blocks and entities it skipped
+        self.font = None  # for the debug overlay, see render_debug_info
+        self.views = []  # extra Views drawn over the main camera's
 
     def set_camera(self, camera: Camera):
         """change camera view"""
         self.camera = camera
 
+    def add_view(self, camera: Camera, rect=(0.68, 0.02, 0.3, 0.3)) -> View:
+        """draw camera into rect of the screen too, on top of the main view"""
+        view = View(camera, rect)
+        self.views.append(view)
+        return view
+
+    def remove_view(self, view: View):
+        if view in self.views:
+            self.views.remove(view)
+
+    def _use_view(self, camera: Camera, surface: pygame.Surface) -> tuple:
+        """point drawing at a camera and a surface, returns the (camera,
+        surface) it was using to switch back with"""
+        old = (self.camera, self.surface)
+        self.camera, self.surface = camera, surface
+        self.width, self.height = surface.get_size()
+        self.half_width = self.width * 0.5
+        return old
+
+    def get_view_surface(self, view: View) -> pygame.Surface:
+        """the part of the render surface a View draws into"""
+        w, h = self.surface.get_size()
+        x, y, vw, vh = view.rect
+        rect = pygame.Rect(int(x * w), int(y * h), int(vw * w), int(vh * h))
+        return self.surface.subsurface(rect.clip(self.surface.get_rect()))
+
+    def set_display(self, surface: pygame.Surface):
+        """change the surface shown on screen, like after a resize"""
+        self.display = surface
+        self._viewport = None
+
+    def update_viewport(self):
+        """set up the render surface and the size constants drawing uses for
+        the display size and options.render_scale, if either changed"""
+        size = self.display.get_size()
+        scale = min(max(self.options.render_scale, 0.1), 1.0)
+        if self._viewport == (size, scale):
+            return
+        self._viewport = (size, scale)
+        if scale == 1.0:
+            self.surface = self.display
+        else:
+            self.surface = pygame.Surface(
+                (max(1, int(size[0] * scale)), max(1, int(size[1] * scale)))
+            )
+        self.width, self.height = self.surface.get_size()
+        self.half_width = self.width * 0.5
+
+    def present(self):
+        """scale what was drawn up to the display, if it's smaller"""
+        if self.surface is not self.display:
+            pygame.transform.scale(self.surface, self.display.get_size(), self.display)
+
     def clear(self, update=False):
+        self.update_viewport()
         self.surface.fill((107, 181, 237))
         if update:
             pygame.display.flip()
 
     def render_debug_info(self, player: Player):
         """Draws the debug information on the screen."""
+        if self.font is None:  # made on first use, pygame has to be running
+            self.font = pygame.font.Font(None, 24)
         pos_text = (
             f"Position: ({player.pos.x:.2f}, {player.pos.y:.2f}, {player.pos.z:.2f})"
         )
         yaw_text = f"Yaw: {player.yaw:.2f}°"
         pitch_text = f"Pitch: {player.pitch:.2f}°"
+        target = player.get_target()
+        target_text = f"Target: {'none' if target is None else target.block.pos}"
+        o = self.options
+        quality_text = (
+            f"Quality: {o.quality_level}{' (auto)' if o.adaptive_quality else ''}, "
+            f"dist {o.render_distance}, lod x{o.lod_bias:g}, "
+            f"outlines {'on' if o.outlines else 'off'}, "
+            f"scale {o.render_scale:.0%}, "
+            f"{self.render_time * 1000:.1f}/{o.frame_target * 1000:.0f} ms"
+        )
 
-        pos_surf = font.render(pos_text, True, (255, 255, 255))
-        yaw_surf = font.render(yaw_text, True, (255, 255, 255))
-        pitch_surf = font.render(pitch_text, True, (255, 255, 255))
+        pos_surf = self.font.render(pos_text, True, (255, 255, 255))
+        yaw_surf = self.font.render(yaw_text, True, (255, 255, 255))
+        pitch_surf = self.font.render(pitch_text, True, (255, 255, 255))
+        target_surf = self.font.render(target_text, True, (255, 255, 255))
+        quality_surf = self.font.render(quality_text, True, (255, 255, 255))
+        chunks_text = "Chunks: {} of {} drawn, {} draws occluded".format(
+            *self.chunk_stats, self.draws_saved
+        )
+        chunks_surf = self.font.render(chunks_text, True, (255, 255, 255))
 
         # Display in top-right corner
-        self.surface.blit(
-            pos_surf, (self.surface.get_width() - pos_surf.get_width() - 10, 10)
+        self.display.blit(
+            pos_surf, (self.display.get_width() - pos_surf.get_width() - 10, 10)
+        )
+        self.display.blit(
+            yaw_surf, (self.display.get_width() - yaw_surf.get_width() - 10, 40)
+        )
+        self.display.blit(
+            pitch_surf, (self.display.get_width() - pitch_surf.get_width() - 10, 70)
+        )
+        self.display.blit(
+            target_surf, (self.display.get_width() - target_surf.get_width() - 10, 100)
         )
-        self.surface.blit(
-            yaw_surf, (self.surface.get_width() - yaw_surf.get_width() - 10, 40)
+        self.display.blit(
+            quality_surf,
+            (self.display.get_width() - quality_surf.get_width() - 10, 130),
         )
-        self.surface.blit(
-            pitch_surf, (self.surface.get_width() - pitch_surf.get_width() - 10, 70)
+        self.display.blit(
+            chunks_surf,
+            (self.display.get_width() - chunks_surf.get_width() - 10, 160),
         )
 
     def denormalize(self, x, y):
         """convert normalized screen coordinates to screen coordinates by scaling by screen width"""
         return (
-            int((x + 1) * 0.5 * self.surface.get_width()),
-            int((1 - y) * 0.5 * self.surface.get_width()),
+            int((x + 1) * self.half_width),
+            int((1 - y) * self.half_width),
         )
 
     def render_point(self, *pts3d: Coordinate, color=(255, 255, 255)):
@@ -800,10 +2768,11 @@ class Screen:
                     self.surface, (255, 0, 0), scrn_center, scrn_normal_end, 2
                 )
 
-    def render_block(self, block: GenericBlock, outline=False):
-        """render a Block onto screen"""
+    def render_block(self, block: GenericBlock, outline=False, faces=None):
+        """render a Block onto screen, optionally with other faces (like a LOD)"""
 
-        faces = block.get_faces()
+        if faces is None:
+            faces = block.get_faces()
         if not block.transparent:  # don't cull transparent blockfaces
             # backface culling
             culled_faces = []
@@ -842,627 +2811,876 @@ class Screen:
             #     scrn_end = self.denormalize(*proj_end)
             #     pygame.draw.rect(self.surface, (255, 0, 0), (scrn_start, scrn_end), 2)
 
+    def render_mesh(
+        self,
+        mesh: Mesh,
+        pos: Coordinate,
+        color,
+        yaw=0,
+        transparent=False,
+        outline=False,
+    ):
+        """render an instance of a shared Mesh placed at pos and turned by yaw.
+        the mesh's arrays are transformed and projected in one go, no Faces
+        are made"""
+        verts, centers, normals = mesh.vertices, mesh.centers, mesh.normals
+        if yaw:
+            c, s = cos(yaw), sin(yaw)
+            # model +z turns to face along the yaw, like Entity.walk
+            rot = np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+            verts, centers, normals = verts @ rot.T, centers @ rot.T, normals @ rot.T
+        offset = np.array(pos.get(), dtype=np.float64)
+        verts = verts + offset
+        centers = centers + offset
+        to_face = centers - self.camera.pos.get()
+
+        if transparent:  # don't cull transparent faces
+            drawn = np.arange(len(centers))
+        else:  # backface culling
+            drawn = np.flatnonzero(np.einsum("ij,ij->i", normals, to_face) < 0)
+        # z-order faces
+        dist = np.einsum("ij,ij->i", to_face[drawn], to_face[drawn])
+        drawn = drawn[np.argsort(-dist, kind="stable")]
+
+        pts, visible = self.camera.project_many(verts)
+        w = self.width
+        scrn = np.empty(pts.shape, dtype=np.int64)
+        scrn[:, 0] = (pts[:, 0] + 1) * 0.5 * w
+        scrn[:, 1] = (1 - pts[:, 1]) * 0.5 * w
+        scrn = scrn.tolist()
+        visible = visible.tolist()
+        faces = mesh.faces
+        colors = mesh.get_colors(color)
+        for i in drawn.tolist():
+            face = faces[i]
+            # if any of the vertices are behind the camera, don't render the face
+            if not all(visible[j] for j in face):
+                continue
+            scrn_verts = [scrn[j] for j in face]
+            pygame.draw.polygon(self.surface, colors[i], scrn_verts)
+            if outline:
+                pygame.draw.aalines(self.surface, (0, 0, 0), True, scrn_verts, 1)
+
+        if self.options.visual_debug["normals"]:  # draw face normals
+            for i in drawn.tolist():
+                center = Coordinate(*centers[i].tolist())
+                normal = Coordinate(*normals[i].tolist())
+                proj_center = self.camera.project(center)
+                proj_normal_end = self.camera.project(center + normal / 2)
+                if proj_center and proj_normal_end:
+                    pygame.draw.line(
+                        self.surface,
+                        (255, 0, 0),
+                        self.denormalize(*proj_center),
+                        self.denormalize(*proj_normal_end),
+                        2,
+                    )
+
+    def get_lod(self, model: BlockModel) -> int:
+        """pick a model's detail level from how big it is on screen"""
+        start, end = model.hitbox.get_start(), model.hitbox.get_end()
+        size = end - start
+        radius = math.sqrt(size.x**2 + size.y**2 + size.z**2) / 2
+        dist = self.camera.get_zdist((start + end) / 2)
+        if dist <= radius:
+            return 0
+        projected = radius / dist * tan(self.camera.fov / 2)  # in screen widths
+        level = 0
+        for threshold in self.options.lod_thresholds:
+            if projected < threshold * self.options.lod_bias:
+                level += 1
+        return level
+
     def render_model(self, model: BlockModel, outline=False):
-        """render a BlockModel onto screen"""
-        self.render_block(model, outline=outline)
+        """render a BlockModel onto screen at a detail level for its size"""
+        lods = model.mesh.lods
+        mesh = lods[min(self.get_lod(model), len(lods) - 1)]
+        self.render_mesh(
+            mesh, model.pos, model.color, transparent=model.transparent, outline=outline
+        )
+        if self.options.visual_debug["hitbox-dots"]:
+            self.render_point(
+                model.hitbox.get_start(), model.hitbox.get_end(), color=(0, 255, 0)
+            )
+
+    def get_frustum(self) -> list:
+        """get the camera's frustum planes for this screen and render distance"""
+        w, h = self.width, self.height
+        return self.camera.get_frustum(
+            bottom=max(1.0, 2 * h / w - 1), far=self.options.render_distance
+        )
+
+    def get_reachable_chunks(self, world: World, frustum) -> set:
+        """breadth first search out from the camera's chunk through chunk faces
+        that can see each other (World.get_chunk_visibility), never turning
+        back on a direction already taken and staying in the frustum. chunks
+        it doesn't reach are hidden behind solid blocks"""
+        start = _chunk_of(self.camera.pos.get())
+        # outside the world's chunks is empty, and a search that leaves can't
+        # come back in without turning around, so it stops at their bounds
+        keys = list(world.chunks) + [start]
+        lo = [min(k[i] for k in keys) for i in range(3)]
+        hi = [max(k[i] for k in keys) for i in range(3)]
+        n = CHUNK_SIZE
+
+        reached = {start}
+        todo = deque([(start, -1, 0)])  # chunk, face entered by, directions taken
+        while todo:
+            key, entered, taken = todo.popleft()
+            vis = (
+                _ALL_FACES if entered < 0 else world.get_chunk_visibility(key)[entered]
+            )
+            for d, step in enumerate(CHUNK_FACES):
+                if not vis >> d & 1 or taken >> (d ^ 1) & 1:
+                    continue
+                nxt = (key[0] + step[0], key[1] + step[1], key[2] + step[2])
+                if nxt in reached or not all(
+                    lo[i] <= nxt[i] <= hi[i] for i in range(3)
+                ):
+                    continue
+                box = (nxt[0] * n, nxt[1] * n, nxt[2] * n)
+                if outside_planes(box + (box[0] + n, box[1] + n, box[2] + n), frustum):
+                    continue
+                reached.add(nxt)
+                todo.append((nxt, d ^ 1, taken | 1 << d))
+        return reached
+
+    def get_visible(self, world: World) -> list:
+        """frustum cull the world's blocks, and occlusion cull them if that's on,
+        for the current camera"""
+        blocks, _, masks = self.get_visible_views(world, [(self.camera, self.surface)])
+        return [blocks[i] for i in np.flatnonzero(masks[0]).tolist()]
+
+    def get_visible_views(self, world: World, views: list) -> tuple:
+        """cull the world's blocks for several (camera, surface) views at once.
+        the blocks any of them might see are gathered, with their boxes, a
+        single time, then each view is a vectorized frustum test over those
+        plus, with occlusion culling, a check of the chunks it can see into.
+        returns (blocks, their (n, 6) boxes, a mask of the blocks each view
+        sees). chunk_stats are for the first view"""
+        occlusion = self.options.occlusion_culling
+        frusta, reached = [], []
+        for camera, surface in views:
+            old = self._use_view(camera, surface)
+            frusta.append(self.get_frustum())
+            if occlusion:
+                reached.append(self.get_reachable_chunks(world, frusta[-1]))
+            self._use_view(*old)
+
+        if occlusion:
+            self.chunk_stats = (
+                len(reached[0] & world.chunks.keys()),
+                len(world.chunks),
+            )
+            # only the reached chunks' blocks are looked at, so buried ones
+            # cost nothing. off-grid blocks go last, they can spill into other
+            # chunks so they're checked against every chunk they touch
+            blocks = []
+            slices = {}  # chunk key -> where its blocks are in blocks
+            for key in set().union(*reached):
+                start = len(blocks)
+                blocks += [
+                    block
+                    for block in world.chunks.get(key, {}).values()
+                    if block not in world.offgrid
+                ]
+                slices[key] = (start, len(blocks))
+            loose = len(blocks)
+            blocks += world.offgrid
+        else:
+            self.chunk_stats = (len(world.chunks), len(world.chunks))
+            found = {}
+            for frustum in frusta:
+                found.update(dict.fromkeys(world.bvh.query_planes(frustum)))
+            blocks = [obj for obj in found if isinstance(obj, GenericBlock)]
+        boxes = np.array(
+            [block.hitbox.bounds() for block in blocks], dtype=np.float64
+        ).reshape(-1, 6)
+
+        masks = []
+        for i, frustum in enumerate(frusta):
+            mask = _inside_planes(boxes, frustum)
+            if occlusion:
+                seen = np.zeros(len(blocks), dtype=bool)
+                for key in reached[i]:
+                    if key in slices:
+                        seen[slice(*slices[key])] = True
+                for j in range(loose, len(blocks)):
+                    box = blocks[j].hitbox.bounds()
+                    seen[j] = any(key in reached[i] for key in _chunks_in_box(box))
+                mask &= seen
+            masks.append(mask)
+        return blocks, boxes, masks
+
+    def _screen_boxes(self, boxes):
+        """project the corners of (n, 6) boxes, returns (in_front, sx, sy, rz)
+        where in_front marks boxes entirely past the near plane and sx, sy, rz
+        are (n, 8) screen pixels and depths of the corners, ordered like
+        Mesh.box vertices"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+        corners = boxes[:, _BOX_CORNERS].reshape(-1, 3)
+        view = self.camera.to_view(corners).reshape(len(boxes), 8, 3)
+        rz = view[:, :, 2]
+        in_front = (rz >= self.camera.near).all(axis=1)
+        safe = np.where(rz >= self.camera.near, rz, 1.0)
+        f = tan(self.camera.fov / 2)
+        w = self.width
+        sx = (view[:, :, 0] / safe * f + 1) * 0.5 * w
+        sy = (1 - view[:, :, 1] / safe * f) * 0.5 * w
+        return in_front, sx, sy, rz
+
+    def _is_covered(self, coverage, sx, sy, near):
+        """whether every coverage cell under the screen rect around sx, sy is
+        covered by something nearer than near"""
+        rows, cols = coverage.shape
+        x0 = max(int(sx.min() // COVERAGE_CELL), 0)
+        x1 = min(int(sx.max() // COVERAGE_CELL), cols - 1)
+        y0 = max(int(sy.min() // COVERAGE_CELL), 0)
+        y1 = min(int(sy.max() // COVERAGE_CELL), rows - 1)
+        if x0 > x1 or y0 > y1:
+            return False  # off screen, leave it to frustum culling
+        return coverage[y0 : y1 + 1, x0 : x1 + 1].max() < near
+
+    def _covered_many(self, coverage, in_front, sx, sy, near) -> list:
+        """_is_covered for many screen rects at once, from _screen_boxes, where
+        boxes crossing the near plane never count as covered"""
+        rows, cols = coverage.shape
+        x0 = np.maximum(sx.min(axis=1) // COVERAGE_CELL, 0).astype(np.int64)
+        x1 = np.minimum(sx.max(axis=1) // COVERAGE_CELL, cols - 1).astype(np.int64)
+        y0 = np.maximum(sy.min(axis=1) // COVERAGE_CELL, 0).astype(np.int64)
+        y1 = np.minimum(sy.max(axis=1) // COVERAGE_CELL, rows - 1).astype(np.int64)
+        test = in_front & (x0 <= x1) & (y0 <= y1)
+        covered = [False] * len(test)
+        x0, x1, y0, y1 = x0.tolist(), x1.tolist(), y0.tolist(), y1.tolist()
+        near = near.tolist()
+        for j in np.flatnonzero(test).tolist():
+            covered[j] = coverage[y0[j] : y1[j] + 1, x0[j] : x1[j] + 1].max() < near[j]
+        return covered
+
+    def _cover(self, coverage, xs, ys, depth):
+        """mark the coverage cells entirely inside a convex screen quad as
+        covered up to depth"""
+        c = COVERAGE_CELL
+        rows, cols = coverage.shape
+        x0 = max(math.ceil(min(xs) / c), 0)
+        x1 = min(math.floor(max(xs) / c), cols)
+        y0 = max(math.ceil(min(ys) / c), 0)
+        y1 = min(math.floor(max(ys) / c), rows)
+        if x0 >= x1 or y0 >= y1:
+            return  # smaller than a cell
+        gx, gy = np.meshgrid(np.arange(x0, x1 + 1) * c, np.arange(y0, y1 + 1) * c)
+        # a grid point is inside if it's on the same side of every edge
+        area = 0
+        for i in range(4):
+            area += xs[i - 1] * ys[i] - xs[i] * ys[i - 1]
+        inside = np.ones(gx.shape, dtype=bool)
+        for i in range(4):
+            ex, ey = xs[i] - xs[i - 1], ys[i] - ys[i - 1]
+            side = ex * (gy - ys[i - 1]) - ey * (gx - xs[i - 1])
+            inside &= side * area >= 0
+        cells = inside[:-1, :-1] & inside[1:, :-1] & inside[:-1, 1:] & inside[1:, 1:]
+        sub = coverage[y0:y1, x0:x1]
+        sub[cells] = np.minimum(sub[cells], depth)
+
+    def _cover_chunk(self, coverage, world: World, key):
+        """cover the coverage cells behind a chunk's occluder rectangles that
+        face the camera, each up to its farthest corner"""
+        cam = self.camera.pos.get()
+        quads = [
+            corners
+            for corners, axis, low, plane in world.get_chunk_occluders(key)
+            if ((cam[axis] < plane) if low else (cam[axis] > plane))
+        ]
+        if not quads:
+            return
+        view = self.camera.to_view(quads).reshape(len(quads), 4, 3)
+        rz = view[:, :, 2]
+        f = tan(self.camera.fov / 2)
+        w = self.width
+        safe = np.where(rz >= self.camera.near, rz, 1.0)
+        sx = (view[:, :, 0] / safe * f + 1) * 0.5 * w
+        sy = (1 - view[:, :, 1] / safe * f) * 0.5 * w
+        # ones clipped by the near plane or too small to fill a cell are skipped
+        usable = (
+            (rz >= self.camera.near).all(axis=1)
+            & (np.ptp(sx, axis=1) >= COVERAGE_CELL)
+            & (np.ptp(sy, axis=1) >= COVERAGE_CELL)
+        )
+        far = rz.max(axis=1)
+        for i in np.flatnonzero(usable).tolist():
+            self._cover(coverage, sx[i].tolist(), sy[i].tolist(), far[i])
+
+    def cull_occluded(self, world: World, blocks: list, boxes=None) -> list:
+        """front to back pass over blocks with a coarse coverage buffer, each
+        cell holding the depth it's covered up to. chunks go nearest first:
+        the chunk and then each of its blocks is dropped if every cell under
+        its screen rect is covered nearer than its nearest corner, then the
+        chunk's merged opaque faces cover more cells. boxes, the blocks'
+        hitbox bounds as an (n, 6) array, can be passed in if they're already
+        known. returns the blocks left"""
+        if boxes is None:
+            boxes = [block.hitbox.bounds() for block in blocks]
+        w, h = self.width, self.height
+        coverage = np.full(
+            (math.ceil(h / COVERAGE_CELL), math.ceil(w / COVERAGE_CELL)), np.inf
+        )
+        self.coverage = coverage
+
+        # on-grid blocks go chunk by chunk, so a hidden chunk is one test
+        groups = {}
+        loose = []
+        for j, block in enumerate(blocks):
+            if block in world.offgrid:
+                loose.append(j)
+            else:
+                groups.setdefault(_chunk_of(block.pos.get()), []).append(j)
+        n = CHUNK_SIZE
+        keys = list(groups)
+        chunk_front, csx, csy, crz = self._screen_boxes(
+            [
+                (k[0] * n, k[1] * n, k[2] * n, k[0] * n + n, k[1] * n + n, k[2] * n + n)
+                for k in keys
+            ]
+        )
+        chunk_near = crz.min(axis=1)
+        # nearest first, by distance from the camera to the chunk's box
+        cam = self.camera.pos.get()
+        dist = [
+            sum(max(k[a] * n - cam[a], 0, cam[a] - k[a] * n - n) ** 2 for a in range(3))
+            for k in keys
+        ]
+
+        kept = []
+        skipped = 0
+        for i in sorted(range(len(keys)), key=dist.__getitem__):
+            group = groups[keys[i]]
+            if chunk_front[i] and self._is_covered(
+                coverage, csx[i], csy[i], chunk_near[i]
+            ):
+                skipped += len(group)
+                continue
+            in_front, sx, sy, rz = self._screen_boxes([boxes[j] for j in group])
+            covered = self._covered_many(coverage, in_front, sx, sy, rz.min(axis=1))
+            for j, hidden in zip(group, covered):
+                if hidden:
+                    skipped += 1
+                else:
+                    kept.append(blocks[j])
+            self._cover_chunk(coverage, world, keys[i])
+
+        if loose:
+            in_front, sx, sy, rz = self._screen_boxes([boxes[j] for j in loose])
+            covered = self._covered_many(coverage, in_front, sx, sy, rz.min(axis=1))
+            for j, hidden in zip(loose, covered):
+                if hidden:
+                    skipped += 1
+                else:
+                    kept.append(blocks[j])
+        self.draws_saved = skipped
+        return kept
 
     def render(self, world: World, points, update=False):
+        """draw the world for the main camera and then every enabled View on
+        top. the views share culling (get_visible_views) and the blocks'
+        centers used to order them, so an extra view mostly costs its drawing"""
+        began = time.perf_counter()
+        self.update_viewport()
+        views = [(self.camera, self.surface)]
+        extra = [view for view in self.views if view.enabled]
+        views += [(view.camera, self.get_view_surface(view)) for view in extra]
+        blocks, boxes, masks = self.get_visible_views(world, views)
+        # centers of every block a view sees, worked out once for all of them
+        centers = np.zeros((len(blocks), 3))
+        for i in np.flatnonzero(np.logical_or.reduce(masks)).tolist():
+            centers[i] = blocks[i].get_center().get()
+
+        batch = self.get_face_batch(world, blocks, np.logical_or.reduce(masks))
+
+        self.render_view(world, points, blocks, boxes, centers, masks[0], batch)
+        stats = (self.coverage, self.draws_saved)  # the overlay shows the main view's
+        for view, (camera, surface), mask in zip(extra, views[1:], masks[1:]):
+            old = self._use_view(camera, surface)
+            surface.fill((107, 181, 237))
+            self.render_view(world, points, blocks, boxes, centers, mask, batch)
+            if view.border:
+                pygame.draw.rect(surface, (0, 0, 0), surface.get_rect(), 2)
+            self._use_view(*old)
+        self.coverage, self.draws_saved = stats
+
+        self.present()
+        self.render_time = time.perf_counter() - began
+        if update:
+            pygame.display.flip()
+
+    def get_face_batch(self, world: World, blocks, mask) -> dict:
+        """gather the faces of the blocks in mask (models are drawn on their
+        own) into arrays, baking their lighting first, so every view can
+        cull, project and order all of them at once. "ranges" maps a block's
+        index to where its faces are"""
+        parts = []
+        ranges = {}
+        faces = []
+        count = 0
+        for i in np.flatnonzero(mask).tolist():
+            block = blocks[i]
+            if isinstance(block, BlockModel):
+                continue
+            if not block.lit:
+                world.bake_lighting(block)
+            arrays = block.get_face_arrays()
+            parts.append(arrays)
+            faces += arrays[0]
+            ranges[i] = (count, count + len(arrays[0]))
+            count += len(arrays[0])
+        counts = [b - a for a, b in ranges.values()]  # faces per block
+        sizes = np.concatenate([p[2] for p in parts] or [np.zeros(0, np.int64)])
+        starts = np.zeros(len(sizes), dtype=np.int64)
+        np.cumsum(sizes[:-1], out=starts[1:])
+        return {
+            "faces": faces,
+            "vertices": np.concatenate([p[1] for p in parts] or [np.zeros((0, 3))]),
+            "starts": starts,
+            "sizes": sizes,
+            "centers": np.concatenate([p[3] for p in parts] or [np.zeros((0, 3))]),
+            "normals": np.concatenate([p[4] for p in parts] or [np.zeros((0, 3))]),
+            "transparent": np.repeat(
+                np.array([blocks[i].transparent for i in ranges], dtype=bool), counts
+            ),
+            "owner": np.repeat(np.array(list(ranges), dtype=np.int64), counts),
+            "ranges": ranges,
+        }
+
+    def render_view(self, world: World, points, blocks, boxes, centers, mask, batch):
+        """draw the blocks in mask, of blocks and boxes from get_visible_views, and the
+        entities for the current camera onto the current surface. block faces
+        come from a get_face_batch shared by the views, and are backface
+        culled, projected and ordered in one go like render_mesh does"""
+        outline = self.options.outlines
         self.render_point(*points)
-        blocks = world.blocks.values()
-        blocks = sorted(
-            blocks, key=lambda x: self.camera.get_zdist(x.get_center()), reverse=True
+        idx = np.flatnonzero(mask)
+        # back to front by distance from the camera, like get_zdist
+        dist = np.sqrt(((centers[idx] - self.camera.pos.get()) ** 2).sum(axis=1))
+        order = idx[np.argsort(-dist, kind="stable")].tolist()
+        if self.options.coverage_culling:
+            kept = self.cull_occluded(world, [blocks[i] for i in order], boxes[order])
+            kept = set(kept)
+            order = [i for i in order if blocks[i] in kept]
+        else:
+            self.coverage = None
+            self.draws_saved = 0
+
+        # every face in the batch at once: facing the camera (or see-through),
+        # every corner in front of the camera, and far to near within a block
+        to_face = batch["centers"] - self.camera.pos.get()
+        drawn = batch["transparent"] | (
+            np.einsum("ij,ij->i", batch["normals"], to_face) < 0
         )
-        for block in blocks:
-            self.render_block(block, outline=True)
+        pts, visible = self.camera.project_many(batch["vertices"])
+        if len(drawn):
+            drawn &= np.logical_and.reduceat(visible, batch["starts"])
+            in_view = np.zeros(len(blocks), dtype=bool)
+            in_view[order] = True
+            drawn &= in_view[batch["owner"]]
+        face_dist = np.sqrt((to_face**2).sum(axis=1))
+        face_order = np.lexsort((-face_dist, batch["owner"])).tolist()
+        # screen corners of only the faces being drawn, packed one after another
+        sizes = batch["sizes"] * drawn
+        starts = (np.cumsum(sizes) - sizes).tolist()
+        pts = pts[np.repeat(drawn, batch["sizes"])]
+        scrn = np.empty(pts.shape, dtype=np.int64)
+        scrn[:, 0] = (pts[:, 0] + 1) * self.half_width
+        scrn[:, 1] = (1 - pts[:, 1]) * self.half_width
+        scrn = scrn.tolist()
+        sizes = sizes.tolist()
+        faces = batch["faces"]
+
+        # debug drawing is per face, so those blocks go the slow way
+        debug = self.options.visual_debug
+        slow = debug["normals"] or debug["hitbox-dots"]
+        for i in order:
+            block = blocks[i]
+            if isinstance(block, BlockModel):
+                self.render_model(block, outline=outline)
+                continue
+            if slow:
+                self.render_block(block, outline=outline)
+                continue
+            a, b = batch["ranges"][i]
+            for f in face_order[a:b]:
+                if not sizes[f]:
+                    continue  # culled
+                corners = scrn[starts[f] : starts[f] + sizes[f]]
+                pygame.draw.polygon(self.surface, faces[f].color, corners)
+                if outline:
+                    pygame.draw.aalines(self.surface, (0, 0, 0), True, corners, 1)
         for entity in world.entities.values():
+            if self.coverage is not None and entity.hitbox is not None:
+                in_front, sx, sy, rz = self._screen_boxes(entity.hitbox.bounds())
+                if in_front[0] and self._is_covered(
+                    self.coverage, sx[0], sy[0], rz[0].min()
+                ):
+                    self.draws_saved += 1
+                    continue
             if self.options.visual_debug["player-hitbox"]:
                 hitbox = entity.hitbox
                 start = hitbox.get_start()
                 end = hitbox.get_end()
                 self.render_point(start, end, color=(0, 255, 0))
-            if self.options.visual_debug["player-model"]:
-                model = BlockModel(
+            if self.options.visual_debug["player-model"] and entity.mesh is not None:
+                self.render_mesh(
+                    entity.mesh,
                     entity.get_pos(),
                     (255, 0, 0, 0.1),
-                    [
-                        (2, 1, 0),
-                        (0, 3, 2),
-                        (4, 2, 3),
-                        (3, 5, 4),
-                        (6, 4, 5),
-                        (5, 7, 6),
-                        (7, 6, 1),
-                        (1, 0, 7),
-                        (3, 0, 7),
-                        (7, 5, 3),
-                        (1, 2, 4),
-                        (4, 6, 1),
-                    ],
-                    [
-                        Coordinate(0.3, 1.8, 0.3),
-                        Coordinate(0.3, 0.0, 0.3),
-                        Coordinate(0.3, 0.0, -0.3),
-                        Coordinate(0.3, 1.8, -0.3),
-                        Coordinate(-0.3, 0.0, -0.3),
-                        Coordinate(-0.3, 1.8, -0.3),
-                        Coordinate(-0.3, 0.0, 0.3),
-                        Coordinate(-0.3, 1.8, 0.3),
-                    ],
+                    yaw=entity.yaw,
                     transparent=True,
+                    outline=outline,
                 )
-                self.render_block(model, outline=True)
-        if update:
-            pygame.display.flip()
 
 
-world = World()
-user = Player(Coordinate(0, 2, 0), world)
-options = GameOptions()
-screen = Screen(screen_surf, user.cam, options)
-world.add_entity(user)
-
-points = [
-    Coordinate(0, 0, 0),
-    Coordinate(1, 0, 0),
-    Coordinate(1, 1, 0),
-    Coordinate(0, 1, 0),
-    Coordinate(0, 0, 1),
-    Coordinate(1, 0, 1),
-    Coordinate(1, 1, 1),
-    Coordinate(0, 1, 1),
-]
-world.add_block(Block(Coordinate(0, 0, 0), (255, 0, 0)))
-world.add_block(Block(Coordinate(1, 3, 5), (100, 150, 255)))
-
-for i in range(-8, 10):
-    for j in range(-10, 8):
-        world.add_block(Block(Coordinate(i, 0, j), (112, 168, 101)))
-
-world.add_block(BlockSlab(Coordinate(0, 2, 2), (112, 168, 101)))
-world.add_block(BlockSlab(Coordinate(1, 2, 0), (112, 168, 101), bottom=False))
-world.add_block(BlockStairs(Coordinate(4, 2, 0), (112, 168, 101)))
-world.add_block(BlockStairs(Coordinate(6, 2, 0), (190, 168, 50), bottom=False))
-world.add_block(BlockStairs(Coordinate(8, 2, 0), (190, 168, 50), direction="s"))
-world.add_block(BlockStairs(Coordinate(10, 2, 0), (190, 168, 50), direction="e"))
-world.add_block(BlockStairs(Coordinate(12, 2, 0), (190, 168, 50), direction="w"))
-world.add_block(BlockVerticalSlab(Coordinate(14, 2, 0), (190, 168, 50)))
-world.add_block(BlockVerticalSlab(Coordinate(16, 2, 0), (190, 168, 50), left=False))
-world.add_block(BlockVerticalSlab(Coordinate(16, 2, 3), (190, 168, 50, 0), left=False))
-world.add_block(
-    BlockModel(
-        Coordinate(3, 2, 4),
-        (190, 168, 50),
-        [
-            (
-                2,
-                1,
-                0,
-            ),  # Face 0
-            (
-                0,
-                3,
-                2,
-            ),  # Face 1
-            (
-                4,
-                3,
-                0,
-            ),  # Face 2
-            (
-                0,
-                5,
-                4,
-            ),  # Face 3
-            (
-                6,
-                4,
-                5,
-            ),  # Face 4
-            (
-                5,
-                7,
-                6,
-            ),  # Face 5
-            (
-                6,
-                7,
-                1,
-            ),  # Face 6
-            (
-                1,
-                2,
-                6,
-            ),  # Face 7
-            (
-                5,
-                9,
-                8,
-            ),  # Face 8
-            (
-                1,
-                7,
-                10,
-            ),  # Face 9
-            (
-                8,
-                7,
-                5,
-            ),  # Face 10
-            (
-                8,
-                10,
-                7,
-            ),  # Face 11
-            (
-                5,
-                0,
-                11,
-            ),  # Face 12
-            (
-                11,
-                9,
-                5,
-            ),  # Face 13
-            (
-                1,
-                12,
-                11,
-            ),  # Face 14
-            (
-                11,
-                0,
-                1,
-            ),  # Face 15
-            (
-                10,
-                12,
-                1,
-            ),  # Face 16
-            (
-                13,
-                12,
-                10,
-            ),  # Face 17
-            (
-                10,
-                14,
-                13,
-            ),  # Face 18
-            (
-                16,
-                15,
-                9,
-            ),  # Face 19
-            (
-                9,
-                11,
-                16,
-            ),  # Face 20
-            (
-                17,
-                18,
-                2,
-            ),  # Face 21
-            (
-                19,
-                3,
-                2,
-            ),  # Face 22
-            (
-                2,
-                18,
-                19,
-            ),  # Face 23
-            (
-                19,
-                20,
-                4,
-            ),  # Face 24
-            (
-                21,
-                17,
-                6,
-            ),  # Face 25
-            (
-                4,
-                3,
-                19,
-            ),  # Face 26
-            (
-                4,
-                20,
-                21,
-            ),  # Face 27
-            (
-                6,
-                4,
-                21,
-            ),  # Face 28
-            (
-                2,
-                6,
-                17,
-            ),  # Face 29
-            (
-                13,
-                12,
-                18,
-            ),  # Face 30
-            (
-                11,
-                19,
-                18,
-            ),  # Face 31
-            (
-                19,
-                22,
-                16,
-            ),  # Face 32
-            (
-                23,
-                13,
-                16,
-            ),  # Face 33
-            (
-                18,
-                12,
-                11,
-            ),  # Face 34
-            (
-                16,
-                22,
-                23,
-            ),  # Face 35
-            (
-                19,
-                11,
-                16,
-            ),  # Face 36
-            (
-                13,
-                23,
-                18,
-            ),  # Face 37
-            (
-                25,
-                15,
-                24,
-            ),  # Face 38
-            (
-                20,
-                9,
-                15,
-            ),  # Face 39
-            (
-                15,
-                25,
-                20,
-            ),  # Face 40
-            (
-                20,
-                21,
-                8,
-            ),  # Face 41
-            (
-                8,
-                9,
-                20,
-            ),  # Face 42
-            (
-                24,
-                26,
-                25,
-            ),  # Face 43
-            (
-                17,
-                27,
-                14,
-            ),  # Face 44
-            (
-                27,
-                26,
-                24,
-            ),  # Face 45
-            (
-                8,
-                10,
-                17,
-            ),  # Face 46
-            (
-                24,
-                14,
-                27,
-            ),  # Face 47
-            (
-                14,
-                10,
-                17,
-            ),  # Face 48
-            (
-                8,
-                21,
-                17,
-            ),  # Face 49
-            (
-                19,
-                20,
-                25,
-            ),  # Face 50
-            (
-                25,
-                22,
-                19,
-            ),  # Face 51
-            (
-                23,
-                27,
-                17,
-            ),  # Face 52
-            (
-                17,
-                18,
-                23,
-            ),  # Face 53
-            (
-                16,
-                28,
-                29,
-            ),  # Face 54
-            (
-                16,
-                15,
-                30,
-            ),  # Face 55
-            (
-                24,
-                31,
-                30,
-            ),  # Face 56
-            (
-                30,
-                28,
-                16,
-            ),  # Face 57
-            (
-                24,
-                14,
-                31,
-            ),  # Face 58
-            (
-                14,
-                13,
-                29,
-            ),  # Face 59
-            (
-                30,
-                15,
-                24,
-            ),  # Face 60
-            (
-                29,
-                13,
-                16,
-            ),  # Face 61
-            (
-                29,
-                31,
-                14,
-            ),  # Face 62
-            (
-                32,
-                23,
-                22,
-            ),  # Face 63
-            (
-                32,
-                33,
-                27,
-            ),  # Face 64
-            (
-                33,
-                34,
-                26,
-            ),  # Face 65
-            (
-                27,
-                23,
-                32,
-            ),  # Face 66
-            (
-                26,
-                27,
-                33,
-            ),  # Face 67
-            (
-                34,
-                25,
-                26,
-            ),  # Face 68
-            (
-                34,
-                35,
-                22,
-            ),  # Face 69
-            (
-                22,
-                25,
-                34,
-            ),  # Face 70
-            (
-                22,
-                35,
-                32,
-            ),  # Face 71
-            (
-                32,
-                35,
-                28,
-            ),  # Face 72
-            (
-                28,
-                29,
-                32,
-            ),  # Face 73
-            (
-                34,
-                30,
-                28,
-            ),  # Face 74
-            (
-                28,
-                35,
-                34,
-            ),  # Face 75
-            (
-                33,
-                31,
-                30,
-            ),  # Face 76
-            (
-                30,
-                34,
-                33,
-            ),  # Face 77
-            (
-                33,
-                32,
-                29,
-            ),  # Face 78
-            (
-                29,
-                31,
-                33,
-            ),  # Face 79
-        ],
-        [
-            Coordinate(0.348057, 0.286962, -1.0),
-            Coordinate(0.348057, 0.450312, -1.0),
-            Coordinate(0.348057, 0.450312, -0.768039),
-            Coordinate(0.348057, 0.286962, -0.768039),
-            Coordinate(0.59672, 0.286962, -0.768039),
-            Coordinate(0.59672, 0.286962, -1.0),
-            Coordinate(0.59672, 0.450312, -0.768039),
-            Coordinate(0.59672, 0.450312, -1.0),
-            Coordinate(1.0, 0.45, -1.0),
-            Coordinate(1.0, 0.0, -1.0),
-            Coordinate(0.7, 0.75, -1.0),
-            Coordinate(-2.22045e-16, 0.0, -1.0),
-            Coordinate(-2.22045e-16, 0.75, -1.0),
-            Coordinate(0.0, 0.75, 0.0),
-            Coordinate(0.7, 0.75, 0.0),
-            Coordinate(1.0, 0.0, 0.0),
-            Coordinate(0.0, 0.0, 0.0),
-            Coordinate(0.868027, 0.581973, -0.768039),
-            Coordinate(0.0, 0.581973, -0.768039),
-            Coordinate(0.0, 0.162692, -0.768039),
-            Coordinate(1.0, 0.162692, -0.768039),
-            Coordinate(1.0, 0.45, -0.768039),
-            Coordinate(0.0, 0.162692, -0.194772),
-            Coordinate(0.0, 0.581973, -0.194772),
-            Coordinate(1.0, 0.45, 0.0),
-            Coordinate(1.0, 0.162692, -0.194772),
-            Coordinate(1.0, 0.45, -0.194772),
-            Coordinate(0.868027, 0.581973, -0.194772),
-            Coordinate(0.348057, 0.286962, 0.0),
-            Coordinate(0.348057, 0.450312, 0.0),
-            Coordinate(0.59672, 0.286962, 0.0),
-            Coordinate(0.59672, 0.450312, 0.0),
-            Coordinate(0.348057, 0.450312, -0.194772),
-            Coordinate(0.59672, 0.450312, -0.194772),
-            Coordinate(0.59672, 0.286962, -0.194772),
-            Coordinate(0.348057, 0.286962, -0.194772),
-        ],
-        transparent=True,
+def open_display(size=(800, 600), flags=0) -> pygame.Surface:
+    """start pygame if it isn't yet and open (or resize) the game window"""
+    pygame.init()
+    return pygame.display.set_mode(
+        size, flags | pygame.RESIZABLE | pygame.DOUBLEBUF | pygame.HWSURFACE
     )
-)
 
-running = True
-while running:
-    # GAME INPUT!!
+
+# keys read every frame, and keys acted on when pressed, by the names
+# recordings store them under
+GAME_KEYS = {
+    "right": pygame.K_RIGHT,
+    "left": pygame.K_LEFT,
+    "up": pygame.K_UP,
+    "down": pygame.K_DOWN,
+    "w": pygame.K_w,
+    "s": pygame.K_s,
+    "a": pygame.K_a,
+    "d": pygame.K_d,
+    "space": pygame.K_SPACE,
+    "left shift": pygame.K_LSHIFT,
+    "r": pygame.K_r,
+}
+EVENT_KEYS = {
+    "f3": pygame.K_F3,
+    "f4": pygame.K_F4,
+    "f5": pygame.K_F5,
+    "f6": pygame.K_F6,
+    "f11": pygame.K_F11,
+    "escape": pygame.K_ESCAPE,
+    "m": pygame.K_m,
+}
+
+
+def read_input() -> dict:
+    """get a frame of input from pygame as plain data, so it can be recorded:
+    {"events": key presses and "quit", "keys": held keys, "mouse": [dx, dy]}"""
+    events = []
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
-            running = False
+            events.append("quit")
         if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_F3:
+            events += [name for name, key in EVENT_KEYS.items() if event.key == key]
+    pressed = pygame.key.get_pressed()
+    keys = [name for name, key in GAME_KEYS.items() if pressed[key]]
+    return {"events": events, "keys": keys, "mouse": list(pygame.mouse.get_rel())}
+
+
+def build_demo_world(assets: AssetRegistry) -> World:
+    """the world the game starts in when it isn't given one"""
+    world = World()
+    world.add_block(Block(Coordinate(0, 0, 0), (255, 0, 0)))
+    world.add_block(Block(Coordinate(1, 3, 5), (100, 150, 255)))
+
+    for i in range(-8, 10):
+        for j in range(-10, 8):
+            world.add_block(Block(Coordinate(i, 0, j), (112, 168, 101)))
+
+    world.add_block(BlockSlab(Coordinate(0, 2, 2), (112, 168, 101)))
+    world.add_block(BlockSlab(Coordinate(1, 2, 0), (112, 168, 101), bottom=False))
+    world.add_block(BlockStairs(Coordinate(4, 2, 0), (112, 168, 101)))
+    world.add_block(BlockStairs(Coordinate(6, 2, 0), (190, 168, 50), bottom=False))
+    world.add_block(BlockStairs(Coordinate(8, 2, 0), (190, 168, 50), direction="s"))
+    world.add_block(BlockStairs(Coordinate(10, 2, 0), (190, 168, 50), direction="e"))
+    world.add_block(BlockStairs(Coordinate(12, 2, 0), (190, 168, 50), direction="w"))
+    world.add_block(BlockVerticalSlab(Coordinate(14, 2, 0), (190, 168, 50)))
+    world.add_block(BlockVerticalSlab(Coordinate(16, 2, 0), (190, 168, 50), left=False))
+    world.add_block(
+        BlockVerticalSlab(Coordinate(16, 2, 3), (190, 168, 50, 0), left=False)
+    )
+    assets.register(
+        "part",
+        os.path.join(os.path.dirname(__file__), "assets", "part.obj"),
+        bounds=((0, 0, -1), (1, 0.75, 0)),
+    )
+    world.add_block(
+        BlockModel.from_asset(Coordinate(3, 2, 4), (190, 168, 50), assets, "part", True)
+    )
+    return world
+
+
+class Game:
+    """A world with a player in it, run a frame of input (see read_input) at a
+    time so a session can be recorded and replayed. headless games draw to the
+    surface they're given and never touch the window"""
+
+    def __init__(
+        self,
+        world: World,
+        surface: pygame.Surface,
+        assets: AssetRegistry,
+        headless=False,
+        dt=1 / 30,
+    ):
+        self.world = world
+        self.assets = assets
+        self.headless = headless
+        self.dt = dt  # fixed timestep of the entity scheduler
+        self.user = Player(Coordinate(0, 2, 0), world)
+        self.options = GameOptions()
+        self.screen = Screen(surface, self.user.cam, self.options)
+        world.add_entity(self.user)
+        self.scheduler = EntityScheduler(world, self.user)
+        self.governor = QualityGovernor(self.options)
+        self.running = True
+        self.collision_time = 0  # seconds the last step spent moving things
+        self.pip = None  # View toggled with F6
+        self.minimap = Minimap(world)
+        self.points = [
+            Coordinate(0, 0, 0),
+            Coordinate(1, 0, 0),
+            Coordinate(1, 1, 0),
+            Coordinate(0, 1, 0),
+            Coordinate(0, 0, 1),
+            Coordinate(1, 0, 1),
+            Coordinate(1, 1, 1),
+            Coordinate(0, 1, 1),
+        ]
+
+    def fullscreen(self):
+        if self.headless:  # same pixel count, so replays cost the same
+            self.screen.set_display(pygame.Surface((1920, 1080)))
+        else:
+            self.screen.set_display(open_display((1920, 1080), pygame.FULLSCREEN))
+
+    def step(self, frame: dict):
+        """handle a frame of input, move everything and render"""
+        user, options, screen = self.user, self.options, self.screen
+        for event in frame["events"]:
+            if event in ("quit", "escape"):
+                self.running = False
+            if event == "f3":
                 options.toggle_debug_info()
-            if event.key == pygame.K_F11:
-                # pygame.display.toggle_fullscreen()
-                # if pygame.display.is_fullscreen():
-                screen_surf = pygame.display.set_mode(
-                    (1920, 1080),
-                    pygame.FULLSCREEN
-                    | pygame.RESIZABLE
-                    | pygame.DOUBLEBUF
-                    | pygame.HWSURFACE,
-                )
-                screen.surface = screen_surf
-            if event.key == pygame.K_ESCAPE:
-                running = False
-            if event.key == pygame.K_F5:
+            if event == "f4":
+                print(self.world.memory_report())
+            if event == "f11":
+                self.fullscreen()
+            if event == "f5":
                 screen.set_camera(user.cam3)
-    keys = pygame.key.get_pressed()
-    if keys[pygame.K_RIGHT]:
-        user.move(0.1, 0, 0)
-    if keys[pygame.K_LEFT]:
-        user.move(-0.1, 0, 0)
-    if keys[pygame.K_UP]:
-        user.move(0, 0, 0.1)
-    if keys[pygame.K_DOWN]:
-        user.move(0, 0, -0.1)
-    if keys[pygame.K_w]:
-        user.walk(0.1, 0)
-    if keys[pygame.K_s]:
-        user.walk(-0.1, 0)
-    if keys[pygame.K_a]:
-        user.walk(0, -0.1)
-    if keys[pygame.K_d]:
-        user.walk(0, 0.1)
-    if keys[pygame.K_SPACE]:
-        user.move(0, 0.1, 0)
-    if keys[pygame.K_LSHIFT]:
-        user.move(0, -0.1, 0)
-    if keys[pygame.K_r]:
-        user.teleport(Coordinate(0, 2, 0))
-    user.move(0, -0.03, 0)
-
-    mouse_dx, mouse_dy = pygame.mouse.get_rel()
-    user.rotate(mouse_dx * options.sensitivity, -mouse_dy * options.sensitivity)
-
-    screen.clear()
-    screen.render(world, points)
-    if options.show_debug_info:
-        screen.render_debug_info(user)
-
-    # snap_pos = Coordinate(
-    #     math.floor(user.pos.x), math.floor(user.pos.y), math.floor(user.pos.z)
-    # )
-    # surrounding = [
-    #     Coordinate(0, 0, 0),
-    #     Coordinate(1, 0, 0),
-    #     Coordinate(-1, 0, 0),
-    #     Coordinate(0, 1, 0),
-    #     Coordinate(0, -1, 0),
-    #     Coordinate(0, 0, 1),
-    #     Coordinate(0, 0, -1),
-    # ]
-    # for pos in surrounding:
-    #     blk = world.get_block(snap_pos + pos)
-    #     # print(blk)
-    #     if blk is None:
-    #         pass  # world.add_block(Block(pos, (0, 255, 0)))
-    #     elif blk.hitbox.collides(user.hitbox):
-    #         print(f"Collided with block!!! {blk.pos.get()}")
-    # below = world.get_block(snap_pos - Coordinate(0, 1, 0))
-    # if below is None:
-    #     pass  # print(f"No block below, current: {snap_pos.get()}, hb: {user.hitbox}")
-    # elif below.hitbox.collides(user.hitbox):
-    #     print("Collided with block below")
-    # else:
-    #     print(
-    #         f"No collision with block below, current: {snap_pos.get()}, below: {below.pos.get()}"
-    #     )
-
-    pygame.display.flip()
-    clock.tick(30)
-
-pygame.quit()
+            if event == "m":
+                options.show_minimap = not options.show_minimap
+            if event == "f6":  # picture in picture of the other camera
+                if self.pip is not None:
+                    screen.remove_view(self.pip)
+                    self.pip = None
+                else:
+                    other = user.cam if screen.camera is user.cam3 else user.cam3
+                    self.pip = screen.add_view(other)
+
+        start = time.perf_counter()
+        keys = frame["keys"]
+        if "right" in keys:
+            user.move(0.1, 0, 0)
+        if "left" in keys:
+            user.move(-0.1, 0, 0)
+        if "up" in keys:
+            user.move(0, 0, 0.1)
+        if "down" in keys:
+            user.move(0, 0, -0.1)
+        if "w" in keys:
+            user.walk(0.1, 0)
+        if "s" in keys:
+            user.walk(-0.1, 0)
+        if "a" in keys:
+            user.walk(0, -0.1)
+        if "d" in keys:
+            user.walk(0, 0.1)
+        if "space" in keys:
+            user.move(0, 0.1, 0)
+        if "left shift" in keys:
+            user.move(0, -0.1, 0)
+        if "r" in keys:
+            user.teleport(Coordinate(0, 2, 0))
+        user.move(0, -0.03, 0)
+
+        self.scheduler.tick(self.dt)
+        self.collision_time = time.perf_counter() - start
+        self.assets.poll()
+
+        mouse_dx, mouse_dy = frame["mouse"]
+        user.rotate(mouse_dx * options.sensitivity, -mouse_dy * options.sensitivity)
+
+        screen.clear()
+        screen.render(self.world, self.points)
+        self.governor.update(screen.render_time)
+        if options.show_debug_info:
+            screen.render_debug_info(user)
+        if options.show_minimap:
+            corner = (10, screen.display.get_height() - self.minimap.get_size() - 10)
+            self.minimap.render(screen.display, user.pos, user.yaw, corner)
+
+        # snap_pos = Coordinate(
+        #     math.floor(user.pos.x), math.floor(user.pos.y), math.floor(user.pos.z)
+        # )
+        # surrounding = [
+        #     Coordinate(0, 0, 0),
+        #     Coordinate(1, 0, 0),
+        #     Coordinate(-1, 0, 0),
+        #     Coordinate(0, 1, 0),
+        #     Coordinate(0, -1, 0),
+        #     Coordinate(0, 0, 1),
+        #     Coordinate(0, 0, -1),
+        # ]
+        # for pos in surrounding:
+        #     blk = world.get_block(snap_pos + pos)
+        #     # print(blk)
+        #     if blk is None:
+        #         pass  # world.add_block(Block(pos, (0, 255, 0)))
+        #     elif blk.hitbox.collides(user.hitbox):
+        #         print(f"Collided with block!!! {blk.pos.get()}")
+        # below = world.get_block(snap_pos - Coordinate(0, 1, 0))
+        # if below is None:
+        #     pass  # print(f"No block below, current: {snap_pos.get()}, hb: {user.hitbox}")
+        # elif below.hitbox.collides(user.hitbox):
+        #     print("Collided with block below")
+        # else:
+        #     print(
+        #         f"No collision with block below, current: {snap_pos.get()}, below: {below.pos.get()}"
+        #     )
+
+
+class InputRecorder:
+    """Writes the input of every frame to a recording, JSON lines after a
+    header line, for replay(). frames are flushed as they're recorded, so a
+    crash keeps everything up to it. use it in a with block or close it"""
+
+    def __init__(self, path, game: Game, world_path):
+        self.file = open(path, "w")
+        header = {
+            "dt": game.dt,
+            "size": list(game.screen.display.get_size()),
+            # relative so the recording and its world can be moved together
+            "world": os.path.relpath(world_path, os.path.dirname(path) or "."),
+        }
+        self.file.write(json.dumps(header) + "\n")
+
+    def record(self, frame: dict):
+        self.file.write(json.dumps(frame) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def replay(path, trace=None, world_path=None) -> list:
+    """re-run a recording headless at its fixed timestep, as fast as it goes.
+    returns the (frame, step, render, collision) seconds of every frame, which
+    are also written to trace as CSV if it's given. adaptive quality is off so
+    every run draws the same thing however fast the machine is"""
+    with open(path) as f:
+        header = json.loads(f.readline())
+        frames = [json.loads(line) for line in f if line.strip()]
+    if world_path is None:
+        world_path = os.path.join(os.path.dirname(path), header["world"])
+
+    pygame.font.init()  # the debug overlay is part of the frame
+    assets = AssetRegistry()
+    world = World.load(world_path, assets)
+    assets.wait()
+    surface = pygame.Surface(header["size"])
+    game = Game(world, surface, assets, headless=True, dt=header["dt"])
+    game.options.adaptive_quality = False
+
+    rows = []
+    for i, frame in enumerate(frames):
+        start = time.perf_counter()
+        game.step(frame)
+        took = time.perf_counter() - start
+        rows.append((i, took, game.screen.render_time, game.collision_time))
+        if not game.running:
+            break
+
+    if trace is not None:
+        with open(trace, "w") as f:
+            f.write("frame,step,render,collision\n")
+            f.writelines(f"{i},{a:.6f},{b:.6f},{c:.6f}\n" for i, a, b, c in rows)
+    steps = sorted(row[1] for row in rows)
+    if steps:
+        print(
+            f"{len(rows)} frames, step mean {sum(steps) / len(steps) * 1000:.1f} ms, "
+            f"p95 {steps[int(len(steps) * 0.95)] * 1000:.1f} ms, "
+            f"max {steps[-1] * 1000:.1f} ms, "
+            f"collision {sum(row[3] for row in rows) * 1000:.0f} ms total"
+        )
+    return rows
+
+
+def main(argv=None):
+    """run the game, or replay a recording of it"""
+    parser = argparse.ArgumentParser(description="3D thingies")
+    parser.add_argument("--world", help="a world saved with World.save to play in")
+    parser.add_argument(
+        "--record", metavar="FILE", help="record the input, saving the world too"
+    )
+    parser.add_argument(
+        "--replay", metavar="FILE", help="replay a recording headless and quit"
+    )
+    parser.add_argument(
+        "--trace", metavar="FILE", help="per frame timings of --replay, as CSV"
+    )
+    args = parser.parse_args(argv)
+    if args.replay:
+        replay(args.replay, args.trace, args.world)
+        return
+
+    screen_surf = open_display()
+    pygame.display.set_caption("3D thingies")
+    pygame.mouse.set_visible(False)
+    pygame.event.set_grab(True)
+    clock = pygame.time.Clock()
+
+    assets = AssetRegistry()
+    if args.world:
+        world = World.load(args.world, assets)
+    else:
+        world = build_demo_world(assets)
+    game = Game(world, screen_surf, assets)
+    recorder = None
+    if args.record:
+        # replays start from the world as it was, not as the session left it
+        world_path = args.world or os.path.splitext(args.record)[0] + ".world.json"
+        if not args.world:
+            world.save(world_path)
+        recorder = InputRecorder(args.record, game, world_path)
+
+    try:
+        while game.running:
+            frame = read_input()
+            if recorder is not None:
+                recorder.record(frame)
+            game.step(frame)
+            pygame.display.flip()
+            clock.tick(30)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,677 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
 import numpy as np
 
+# line kinds for _classify_lines
+_OTHER, _V, _VT, _VN, _F, _INDENTED = range(6)
+_LEADING_SPACE_RE = re.compile(rb"^[ \t]+", re.M)
+_TWO_SLASHES_RE = re.compile(rb"/[^\s/]*/")  # a v/vt/vn or v//vn corner
+
+# compiled mesh files, see save_mesh
+MESH_MAGIC = b"MCPYMESH"
+MESH_VERSION = 4
+MESH_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".meshcache")
+_MESH_ALIGN = 64
+
+
+class ObjMesh:
+    """Triangulated OBJ data as NumPy arrays"""
+
+    def __init__(
+        self,
+        vertices,
+        texcoords,
+        normals,
+        faces,
+        face_texcoords,
+        face_normals,
+        polygons,
+        materials=None,
+        material_names=(),
+    ):
+        self.vertices = vertices  # (n, 3) float
+        self.texcoords = texcoords  # (t, 2) float
+        self.normals = normals  # (m, 3) float
+        self.faces = faces  # (f, 3) vertex indices per triangle
+        self.face_texcoords = face_texcoords  # (f, 3) texcoord indices, -1 if none
+        self.face_normals = face_normals  # (f, 3) normal indices, -1 if none
+        self.polygons = polygons  # (f,) which source polygon each triangle is from
+        if materials is None:
+            materials = np.full(len(faces), -1, dtype=np.int64)
+        self.materials = materials  # (f,) index into material_names, -1 if none
+        self.material_names = list(material_names)
+
+
+def _classify_lines(data):
+    """find the start/end of every line and what kind of OBJ line it is,
+    without looping over lines in python"""
+    arr = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(arr == 10)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(arr)]))
+
+    # first three bytes of each line (zero past the end of the data)
+    padded = np.zeros(len(arr) + 3, dtype=np.uint8)
+    padded[: len(arr)] = arr
+    c0, c1, c2 = padded[starts], padded[starts + 1], padded[starts + 2]
+    space1 = (c1 == 32) | (c1 == 9)
+    space2 = (c2 == 32) | (c2 == 9)
+
+    kind = np.full(len(starts), _OTHER, dtype=np.int8)
+    kind[(c0 == 32) | (c0 == 9)] = _INDENTED
+    is_v = c0 == ord("v")
+    kind[is_v & space1] = _V
+    kind[is_v & (c1 == ord("t")) & space2] = _VT
+    kind[is_v & (c1 == ord("n")) & space2] = _VN
+    kind[(c0 == ord("f")) & space1] = _F
+    return starts, ends, kind
+
+
+def _gather(data, starts, ends, kind, which, prefix):
+    """join all lines of one kind (one slice per run of consecutive lines)
+    with their prefix blanked out, one line per row"""
+    change = np.flatnonzero(np.diff(kind)) + 1
+    run_first = np.concatenate(([0], change))
+    run_last = np.concatenate((change, [len(kind)])) - 1
+    keep = kind[run_first] == which
+    text = b"\n".join(
+        data[starts[a] : ends[b]]
+        for a, b in zip(run_first[keep].tolist(), run_last[keep].tolist())
+    )
+    return text.replace(prefix, b" " * len(prefix)) + b"\n"
+
+
+def _tokens_per_line(text, nlines):
+    """count whitespace separated tokens on each line of text"""
+    arr = np.frombuffer(text, dtype=np.uint8)
+    is_space = (arr == 32) | (arr == 9) | (arr == 13) | (arr == 10)
+    token_starts = np.flatnonzero(~is_space[1:] & is_space[:-1]) + 1
+    if len(arr) and not is_space[0]:
+        token_starts = np.concatenate(([0], token_starts))
+    # every line ends in a newline, count the token starts before each one
+    before_newline = np.searchsorted(token_starts, np.flatnonzero(arr == 10))
+    return np.diff(before_newline[:nlines], prepend=0)
+
+
+def _parse_rows(text, nlines, width):
+    """parse lines of numbers into an (nlines, width) float array, dropping
+    extra columns (like w or vertex colors) and zero filling missing ones"""
+    out = np.zeros((nlines, width))
+    if nlines == 0:
+        return out
+    flat = np.fromstring(text, sep=" ")
+    counts = _tokens_per_line(text, nlines)
+    if len(flat) == counts[0] * nlines and (counts == counts[0]).all():
+        k = min(width, counts[0])
+        out[:, :k] = flat.reshape(nlines, counts[0])[:, :k]
+    else:
+        row = np.repeat(np.arange(nlines), counts)
+        col = np.arange(len(flat)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keep = col < width
+        out[row[keep], col[keep]] = flat[keep]
+    return out
+
+
+def _parse_face_indices(text, nlines):
+    """parse face lines into per-corner (v, vt, vn) index columns (1-based,
+    0 for missing) and the number of corners on each line"""
+    counts = _tokens_per_line(text, nlines)
+
+    # v, v/vt, v//vn and v/vt/vn all become up to three numbers per corner
+    ntok = int(counts.sum())
+    text = text.replace(b"//", b"/0/")
+    nums = np.fromstring(text.replace(b"/", b" "), dtype=np.int64, sep=" ")
+    cols = np.zeros((ntok, 3), dtype=np.int64)
+    if len(nums) == ntok:
+        cols[:, 0] = nums
+    elif len(nums) == 3 * ntok:
+        cols[:] = nums.reshape(ntok, 3)
+    elif len(nums) == 2 * ntok and not _TWO_SLASHES_RE.search(text):
+        # every corner has one or two numbers, so two each means all v/vt,
+        # not a mix of v and v/vt/vn
+        cols[:, :2] = nums.reshape(ntok, 2)
+    else:  # mixed syntax in one file, do it the slow way
+        for i, tok in enumerate(text.split()):
+            for j, part in enumerate(tok.split(b"/")[:3]):
+                if part:
+                    cols[i, j] = int(part)
+    return cols, counts
+
+
+def _resolve(idx, counts_before, total):
+    """turn 1-based (or negative, relative) OBJ indices into 0-based, -1 if missing"""
+    out = idx - 1
+    neg = idx < 0
+    if neg.any():
+        out[neg] = counts_before[neg] + idx[neg]
+        if (out[neg] < 0).any():  # would otherwise read as missing
+            raise ValueError("OBJ face references an element that doesn't exist")
+    out[idx == 0] = -1
+    if (out >= total).any() or (out < -1).any():
+        raise ValueError("OBJ face references an element that doesn't exist")
+    return out
+
+
+def _face_materials(data, starts, ends, kind):
+    """find the usemtl in effect for every face line.
+    returns (per-face material index, -1 if none, material names)"""
+    arr = np.frombuffer(data, dtype=np.uint8)
+    first = arr[np.minimum(starts, len(arr) - 1)]
+    lines, ids, names = [], [], {}
+    # usemtl lines are rare, so only those are looked at in python
+    for i in np.flatnonzero((kind == _OTHER) & (first == ord("u"))).tolist():
+        words = bytes(data[starts[i] : ends[i]]).split()
+        if len(words) > 1 and words[0] == b"usemtl":
+            name = b" ".join(words[1:]).decode(errors="replace")
+            lines.append(i)
+            ids.append(names.setdefault(name, len(names)))
+    ids = np.array(ids + [-1], dtype=np.int64)
+    after = np.searchsorted(np.array(lines, dtype=np.int64), np.flatnonzero(kind == _F))
+    return ids[after - 1], list(names)
+
+
+def parse_obj_bytes(data) -> ObjMesh:
+    """parse OBJ data from bytes (or an mmap) into triangulated NumPy arrays.
+    handles v, v/vt, v//vn and v/vt/vn faces, negative indices and n-gons"""
+    starts, ends, kind = _classify_lines(data)
+    if (kind == _INDENTED).any():
+        data = _LEADING_SPACE_RE.sub(b"", data)  # rare, costs a copy
+        starts, ends, kind = _classify_lines(data)
+
+    counts_of = np.bincount(kind, minlength=6)
+    nv, nvt, nvn, nf = (int(counts_of[k]) for k in (_V, _VT, _VN, _F))
+    vertices = _parse_rows(_gather(data, starts, ends, kind, _V, b"v"), nv, 3)
+    texcoords = _parse_rows(_gather(data, starts, ends, kind, _VT, b"vt"), nvt, 2)
+    normals = _parse_rows(_gather(data, starts, ends, kind, _VN, b"vn"), nvn, 3)
+    if nf == 0:
+        empty = np.zeros((0, 3), dtype=np.int64)
+        return ObjMesh(
+            vertices, texcoords, normals, empty, empty, empty, np.zeros(0, np.int64)
+        )
+
+    cols, counts = _parse_face_indices(_gather(data, starts, ends, kind, _F, b"f"), nf)
+    if (counts < 3).any():
+        raise ValueError("OBJ face with fewer than 3 vertices")
+
+    # negative indices are relative to how many elements came before the face
+    before = [None] * 3
+    if (cols < 0).any():
+        is_face = kind == _F
+        for j, which in enumerate((_V, _VT, _VN)):
+            seen = np.cumsum(kind == which)[is_face]
+            before[j] = np.repeat(seen, counts)
+    materials, material_names = _face_materials(data, starts, ends, kind)
+    v = _resolve(cols[:, 0], before[0], nv)
+    vt = _resolve(cols[:, 1], before[1], nvt)
+    vn = _resolve(cols[:, 2], before[2], nvn)
+
+    # fan triangulate: corners (0, i, i + 1) of each polygon
+    first = np.cumsum(counts) - counts
+    ntris = counts - 2
+    polygons = np.repeat(np.arange(nf), ntris)
+    within = np.arange(int(ntris.sum())) - np.repeat(np.cumsum(ntris) - ntris, ntris)
+    base = first[polygons]
+    corners = np.stack([base, base + within + 1, base + within + 2], axis=1)
+    return ObjMesh(
+        vertices,
+        texcoords,
+        normals,
+        v[corners],
+        vt[corners],
+        vn[corners],
+        polygons,
+        materials[polygons],
+        material_names,
+    )
+
+
+def load_obj(path) -> ObjMesh:
+    """load an OBJ file, mmapped so it is read in bulk rather than line by line"""
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            data = b""
+        try:
+            return parse_obj_bytes(data)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
 
 def parse_obj_data(obj_data):
-    vertices = []
-    normals = []
-    faces = []
-
-    for line in obj_data.splitlines():
-        line = line.strip()
-
-        if line.startswith("v "):
-            parts = line.split()
-            vertices.append([float(parts[1]), float(parts[2]), float(parts[3])])
-
-        elif line.startswith("vn "):
-            parts = line.split()
-            normals.append([float(parts[1]), float(parts[2]), float(parts[3])])
-
-        elif line.startswith("f "):
-            parts = line.split()
-            face_vertices = []
-            face_normals = []
-
-            for part in parts[1:]:
-                v_n = part.split("//")
-                vertex_index = int(v_n[0]) - 1  # Convert to 0-based index
-                normal_index = int(v_n[1]) - 1  # Convert to 0-based index
-                face_vertices.append(vertex_index)
-                face_normals.append(normal_index)
-
-            faces.append((face_vertices, face_normals))
-
-    return vertices, normals, faces
-
-
-def reorder_faces_counterclockwise(vertices, faces):
-    # ccw vertex ordering for normal vectors left-hand rule
-    def cross_product(v1, v2, v3):
-        edge1 = np.array(v2) - np.array(v1)
-        edge2 = np.array(v3) - np.array(v1)
-        return np.cross(edge1, edge2)
-
-    def is_counterclockwise(v1, v2, v3):
-        cp = cross_product(v1, v2, v3)
-        return cp[2] > 0  # Z component should be positive for ccw
-
-    ordered_faces = []
-    for face in faces:
-        face_vertices = face[0]
-        v1, v2, v3 = (
-            vertices[face_vertices[0]],
-            vertices[face_vertices[1]],
-            vertices[face_vertices[2]],
+    """parse OBJ text into lists of vertices, normals and (vertex indices,
+    normal indices) faces, as used by format_obj_data"""
+    mesh = parse_obj_bytes(obj_data.encode())
+    faces = [
+        (face.tolist(), normal.tolist())
+        for face, normal in zip(mesh.faces, mesh.face_normals)
+    ]
+    return mesh.vertices.tolist(), mesh.normals.tolist(), faces
+
+
+def orient_faces(vertices, faces, face_normals=None, normals=None):
+    """wind faces so vec 0->1 x vec 0->2 points out of the mesh, which is what
+    backface culling expects. faces (and face_normals) are (f, k) index arrays.
+    each face is checked against its OBJ vn normals where it has them, and
+    against the direction from the mesh centroid to the face where it doesn't.
+    returns new (faces, face_normals) arrays"""
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64)
+    if face_normals is None:
+        face_normals = np.full(faces.shape, -1, dtype=np.int64)
+    face_normals = np.asarray(face_normals, dtype=np.int64)
+    if len(faces) == 0:
+        return faces, face_normals
+
+    # np.take is a lot quicker than fancy indexing for big gathers
+    v0 = np.take(vertices, faces[:, 0], axis=0)
+    e1 = np.take(vertices, faces[:, 1], axis=0) - v0
+    e2 = np.take(vertices, faces[:, 2], axis=0) - v0
+    cross = np.empty_like(e1)
+    cross[:, 0] = e1[:, 1] * e2[:, 2] - e1[:, 2] * e2[:, 1]
+    cross[:, 1] = e1[:, 2] * e2[:, 0] - e1[:, 0] * e2[:, 2]
+    cross[:, 2] = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+
+    ref = np.zeros_like(cross)
+    has_vn = np.zeros(len(faces), dtype=bool)
+    if normals is not None and len(normals):
+        normals = np.asarray(normals, dtype=float).reshape(-1, 3)
+        has_vn = (face_normals >= 0).all(axis=1)
+        for k in range(faces.shape[1]):
+            ref += np.take(normals, np.where(has_vn, face_normals[:, k], 0), axis=0)
+    if not has_vn.all():  # outward from the centroid for faces without normals
+        rest = np.flatnonzero(~has_vn)
+        centers = np.zeros((len(rest), 3))
+        for k in range(faces.shape[1]):
+            centers += np.take(vertices, faces[rest, k], axis=0)
+        ref[rest] = centers / faces.shape[1] - vertices.mean(axis=0)
+
+    flip = (cross * ref).sum(axis=1) < 0
+    faces = np.where(flip[:, None], faces[:, ::-1], faces)
+    face_normals = np.where(flip[:, None], face_normals[:, ::-1], face_normals)
+    return faces, face_normals
+
+
+def reorder_faces_counterclockwise(vertices, faces, normals=None):
+    """list version of orient_faces for [(vertex indices, normal indices)]
+    faces, as used by format_obj_data. faces can have any number of sides"""
+    by_len = {}
+    for i, face in enumerate(faces):
+        by_len.setdefault(len(face[0]), []).append(i)
+
+    ordered_faces = list(faces)
+    for idxs in by_len.values():
+        oriented, oriented_normals = orient_faces(
+            vertices,
+            [faces[i][0] for i in idxs],
+            [faces[i][1] for i in idxs],
+            normals,
+        )
+        for i, face, normal in zip(idxs, oriented.tolist(), oriented_normals.tolist()):
+            ordered_faces[i] = (face, normal)
+    return ordered_faces
+
+
+def _pack_rows(rows):
+    """pack rows of three non-negative ints into one int64 each (21 bits per
+    column), falling back to a structured view if they don't fit"""
+    if rows.max(initial=0) < 1 << 21:
+        return (rows[:, 0] << 42) | (rows[:, 1] << 21) | rows[:, 2]
+    rows = np.ascontiguousarray(rows, dtype=np.int64)
+    return rows.view([("", np.int64)] * 3).reshape(-1)
+
+
+def weld_vertices(vertices, faces, tolerance=1e-5):
+    """merge vertices that land in the same `tolerance` sized grid cell, so
+    faces exported with duplicated corners share them again. triangles that
+    collapse are dropped.
+    returns (vertices, faces, kept) where kept is a mask of the input faces"""
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64)
+    if len(vertices) == 0:
+        return vertices, faces, np.ones(len(faces), dtype=bool)
+    cells = np.round((vertices - vertices.min(axis=0)) / tolerance).astype(np.int64)
+    _, first, remap = np.unique(
+        _pack_rows(cells), return_index=True, return_inverse=True
+    )
+    faces = remap.reshape(-1)[faces]
+    kept = np.ones(len(faces), dtype=bool)
+    for a, b in ((0, 1), (1, 2), (2, 0)):
+        kept &= faces[:, a] != faces[:, b]
+    return vertices[first], faces[kept], kept
+
+
+def _is_convex(points, loop, normal, eps):
+    """whether a polygon loop turns the same way as normal at every corner,
+    straight corners allowed"""
+    pts = points[loop]
+    turns = np.cross(pts - np.roll(pts, 1, axis=0), np.roll(pts, -1, axis=0) - pts)
+    return bool((turns @ normal >= -eps).all())
+
+
+def _outline(loops):
+    """the single boundary loop around a patch of polygon loops, or None if the
+    patch has holes, several pieces or anything else odd about it"""
+    edges = {edge for loop in loops for edge in zip(loop, loop[1:] + loop[:1])}
+    outer = [(a, b) for a, b in edges if (b, a) not in edges]
+    after = dict(outer)
+    if not outer or len(after) != len(outer):
+        return None
+    start = outer[0][0]
+    loop = [start]
+    while after[loop[-1]] != start:
+        loop.append(after[loop[-1]])
+        if len(loop) > len(outer):
+            return None
+    return loop if len(loop) == len(outer) else None
+
+
+def _turn(points, p, q, r, normal):
+    """how far a polygon turns towards normal at corner q, in plain python
+    since it's called for one corner at a time"""
+    (px, py, pz), (qx, qy, qz), (rx, ry, rz) = points[p], points[q], points[r]
+    ax, ay, az = qx - px, qy - py, qz - pz
+    bx, by, bz = rx - qx, ry - qy, rz - qz
+    return (
+        (ay * bz - az * by) * normal[0]
+        + (az * bx - ax * bz) * normal[1]
+        + (ax * by - ay * bx) * normal[2]
+    )
+
+
+def _merge_loops(points, loops, normal, eps, max_corners=16):
+    """greedily merge convex polygon loops that share an edge (in opposite
+    directions, so winding is kept) for as long as the result stays convex
+    and has at most max_corners corners. points is the vertices as a list"""
+    owner = {}
+    for i, loop in enumerate(loops):
+        for edge in zip(loop, loop[1:] + loop[:1]):
+            owner[edge] = i
+    for i in range(len(loops)):
+        merged = True
+        while merged and loops[i] is not None:
+            merged = False
+            loop = loops[i]
+            for k, (a, b) in enumerate(zip(loop, loop[1:] + loop[:1])):
+                j = owner.get((b, a))
+                if j is None or j == i:
+                    continue
+                # loop is ... a b ..., the other is ... b a ..., so walk this
+                # one from b round to a then the other from a round to b
+                other = loops[j]
+                m = other.index(b)
+                ours = loop[k + 1 :] + loop[: k + 1]
+                theirs = other[m + 1 :] + other[:m]
+                candidate = ours + theirs[1:]
+                if len(candidate) > max_corners:
+                    continue
+                if len(set(candidate)) != len(candidate):
+                    continue  # would touch itself
+                # both loops were convex, so only the two corners on the
+                # shared edge can have gone concave
+                at = len(ours) - 1
+                after = candidate[(at + 1) % len(candidate)]
+                if (
+                    _turn(points, candidate[-1], b, candidate[1], normal) < -eps
+                    or _turn(points, candidate[at - 1], a, after, normal) < -eps
+                ):
+                    continue
+                del owner[a, b], owner[b, a]
+                for edge in zip(other, other[1:] + other[:1]):
+                    if edge in owner:
+                        owner[edge] = i
+                loops[i], loops[j] = candidate, None
+                merged = True
+                break
+    return [loop for loop in loops if loop is not None]
+
+
+def _drop_straight_corners(points, loop, normal, eps):
+    """remove corners a polygon goes straight through, so any three corners in
+    a row span the face"""
+    pts = points[loop]
+    turns = np.cross(pts - np.roll(pts, 1, axis=0), np.roll(pts, -1, axis=0) - pts)
+    keep = np.abs(turns @ normal) > eps
+    if keep.sum() < 3:
+        return loop
+    return [v for v, k in zip(loop, keep.tolist()) if k]
+
+
+def merge_coplanar_faces(vertices, faces, materials=None, tolerance=1e-4):
+    """merge adjacent triangles that lie in the same plane and share a material
+    into larger convex polygons, keeping their winding. faces should already
+    be welded (see weld_vertices) so neighbours share vertex indices.
+    returns (indices, offsets): polygon i is indices[offsets[i]:offsets[i + 1]]"""
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if materials is None:
+        materials = np.full(len(faces), -1, dtype=np.int64)
+    v0 = np.take(vertices, faces[:, 0], axis=0)
+    cross = np.cross(
+        np.take(vertices, faces[:, 1], axis=0) - v0,
+        np.take(vertices, faces[:, 2], axis=0) - v0,
+    )
+    length = np.linalg.norm(cross, axis=1, keepdims=True)
+    normal = cross / np.where(length == 0, 1, length)
+    offset = (normal * v0).sum(axis=1)
+
+    # one group per (material, plane), sorted so each group is a run
+    key = np.column_stack(
+        [materials, np.round(normal / tolerance), np.round(offset / tolerance)]
+    ).astype(np.int64)
+    order = np.lexsort(key.T[::-1])
+    starts = np.flatnonzero(
+        np.concatenate(([True], (np.diff(key[order], axis=0) != 0).any(axis=1)))
+    )
+    sizes = np.diff(np.append(starts, len(order)))
+
+    # triangles alone in their plane (most of a curved mesh) stay as they are
+    alone = order[starts[sizes == 1]]
+    alone = alone[np.argsort(alone)]
+    polygons = []
+    eps = tolerance * tolerance
+    points = None
+    for start, size in zip(starts[sizes > 1].tolist(), sizes[sizes > 1].tolist()):
+        rows = np.sort(order[start : start + size])
+        n = normal[rows[0]]
+        loops = faces[rows].tolist()
+        if not n.any():  # degenerate triangles have no plane to merge in
+            polygons.extend(loops)
+            continue
+        # a whole flat patch with a convex outline (box sides, flat ground)
+        # becomes one polygon without any searching
+        outline = _outline(loops)
+        if outline is not None:
+            outline = _drop_straight_corners(vertices, outline, n, eps)
+            if _is_convex(vertices, outline, n, eps):
+                polygons.append(outline)
+                continue
+        if points is None:
+            points = vertices.tolist()
+        polygons.extend(
+            _drop_straight_corners(vertices, loop, n, eps)
+            for loop in _merge_loops(points, loops, n.tolist(), eps)
+        )
+
+    sizes = np.concatenate(
+        [np.full(len(alone), 3), np.array([len(p) for p in polygons], dtype=np.int64)]
+    )
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    indices = np.concatenate(
+        [
+            faces[alone].reshape(-1),
+            np.array([v for p in polygons for v in p], dtype=np.int64),
+        ]
+    )
+    return indices, offsets
+
+
+def cluster_vertices(vertices, faces, face_normals, cell_size):
+    """simplify a triangle mesh by merging every vertex in the same grid cell
+    into one (vertex clustering). triangles that collapse or end up duplicated
+    are dropped, the rest keep their winding.
+    returns (vertices, faces, face_normals)"""
+    vertices = np.asarray(vertices, dtype=float)
+    cells = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+    # one int key per cell is a lot faster to unique than rows
+    _, cluster, sizes = np.unique(
+        _pack_rows(cells), return_inverse=True, return_counts=True
+    )
+    cluster = cluster.reshape(-1)
+    merged = np.zeros((len(sizes), 3))
+    for k in range(3):
+        merged[:, k] = np.bincount(cluster, weights=vertices[:, k]) / sizes
+
+    tris = cluster[faces]
+    keep = (
+        (tris[:, 0] != tris[:, 1])
+        & (tris[:, 1] != tris[:, 2])
+        & (tris[:, 0] != tris[:, 2])
+    )
+    tris, face_normals = tris[keep], face_normals[keep]
+    _, first = np.unique(_pack_rows(np.sort(tris, axis=1)), return_index=True)
+    first.sort()
+    tris, face_normals = tris[first], face_normals[first]
+
+    # drop clusters no triangle uses any more
+    used, tris = np.unique(tris, return_inverse=True)
+    return merged[used], tris.reshape(-1, 3), face_normals
+
+
+def build_lods(vertices, faces, face_normals, levels=3, resolution=32):
+    """make up to `levels` simplified versions of a mesh, each clustered on a
+    grid half as fine as the last, starting at `resolution` cells across the
+    mesh's longest side. levels that don't save at least a fifth of the
+    triangles of the previous one are skipped.
+    returns a list of (vertices, faces, face_normals)"""
+    vertices = np.asarray(vertices, dtype=float)
+    if len(faces) == 0:
+        return []
+    size = (vertices.max(axis=0) - vertices.min(axis=0)).max()
+    if size == 0:
+        return []
+    lods = []
+    previous = len(faces)
+    for i in range(levels):
+        lod = cluster_vertices(
+            vertices, faces, face_normals, size / (resolution / 2**i)
         )
+        if len(lod[1]) == 0:
+            break
+        if len(lod[1]) <= previous * 0.8:
+            lods.append(lod)
+            previous = len(lod[1])
+    return lods
+
 
-        # reverse if not ccw
-        if is_counterclockwise(v1, v2, v3):
-            ordered_faces.append(face)
+def build_mesh_arrays(mesh: ObjMesh, weld_tolerance=1e-5) -> dict:
+    """turn a parsed OBJ into the arrays a compiled mesh stores. vertices are
+    welded and coplanar triangles merged into the polygon_* arrays, which is
+    what gets drawn at full detail; the triangles are kept for the LODs"""
+    faces, face_normals = orient_faces(
+        mesh.vertices, mesh.faces, mesh.face_normals, mesh.normals
+    )
+    vertices, faces, kept = weld_vertices(mesh.vertices, faces, weld_tolerance)
+    face_normals = face_normals[kept]
+    polygon_indices, polygon_offsets = merge_coplanar_faces(
+        vertices, faces, mesh.materials[kept]
+    )
+    if len(vertices):
+        bounds = np.stack([vertices.min(axis=0), vertices.max(axis=0)])
+    else:
+        bounds = np.zeros((2, 3))
+    arrays = {
+        "vertices": vertices.astype(np.float32),
+        "normals": mesh.normals.astype(np.float32),
+        "faces": faces.astype(np.int32).reshape(-1, 3),
+        "face_normals": face_normals.astype(np.int32).reshape(-1, 3),
+        "polygon_indices": polygon_indices.astype(np.int32),
+        "polygon_offsets": polygon_offsets.astype(np.int32),
+        "bounds": bounds.astype(np.float32),
+    }
+    lods = build_lods(vertices, faces, face_normals)
+    for i, (lod_vertices, lod_faces, lod_normals) in enumerate(lods, start=1):
+        arrays[f"lod{i}_vertices"] = lod_vertices.astype(np.float32)
+        arrays[f"lod{i}_faces"] = lod_faces.astype(np.int32)
+        arrays[f"lod{i}_face_normals"] = lod_normals.astype(np.int32)
+    return arrays
+
+
+def _align(n):
+    return -(-n // _MESH_ALIGN) * _MESH_ALIGN
+
+
+def save_mesh(path, arrays: dict):
+    """write named arrays as a compiled mesh: magic, version, a json header of
+    array layouts, then the raw arrays, each aligned so they can be mmapped"""
+    layout = {}
+    offset = 0
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+    for name, arr in arrays.items():
+        layout[name] = {"dtype": arr.dtype.str, "shape": arr.shape, "offset": offset}
+        offset += _align(arr.nbytes)
+    header = json.dumps(layout).encode()
+    start = _align(len(MESH_MAGIC) + 8 + len(header))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MESH_MAGIC)
+        f.write(struct.pack("<II", MESH_VERSION, len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(start + layout[name]["offset"])
+            f.write(arr.tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)  # so readers never see a half written file
+
+
+def load_mesh(path) -> dict:
+    """load a compiled mesh as read-only arrays backed by an mmap of the file,
+    so nothing is parsed or copied until the data is actually touched"""
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[: len(MESH_MAGIC)] != MESH_MAGIC:
+        raise ValueError(f"{path} is not a compiled mesh")
+    pos = len(MESH_MAGIC)
+    version, header_len = struct.unpack("<II", data[pos : pos + 8])
+    if version != MESH_VERSION:
+        raise ValueError(f"{path} is mesh version {version}, expected {MESH_VERSION}")
+    layout = json.loads(data[pos + 8 : pos + 8 + header_len])
+    start = _align(pos + 8 + header_len)
+
+    arrays = {}
+    for name, info in layout.items():
+        dtype = np.dtype(info["dtype"])
+        shape = tuple(info["shape"])
+        count = int(np.prod(shape))
+        if count == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
         else:
-            ordered_faces.append((face_vertices[::-1], face[1][::-1]))
+            arrays[name] = np.frombuffer(
+                data, dtype=dtype, count=count, offset=start + info["offset"]
+            ).reshape(shape)
+    return arrays
 
-    return ordered_faces
+
+def compile_obj(path, cache_dir=MESH_CACHE_DIR) -> str:
+    """compile an OBJ file into the mesh cache if it isn't there already and
+    return the compiled file's path. files are keyed by a hash of their
+    contents, so editing the OBJ makes a new entry instead of a stale hit"""
+    with open(path, "rb") as f:
+        data = f.read()
+    key = hashlib.sha256(b"%d:" % MESH_VERSION + data).hexdigest()
+    out = os.path.join(cache_dir, key + ".mesh")
+    if not os.path.exists(out):
+        os.makedirs(cache_dir, exist_ok=True)
+        save_mesh(out, build_mesh_arrays(parse_obj_bytes(data)))
+    return out
 
 
 def format_obj_data(vertices, normals, faces):
@@ -246,7 +857,7 @@ f 34//19 32//19 30//19
     vertices, normals, faces = parse_obj_data(obj_data)
 
     # Step 2: Reorder the faces to ccw winding order
-    ordered_faces = reorder_faces_counterclockwise(vertices, faces)
+    ordered_faces = reorder_faces_counterclockwise(vertices, faces, normals)
 
     # Step 3: Format as string
     formatted_obj_data = format_obj_data(vertices, normals, ordered_faces)
@@ -256,4 +867,8 @@ f 34//19 32//19 30//19
 
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:  # compile the given OBJ files into the mesh cache
+        for obj_path in sys.argv[1:]:
+            print(f"{obj_path} -> {compile_obj(obj_path)}")
+    else:
+        main()
@@ -0,0 +1,392 @@
+"""Authoritative game server and a headless bot client to load test it.
+
+The server owns the World and its entities and runs the simulation at a fixed
+tick rate. Clients only send their input. Every tick each client gets a
+binary snapshot of the entities near its player, as a delta against the last
+snapshot it acknowledged.
+
+Run a server with `python server.py serve`, and connect bots to it with
+`python server.py bots --clients 16`. `python bench.py server` does both and
+reports bytes per tick and tick latency as the client count grows.
+
+Every message is framed as a uint32 length then the payload, which starts
+with a message type byte. Numbers are little endian.
+
+    HELLO     client -> server  spawn x, z (float32)
+    WELCOME   server -> client  player entity id (uint64), tick rate (uint16)
+    INPUT     client -> server  acked tick (uint32), forward, right, yaw and
+                                pitch turn (float32), flags (uint8)
+    SNAPSHOT  server -> client  tick, base tick (uint32, 0 for none), sent
+                                time (float64), changed and removed counts
+                                (uint16), then the changes and removed ids
+
+A change is an entity id (uint64) and a mask of what follows: position
+(3 float32), rotation (yaw and pitch quantized to int16) and, for entities
+new to the client, their kind (uint8).
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import struct
+import time
+
+import minecrafttest as mc
+
+HELLO, WELCOME, INPUT, SNAPSHOT = range(1, 5)
+
+_LENGTH = struct.Struct("<I")
+_HELLO = struct.Struct("<Bff")
+_WELCOME = struct.Struct("<BQH")
+_INPUT = struct.Struct("<BIffffB")
+_SNAPSHOT = struct.Struct("<BIIdHH")
+_CHANGE = struct.Struct("<QB")
+_ID = struct.Struct("<Q")
+_POS = struct.Struct("<fff")
+_ROT = struct.Struct("<hh")
+
+# change mask bits
+_MOVED, _TURNED, _SPAWNED = 1, 2, 4
+JUMP = 1  # input flags
+
+KINDS = [mc.Entity, mc.Player]  # most specific last
+HISTORY = 64  # snapshots kept per client waiting for an ack
+
+
+def frame(payload: bytes) -> bytes:
+    return _LENGTH.pack(len(payload)) + payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> bytes:
+    (n,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(n)
+
+
+def entity_state(entity: mc.Entity) -> tuple:
+    """what a snapshot says about an entity, packed, so states can be compared
+    as sent instead of float by float"""
+    kind = max(i for i, k in enumerate(KINDS) if isinstance(entity, k))
+    rot = _ROT.pack(
+        round(entity.yaw % 360 * 32767 / 360), round(entity.pitch * 32767 / 90)
+    )
+    return (_POS.pack(*entity.pos.get()), rot, kind)
+
+
+def encode_snapshot(tick, base_tick, base: dict, state: dict, sent: float) -> bytes:
+    """a snapshot of state (entity id -> entity_state) as a delta against
+    base, the state of base_tick"""
+    changes = []
+    count = 0
+    for eid, (pos, rot, kind) in state.items():
+        old = base.get(eid)
+        if old is None:
+            mask = _MOVED | _TURNED | _SPAWNED
+        else:
+            mask = (_MOVED if pos != old[0] else 0) | (_TURNED if rot != old[1] else 0)
+        if not mask:
+            continue
+        count += 1
+        changes.append(_CHANGE.pack(eid, mask))
+        if mask & _MOVED:
+            changes.append(pos)
+        if mask & _TURNED:
+            changes.append(rot)
+        if mask & _SPAWNED:
+            changes.append(bytes((kind,)))
+    removed = [_ID.pack(eid) for eid in base if eid not in state]
+    head = _SNAPSHOT.pack(SNAPSHOT, tick, base_tick, sent, count, len(removed))
+    return b"".join([head, *changes, *removed])
+
+
+def decode_snapshot(payload: bytes, history: dict) -> tuple:
+    """read a snapshot, applying it to the state of its base tick from
+    history (tick -> state). returns (tick, base tick, sent time, state)"""
+    _, tick, base_tick, sent, count, removed = _SNAPSHOT.unpack_from(payload)
+    state = dict(history.get(base_tick, {})) if base_tick else {}
+    at = _SNAPSHOT.size
+    for _ in range(count):
+        eid, mask = _CHANGE.unpack_from(payload, at)
+        at += _CHANGE.size
+        pos, rot, kind = state.get(eid, (None, None, 0))
+        if mask & _MOVED:
+            pos = payload[at : at + _POS.size]
+            at += _POS.size
+        if mask & _TURNED:
+            rot = payload[at : at + _ROT.size]
+            at += _ROT.size
+        if mask & _SPAWNED:
+            kind = payload[at]
+            at += 1
+        state[eid] = (pos, rot, kind)
+    for _ in range(removed):
+        (eid,) = _ID.unpack_from(payload, at)
+        at += _ID.size
+        state.pop(eid, None)
+    return tick, base_tick, sent, state
+
+
+def flat_world(size=64) -> mc.World:
+    """a size x size floor at y = 0 centered on the origin"""
+    world = mc.World()
+    half = size // 2
+    for x in range(-half, size - half):
+        for z in range(-half, size - half):
+            world.set_block(mc.Block(mc.Coordinate(x, 0, z), (112, 168, 101)))
+    return world
+
+
+class ClientState:
+    """A connected client as the server sees it"""
+
+    def __init__(self, writer: asyncio.StreamWriter, player: mc.Player):
+        self.writer = writer
+        self.player = player
+        self.forward = self.right = 0.0  # held movement, applied every tick
+        self.turn = [0.0, 0.0]  # yaw and pitch turned since the last tick
+        self.flags = 0
+        self.acked = 0  # last snapshot tick the client has
+        self.sent = {}  # tick -> state sent, until acked or too old
+
+
+class GameServer:
+    """Runs the world at tick_rate and streams it to every connected client.
+    clients only hear about entities within interest_radius of their player"""
+
+    def __init__(self, world: mc.World, tick_rate=20, interest_radius=32.0):
+        self.world = world
+        self.tick_rate = tick_rate
+        self.interest_radius = interest_radius
+        self.clients = []
+        self.tick = 0
+        self.tick_time = 0  # seconds the last tick took to simulate and send
+        self.max_buffer = 2**20  # skip clients with this much still unsent
+
+    async def start(self, host="127.0.0.1", port=25566) -> asyncio.Server:
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def run(self, host="127.0.0.1", port=25566):
+        server = await self.start(host, port)
+        # only once it's listening, bench.py waits for this line. port 0
+        # picks a free port, so print the one actually bound
+        host, port = server.sockets[0].getsockname()[:2]
+        print(f"serving on {host}:{port}", flush=True)
+        async with server:
+            await self.run_ticks()
+
+    async def run_ticks(self, count=None):
+        """tick at the tick rate, forever or count times"""
+        due = time.monotonic()
+        while count is None or self.tick < count:
+            due += 1 / self.tick_rate
+            self.step()
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+
+    async def _handle(self, reader, writer):
+        client = None
+        try:
+            while True:
+                msg = await read_message(reader)
+                if msg[0] == HELLO and client is None:
+                    _, x, z = _HELLO.unpack(msg)
+                    y = self.world.get_ground(x, z)
+                    if y is None:  # off the edge of the world, drop in
+                        y = 2
+                    player = mc.Player(mc.Coordinate(x, y, z), self.world)
+                    self.world.add_entity(player)
+                    client = ClientState(writer, player)
+                    self.clients.append(client)
+                    writer.write(
+                        frame(_WELCOME.pack(WELCOME, player.id, self.tick_rate))
+                    )
+                elif msg[0] == INPUT and client is not None:
+                    _, acked, forward, right, dyaw, dpitch, flags = _INPUT.unpack(msg)
+                    if acked > client.acked and acked in client.sent:
+                        client.acked = acked
+                        for tick in [t for t in client.sent if t < acked]:
+                            del client.sent[tick]
+                    client.forward, client.right, client.flags = forward, right, flags
+                    client.turn[0] += dyaw
+                    client.turn[1] += dpitch
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if client is not None:
+                self.clients.remove(client)
+                self.world.remove_entity(client.player)
+            writer.close()
+
+    def simulate(self):
+        """move every player by its client's input, with gravity"""
+        for client in self.clients:
+            player = client.player
+            player.rotate(*client.turn)
+            client.turn = [0.0, 0.0]
+            if client.forward or client.right:
+                player.walk(client.forward, client.right)
+            player.move(0, 0.1 if client.flags & JUMP else -0.03, 0)
+
+    def get_interest(self) -> dict:
+        """map each client to the entities it should hear about, by bucketing
+        entities into cells the size of the interest radius so each client
+        only checks the 27 cells around it"""
+        r = self.interest_radius
+        cells = {}
+        for entity in self.world.entities.values():
+            key = tuple(math.floor(c / r) for c in entity.pos.get())
+            cells.setdefault(key, []).append(entity)
+        interest = {}
+        for client in self.clients:
+            p = client.player.pos
+            ci, cj, ck = (math.floor(c / r) for c in p.get())
+            near = []
+            for i in (ci - 1, ci, ci + 1):
+                for j in (cj - 1, cj, cj + 1):
+                    for k in (ck - 1, ck, ck + 1):
+                        for entity in cells.get((i, j, k), ()):
+                            d = entity.pos - p
+                            if d.x * d.x + d.y * d.y + d.z * d.z <= r * r:
+                                near.append(entity)
+            interest[client] = near
+        return interest
+
+    def step(self):
+        """run one tick and send everyone their snapshot"""
+        start = time.monotonic()
+        self.tick += 1
+        self.simulate()
+        states = {}  # entity states are shared by every client that sees them
+        for client, near in self.get_interest().items():
+            if client.writer.is_closing():
+                continue
+            if client.writer.transport.get_write_buffer_size() > self.max_buffer:
+                continue  # it can catch up from its last ack later
+            state = {}
+            for entity in near:
+                if entity.id not in states:
+                    states[entity.id] = entity_state(entity)
+                state[entity.id] = states[entity.id]
+            base_tick = client.acked if client.acked in client.sent else 0
+            base = client.sent.get(base_tick, {})
+            client.writer.write(
+                frame(encode_snapshot(self.tick, base_tick, base, state, start))
+            )
+            client.sent[self.tick] = state
+            while len(client.sent) > HISTORY:
+                del client.sent[min(client.sent)]
+        self.tick_time = time.monotonic() - start
+
+
+class BotClient:
+    """A headless client that walks around at random and measures what it
+    receives: bytes per snapshot and how long after the tick started each
+    one arrived"""
+
+    def __init__(self, spawn=(0.0, 0.0), seed=None):
+        self.spawn = spawn
+        self.random = random.Random(seed)
+        self.player_id = None
+        self.history = {}  # tick -> state, from the base of the last snapshot
+        self.state = {}
+        self.received = []  # bytes of each snapshot, with its framing
+        self.latency = []  # seconds from tick start to arrival
+        self.full = 0  # snapshots that weren't deltas
+
+    async def run(self, host, port, ticks):
+        """play for a number of snapshots then disconnect"""
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(frame(_HELLO.pack(HELLO, *self.spawn)))
+        msg = await read_message(reader)
+        _, self.player_id, _ = _WELCOME.unpack(msg)
+        turn = 0.0
+        try:
+            for _ in range(ticks):
+                msg = await read_message(reader)
+                now = time.monotonic()
+                tick, base, sent, self.state = decode_snapshot(msg, self.history)
+                self.received.append(len(msg) + _LENGTH.size)
+                self.latency.append(now - sent)
+                self.full += base == 0
+                self.history[tick] = self.state
+                for old in [t for t in self.history if t < base]:
+                    del self.history[old]
+                if self.random.random() < 0.05:
+                    turn = self.random.uniform(-10, 10)
+                jump = JUMP if self.random.random() < 0.02 else 0
+                writer.write(frame(_INPUT.pack(INPUT, tick, 0.1, 0.0, turn, 0.0, jump)))
+        finally:
+            writer.close()
+
+
+async def run_bots(host, port, clients, ticks, spread=64.0, seed=0) -> list:
+    """connect clients bots spread over a square and run them all for ticks
+    snapshots each"""
+    rng = random.Random(seed)
+    bots = [
+        BotClient(
+            (
+                rng.uniform(-spread / 2, spread / 2),
+                rng.uniform(-spread / 2, spread / 2),
+            ),
+            seed=rng.random(),
+        )
+        for _ in range(clients)
+    ]
+    await asyncio.gather(*(bot.run(host, port, ticks) for bot in bots))
+    return bots
+
+
+def report(bots: list, skip=5) -> dict:
+    """averages over bots, leaving out the first few snapshots while the
+    others are still joining"""
+    sizes = [n for bot in bots for n in bot.received[skip:]]
+    latency = sorted(t for bot in bots for t in bot.latency[skip:])
+    seen = [len(bot.state) for bot in bots]
+    return {
+        "bytes": sum(sizes) / max(len(sizes), 1),
+        "latency": sum(latency) / max(len(latency), 1),
+        "p95": latency[int(len(latency) * 0.95)] if latency else 0.0,
+        "seen": sum(seen) / max(len(seen), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    serve = sub.add_parser("serve", help="run a server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=25566)
+    serve.add_argument("--world", help="a world saved with World.save")
+    serve.add_argument("--floor", type=int, default=64, help="size of the flat world")
+    serve.add_argument("--tick-rate", type=int, default=20)
+    serve.add_argument("--interest", type=float, default=32.0)
+
+    bots = sub.add_parser("bots", help="connect bots to a server and report")
+    bots.add_argument("--host", default="127.0.0.1")
+    bots.add_argument("--port", type=int, default=25566)
+    bots.add_argument("--clients", type=int, default=8)
+    bots.add_argument("--ticks", type=int, default=100)
+    bots.add_argument("--spread", type=float, default=64.0)
+
+    args = parser.parse_args()
+    if args.mode == "serve":
+        world = mc.World.load(args.world) if args.world else flat_world(args.floor)
+        server = GameServer(world, args.tick_rate, args.interest)
+        asyncio.run(server.run(args.host, args.port))
+    else:
+        result = report(
+            asyncio.run(
+                run_bots(args.host, args.port, args.clients, args.ticks, args.spread)
+            )
+        )
+        print(
+            f"{args.clients} clients: {result['bytes']:.0f} B/tick each, "
+            f"latency {result['latency'] * 1000:.1f} ms "
+            f"(p95 {result['p95'] * 1000:.1f} ms), "
+            f"{result['seen']:.1f} entities in view"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+"""Spatial indexes for things that don't sit neatly on the block grid.
+
+Boxes are plain tuples of (x0, y0, z0, x1, y1, z1) so this module doesn't
+depend on the engine classes and can be used from tools and workers.
+"""
+
+import math
+
+
+def union(a: tuple, b: tuple) -> tuple:
+    """smallest box containing both boxes"""
+    return (
+        a[0] if a[0] < b[0] else b[0],
+        a[1] if a[1] < b[1] else b[1],
+        a[2] if a[2] < b[2] else b[2],
+        a[3] if a[3] > b[3] else b[3],
+        a[4] if a[4] > b[4] else b[4],
+        a[5] if a[5] > b[5] else b[5],
+    )
+
+
+def perimeter(box: tuple) -> float:
+    """half the surface area of a box, used as the SAH cost"""
+    dx = box[3] - box[0]
+    dy = box[4] - box[1]
+    dz = box[5] - box[2]
+    return dx * dy + dy * dz + dz * dx
+
+
+def overlaps(a: tuple, b: tuple) -> bool:
+    """whether two boxes overlap (touching counts)"""
+    return (
+        a[0] <= b[3]
+        and b[0] <= a[3]
+        and a[1] <= b[4]
+        and b[1] <= a[4]
+        and a[2] <= b[5]
+        and b[2] <= a[5]
+    )
+
+
+def contains(outer: tuple, inner: tuple) -> bool:
+    """whether outer fully contains inner"""
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and outer[2] <= inner[2]
+        and inner[3] <= outer[3]
+        and inner[4] <= outer[4]
+        and inner[5] <= outer[5]
+    )
+
+
+def sphere_overlaps(box: tuple, center: tuple, radius: float) -> bool:
+    """whether a box and a sphere overlap"""
+    d = 0.0
+    for i in range(3):
+        c = center[i]
+        if c < box[i]:
+            d += (box[i] - c) ** 2
+        elif c > box[i + 3]:
+            d += (c - box[i + 3]) ** 2
+    return d <= radius * radius
+
+
+def ray_box(origin: tuple, direction: tuple, box: tuple, max_t: float):
+    """slab test, returns the entry t of the ray into the box or None"""
+    tmin = 0.0
+    tmax = max_t
+    for i in range(3):
+        o = origin[i]
+        d = direction[i]
+        lo = box[i]
+        hi = box[i + 3]
+        if d == 0:
+            if o < lo or o > hi:
+                return None
+            continue
+        t1 = (lo - o) / d
+        t2 = (hi - o) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > tmin:
+            tmin = t1
+        if t2 < tmax:
+            tmax = t2
+        if tmin > tmax:
+            return None
+    return tmin
+
+
+def outside_planes(box: tuple, planes) -> bool:
+    """whether a box is fully outside any of the planes (nx, ny, nz, d),
+    where a point p is inside a plane if n.p + d >= 0"""
+    for nx, ny, nz, d in planes:
+        # furthest corner along the plane normal
+        px = box[3] if nx > 0 else box[0]
+        py = box[4] if ny > 0 else box[1]
+        pz = box[5] if nz > 0 else box[2]
+        if nx * px + ny * py + nz * pz + d < 0:
+            return True
+    return False
+
+
+def _descend_cost(child, box: tuple, inherit: float) -> float:
+    """SAH cost of pushing a new leaf box down into child"""
+    grown = perimeter(union(child.box, box))
+    if child.left is None:
+        return grown + inherit
+    return grown - perimeter(child.box) + inherit
+
+
+class _Node:
+    __slots__ = ("box", "tight", "item", "parent", "left", "right", "height")
+
+    def __init__(self, box, item=None, tight=None):
+        self.box = box  # fattened box for leaves, union of children otherwise
+        self.tight = tight  # exact box of the item (leaves only)
+        self.item = item
+        self.parent = None
+        self.left = None
+        self.right = None
+        self.height = 0
+
+    def is_leaf(self):
+        return self.left is None
+
+
+class BVH:
+    """A dynamic bounding volume hierarchy over arbitrary boxes.
+
+    Leaves store a box fattened by `margin` so small movements don't touch
+    the tree, and the tree is kept balanced with AVL-style rotations so
+    insert/remove/update and queries stay O(log n).
+    """
+
+    def __init__(self, margin=0.1):
+        self.root = None
+        self.margin = margin
+        self.leaves = {}  # item -> leaf node
+
+    def __len__(self):
+        return len(self.leaves)
+
+    def __contains__(self, item):
+        return item in self.leaves
+
+    def _fatten(self, box):
+        m = self.margin
+        return (box[0] - m, box[1] - m, box[2] - m, box[3] + m, box[4] + m, box[5] + m)
+
+    def insert(self, item, box: tuple):
+        """add an item with its box, replacing it if already present"""
+        if item in self.leaves:
+            self.remove(item)
+        leaf = _Node(self._fatten(box), item, box)
+        self.leaves[item] = leaf
+        self._insert_leaf(leaf)
+
+    def remove(self, item):
+        """remove an item from the tree if it's there"""
+        leaf = self.leaves.pop(item, None)
+        if leaf is not None:
+            self._remove_leaf(leaf)
+
+    def update(self, item, box: tuple) -> bool:
+        """move an item to a new box, returns True if the tree was changed"""
+        leaf = self.leaves.get(item)
+        if leaf is None:
+            self.insert(item, box)
+            return True
+        leaf.tight = box
+        if contains(leaf.box, box):
+            return False  # still inside the fat box, nothing to do
+        self._remove_leaf(leaf)
+        leaf.box = self._fatten(box)
+        self._insert_leaf(leaf)
+        return True
+
+    def get_box(self, item):
+        """get the exact box an item was stored with"""
+        leaf = self.leaves.get(item)
+        return None if leaf is None else leaf.tight
+
+    def clear(self):
+        self.root = None
+        self.leaves = {}
+
+    # QUERIES
+
+    def query_box(self, box: tuple) -> list:
+        """all items whose box overlaps the given box"""
+        out = []
+        if self.root is None:
+            return out
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not overlaps(node.box, box):
+                continue
+            if node.left is None:
+                if overlaps(node.tight, box):
+                    out.append(node.item)
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        return out
+
+    def query_sphere(self, center: tuple, radius: float) -> list:
+        """all items whose box overlaps the sphere"""
+        out = []
+        if self.root is None:
+            return out
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not sphere_overlaps(node.box, center, radius):
+                continue
+            if node.left is None:
+                if sphere_overlaps(node.tight, center, radius):
+                    out.append(node.item)
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        return out
+
+    def query_planes(self, planes) -> list:
+        """all items whose box isn't fully outside one of the planes (frustum culling)"""
+        out = []
+        if self.root is None:
+            return out
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if outside_planes(node.box, planes):
+                continue
+            if node.left is None:
+                if not outside_planes(node.tight, planes):
+                    out.append(node.item)
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        return out
+
+    def raycast(self, origin: tuple, direction: tuple, max_dist: float) -> list:
+        """all (t, item) hit by the ray within max_dist, nearest first.
+        t is in units of direction, so pass a unit vector to get distances"""
+        out = []
+        if self.root is None:
+            return out
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if ray_box(origin, direction, node.box, max_dist) is None:
+                continue
+            if node.left is None:
+                t = ray_box(origin, direction, node.tight, max_dist)
+                if t is not None:
+                    out.append((t, node.item))
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        out.sort(key=lambda hit: hit[0])
+        return out
+
+    # TREE MAINTENANCE
+
+    def _insert_leaf(self, leaf):
+        if self.root is None:
+            self.root = leaf
+            leaf.parent = None
+            return
+
+        # find the best sibling with the surface area heuristic
+        box = leaf.box
+        node = self.root
+        while node.left is not None:
+            area = perimeter(node.box)
+            combined = perimeter(union(node.box, box))
+            cost = 2 * combined  # cost of making a new parent here
+            inherit = 2 * (combined - area)  # cost pushed down to children
+
+            cost_left = _descend_cost(node.left, box, inherit)
+            cost_right = _descend_cost(node.right, box, inherit)
+            if cost < cost_left and cost < cost_right:
+                break
+            node = node.left if cost_left < cost_right else node.right
+
+        sibling = node
+        old_parent = sibling.parent
+        parent = _Node(union(box, sibling.box))
+        parent.parent = old_parent
+        parent.height = sibling.height + 1
+        if old_parent is None:
+            self.root = parent
+        else:
+            self._replace_child(old_parent, sibling, parent)
+        parent.left = sibling
+        parent.right = leaf
+        sibling.parent = parent
+        leaf.parent = parent
+
+        self._refit(leaf.parent)
+
+    def _remove_leaf(self, leaf):
+        if leaf is self.root:
+            self.root = None
+            return
+        parent = leaf.parent
+        grandparent = parent.parent
+        sibling = parent.left if parent.right is leaf else parent.right
+        leaf.parent = None
+        if grandparent is None:
+            self.root = sibling
+            sibling.parent = None
+        else:
+            self._replace_child(grandparent, parent, sibling)
+            sibling.parent = grandparent
+            self._refit(grandparent)
+
+    def _refit(self, node):
+        """walk up from node fixing boxes and heights, rebalancing on the way"""
+        while node is not None:
+            node = self._balance(node)
+            left, right = node.left, node.right
+            node.height = 1 + max(left.height, right.height)
+            node.box = union(left.box, right.box)
+            node = node.parent
+
+    def _replace_child(self, parent, old, new):
+        if parent.left is old:
+            parent.left = new
+        else:
+            parent.right = new
+
+    def _set_root_or_child(self, parent, old, new):
+        if parent is None:
+            self.root = new
+        else:
+            self._replace_child(parent, old, new)
+
+    def _balance(self, a):
+        """rotate a subtree if its children's heights differ by more than 1"""
+        if a.left is None or a.height < 2:
+            return a
+        b, c = a.left, a.right
+        balance = c.height - b.height
+
+        if balance > 1:  # rotate c up
+            f, g = c.left, c.right
+            c.left = a
+            c.parent = a.parent
+            a.parent = c
+            self._set_root_or_child(c.parent, a, c)
+            if f.height > g.height:
+                c.right = f
+                a.right = g
+                g.parent = a
+                a.box = union(b.box, g.box)
+                c.box = union(a.box, f.box)
+                a.height = 1 + max(b.height, g.height)
+                c.height = 1 + max(a.height, f.height)
+            else:
+                c.right = g
+                a.right = f
+                f.parent = a
+                a.box = union(b.box, f.box)
+                c.box = union(a.box, g.box)
+                a.height = 1 + max(b.height, f.height)
+                c.height = 1 + max(a.height, g.height)
+            return c
+
+        if balance < -1:  # rotate b up
+            d, e = b.left, b.right
+            b.left = a
+            b.parent = a.parent
+            a.parent = b
+            self._set_root_or_child(b.parent, a, b)
+            if d.height > e.height:
+                b.right = d
+                a.left = e
+                e.parent = a
+                a.box = union(c.box, e.box)
+                b.box = union(a.box, d.box)
+                a.height = 1 + max(c.height, e.height)
+                b.height = 1 + max(a.height, d.height)
+            else:
+                b.right = e
+                a.left = d
+                d.parent = a
+                a.box = union(c.box, d.box)
+                b.box = union(a.box, e.box)
+                a.height = 1 + max(c.height, d.height)
+                b.height = 1 + max(a.height, e.height)
+            return b
+
+        return a
+
+
+class SpatialHash:
+    """A uniform grid of buckets over boxes that move a lot, like entities.
+
+    Each item sits in every cell its box touches, so updates only touch the
+    buckets when the box crosses a cell boundary, and pairs() only compares
+    items that share a cell.
+    """
+
+    def __init__(self, cell_size=2.0):
+        self.cell_size = cell_size
+        self.cells = {}  # (i, j, k) -> set of items
+        self.boxes = {}  # item -> box
+        self.ranges = {}  # item -> (i0, j0, k0, i1, j1, k1) cells covered
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, item):
+        return item in self.boxes
+
+    def _range(self, box):
+        s = self.cell_size
+        return (
+            math.floor(box[0] / s),
+            math.floor(box[1] / s),
+            math.floor(box[2] / s),
+            math.floor(box[3] / s),
+            math.floor(box[4] / s),
+            math.floor(box[5] / s),
+        )
+
+    def _keys(self, r):
+        for i in range(r[0], r[3] + 1):
+            for j in range(r[1], r[4] + 1):
+                for k in range(r[2], r[5] + 1):
+                    yield (i, j, k)
+
+    def insert(self, item, box: tuple):
+        """add an item with its box, replacing it if already present"""
+        if item in self.boxes:
+            self.remove(item)
+        r = self._range(box)
+        self.boxes[item] = box
+        self.ranges[item] = r
+        for key in self._keys(r):
+            bucket = self.cells.get(key)
+            if bucket is None:
+                bucket = self.cells[key] = set()
+            bucket.add(item)
+
+    def remove(self, item):
+        """remove an item if it's there"""
+        r = self.ranges.pop(item, None)
+        if r is None:
+            return
+        del self.boxes[item]
+        for key in self._keys(r):
+            bucket = self.cells[key]
+            bucket.discard(item)
+            if not bucket:
+                del self.cells[key]
+
+    def update(self, item, box: tuple):
+        """move an item to a new box, only rebucketing if it changed cells"""
+        r = self.ranges.get(item)
+        if r is None or r != self._range(box):
+            self.insert(item, box)
+        else:
+            self.boxes[item] = box
+
+    def clear(self):
+        self.cells = {}
+        self.boxes = {}
+        self.ranges = {}
+
+    def query_box(self, box: tuple) -> list:
+        """all items whose box overlaps the given box"""
+        found = set()
+        for key in self._keys(self._range(box)):
+            bucket = self.cells.get(key)
+            if bucket:
+                found.update(bucket)
+        return [item for item in found if overlaps(self.boxes[item], box)]
+
+    def query_sphere(self, center: tuple, radius: float) -> list:
+        """all items whose box overlaps the sphere"""
+        box = (
+            center[0] - radius,
+            center[1] - radius,
+            center[2] - radius,
+            center[0] + radius,
+            center[1] + radius,
+            center[2] + radius,
+        )
+        return [
+            item
+            for item in self.query_box(box)
+            if sphere_overlaps(self.boxes[item], center, radius)
+        ]
+
+    def pairs(self) -> list:
+        """all pairs of items whose boxes overlap, each pair once"""
+        out = []
+        boxes, ranges = self.boxes, self.ranges
+        for key, bucket in self.cells.items():
+            if len(bucket) < 2:
+                continue
+            items = list(bucket)
+            for n, a in enumerate(items):
+                ra = ranges[a]
+                for b in items[n + 1 :]:
+                    rb = ranges[b]
+                    # a pair shares several cells when both span more than one,
+                    # only report it from the first cell they share
+                    if key != (
+                        max(ra[0], rb[0]),
+                        max(ra[1], rb[1]),
+                        max(ra[2], rb[2]),
+                    ):
+                        continue
+                    if overlaps(boxes[a], boxes[b]):
+                        out.append((a, b))
+        return out
@@ -0,0 +1,311 @@
+"""Tests for the OBJ loader, run with `python -m pytest`."""
+
+import os
+
+import numpy as np
+import pytest
+
+import objhelper
+
+
+def test_face_indices_mixed_v_and_v_vt_vn():
+    cols, counts = objhelper._parse_face_indices(b"1 2/1/1 3\n4/2/2 5 6/3/3\n", 2)
+    assert cols[:, 0].tolist() == [1, 2, 3, 4, 5, 6]
+    assert cols[:, 1].tolist() == [0, 1, 0, 2, 0, 3]
+    assert counts.tolist() == [3, 3]
+
+
+def test_face_indices_v_vt():
+    cols, _ = objhelper._parse_face_indices(b"1/4 2/5 3/6\n", 1)
+    assert cols.tolist() == [[1, 4, 0], [2, 5, 0], [3, 6, 0]]
+
+
+QUAD_AND_PENTAGON = b"""# a quad in absolute indices, a pentagon in relative ones
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vt 1 0
+vn 0 0 1
+f 1/1/1 2/2/1 3//1 4//1
+v 0 0 1
+v 1 0 1
+v 1.5 0.5 1
+v 1 1 1
+v 0 1 1
+vn 0 0 -1
+f -5 -4/-2 -3/-1/-1 -2 -1//-2
+"""
+
+
+def test_parse_negative_indices_and_ngons():
+    mesh = objhelper.parse_obj_bytes(QUAD_AND_PENTAGON)
+    assert mesh.vertices.shape == (9, 3) and mesh.texcoords.shape == (2, 2)
+    # fan triangulated, 2 triangles for the quad and 3 for the pentagon
+    assert mesh.faces.tolist() == [
+        [0, 1, 2],
+        [0, 2, 3],
+        [4, 5, 6],
+        [4, 6, 7],
+        [4, 7, 8],
+    ]
+    assert mesh.polygons.tolist() == [0, 0, 1, 1, 1]
+    assert mesh.face_texcoords.tolist() == [
+        [0, 1, -1],
+        [0, -1, -1],
+        [-1, 0, 1],
+        [-1, 1, -1],
+        [-1, -1, -1],
+    ]
+    assert mesh.face_normals.tolist() == [
+        [0, 0, 0],
+        [0, 0, 0],
+        [-1, -1, 1],
+        [-1, 1, -1],
+        [-1, -1, 0],
+    ]
+
+
+def test_parse_rejects_bad_indices():
+    with pytest.raises(ValueError):
+        objhelper.parse_obj_bytes(b"v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 4\n")
+    with pytest.raises(ValueError):
+        objhelper.parse_obj_bytes(b"v 0 0 0\nv 1 0 0\nv 0 1 0\nf -1 -2 -4\n")
+    with pytest.raises(ValueError):
+        objhelper.parse_obj_bytes(b"v 0 0 0\nv 1 0 0\nf 1 2\n")
+
+
+CUBE = b"""v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+v 0 0 1
+v 1 0 1
+v 1 1 1
+v 0 1 1
+f 1 4 3 2
+f 5 6 7 8
+f 1 2 6 5
+f 3 4 8 7
+f 2 3 7 6
+f 1 5 8 4
+"""
+
+
+def test_mesh_file_round_trip(tmp_path):
+    arrays = {
+        "vertices": np.arange(24, dtype=np.float32).reshape(8, 3),
+        "faces": np.array([[0, 1, 2], [2, 3, 0]], dtype=np.int32),
+        "empty": np.zeros((0, 3), dtype=np.int32),
+        "offsets": np.array([0, 3, 7], dtype=np.int64),
+    }
+    path = tmp_path / "a.mesh"
+    objhelper.save_mesh(path, arrays)
+    loaded = objhelper.load_mesh(path)
+    assert loaded.keys() == arrays.keys()
+    for name, arr in arrays.items():
+        assert loaded[name].dtype == arr.dtype
+        assert loaded[name].shape == arr.shape
+        assert (loaded[name] == arr).all()
+    assert not loaded["vertices"].flags.writeable  # backed by the mmap
+
+
+def test_compile_obj_cache(tmp_path, monkeypatch):
+    obj = tmp_path / "cube.obj"
+    obj.write_bytes(CUBE)
+    cache = tmp_path / "cache"
+    path = objhelper.compile_obj(obj, cache)
+    arrays = objhelper.load_mesh(path)
+    assert len(arrays["vertices"]) == 8
+    assert len(arrays["polygon_offsets"]) == 7  # the 6 quads stay quads
+
+    # a second compile is a cache hit, an edited OBJ gets its own entry
+    mtime = os.stat(path).st_mtime_ns
+    assert objhelper.compile_obj(obj, cache) == path
+    assert os.stat(path).st_mtime_ns == mtime
+    obj.write_bytes(CUBE + b"v 2 2 2\n")
+    assert objhelper.compile_obj(obj, cache) != path
+
+    # caches from another mesh version are never read
+    monkeypatch.setattr(objhelper, "MESH_VERSION", objhelper.MESH_VERSION + 1)
+    with pytest.raises(ValueError, match="version"):
+        objhelper.load_mesh(path)
+    obj.write_bytes(CUBE)
+    bumped = objhelper.compile_obj(obj, cache)
+    assert bumped != path
+    assert len(objhelper.load_mesh(bumped)["vertices"]) == 8
+
+
+def cube_mesh():
+    mesh = objhelper.parse_obj_bytes(CUBE)
+    return mesh.vertices, mesh.faces
+
+
+def outward(vertices, faces):
+    """whether each face's winding normal points away from the centroid"""
+    tri = vertices[faces[:, :3]]
+    cross = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    centers = vertices[faces].mean(axis=1) - vertices.mean(axis=0)
+    return (cross * centers).sum(axis=1) > 0
+
+
+def test_orient_faces_from_centroid():
+    vertices, faces = cube_mesh()
+    rng = np.random.default_rng(5)
+    flipped = rng.random(len(faces)) < 0.5
+    scrambled = np.where(flipped[:, None], faces[:, ::-1], faces)
+    assert not outward(vertices, scrambled).all()
+    oriented, _ = objhelper.orient_faces(vertices, scrambled)
+    assert outward(vertices, oriented).all()
+    # faces keep their corners, only the winding changes
+    assert (np.sort(oriented, axis=1) == np.sort(faces, axis=1)).all()
+
+
+def test_orient_faces_follows_vn_normals():
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype=float)
+    normals = np.array([[0, 0, 1], [0, 0, -1]], dtype=float)
+    faces = np.array([[0, 1, 2], [0, 1, 2]])
+    face_normals = np.array([[0, 0, 0], [1, 1, -1]])
+    # the second face only has normals for two corners, so it falls back to
+    # the centroid, which is in its plane and leaves it alone
+    oriented, oriented_normals = objhelper.orient_faces(
+        vertices, faces, face_normals, normals
+    )
+    assert oriented.tolist() == [[0, 1, 2], [0, 1, 2]]
+    face_normals = np.array([[0, 0, 0], [1, 1, 0]])
+    oriented, oriented_normals = objhelper.orient_faces(
+        vertices, faces, face_normals, normals
+    )
+    assert oriented.tolist() == [[0, 1, 2], [2, 1, 0]]
+    assert oriented_normals.tolist() == [[0, 0, 0], [0, 1, 1]]
+
+
+def test_reorder_faces_counterclockwise_mixed_sizes():
+    vertices, _ = cube_mesh()
+    faces = [([0, 1, 2, 3], [-1] * 4), ([4, 7, 6, 5], [-1] * 4), ([0, 4, 5], [-1] * 3)]
+    faces = objhelper.reorder_faces_counterclockwise(vertices, faces)
+    assert faces[0][0] == [3, 2, 1, 0]  # was winding into the cube
+    assert faces[1][0] == [5, 6, 7, 4]
+    assert faces[2][0] == [5, 4, 0]
+
+
+def uv_sphere(rings=24, segments=48):
+    """a closed sphere of triangles wound outwards"""
+    theta = np.linspace(0, np.pi, rings + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing="ij")
+    ring = np.stack([np.sin(t) * np.cos(p), np.cos(t), np.sin(t) * np.sin(p)], -1)
+    vertices = np.vstack([[0, 1, 0], ring.reshape(-1, 3), [0, -1, 0]])
+    bottom = len(vertices) - 1
+    faces = []
+    for s in range(segments):
+        n = (s + 1) % segments
+        faces.append((0, 1 + n, 1 + s))
+        for r in range(rings - 3):
+            a, b = 1 + r * segments, 1 + (r + 1) * segments
+            faces += [(a + s, a + n, b + s), (a + n, b + n, b + s)]
+        last = 1 + (rings - 2) * segments
+        faces.append((last + s, last + n, bottom))
+    return vertices, np.array(faces)
+
+
+def test_build_lods_simplify_in_steps():
+    vertices, faces = uv_sphere()
+    assert outward(vertices, faces).all()
+    face_normals = np.full(faces.shape, -1)
+    lods = objhelper.build_lods(vertices, faces, face_normals, resolution=16)
+    assert 1 <= len(lods) <= 3
+    previous = len(faces)
+    for lod_vertices, lod_faces, lod_normals in lods:
+        assert len(lod_faces) <= previous * 0.8
+        assert len(lod_normals) == len(lod_faces)
+        assert lod_faces.min() >= 0 and lod_faces.max() < len(lod_vertices)
+        # still about the same sphere, mostly wound the same way
+        assert np.abs(lod_vertices).max() <= 1
+        assert outward(lod_vertices, lod_faces).mean() > 0.9
+        previous = len(lod_faces)
+
+
+def test_compiled_mesh_has_lods(tmp_path):
+    vertices, faces = uv_sphere()
+    lines = [b"v %r %r %r" % tuple(v) for v in vertices.tolist()]
+    lines += [b"f %d %d %d" % tuple(f) for f in (faces + 1).tolist()]
+    obj = tmp_path / "sphere.obj"
+    obj.write_bytes(b"\n".join(lines) + b"\n")
+    arrays = objhelper.load_mesh(objhelper.compile_obj(obj, tmp_path))
+    sizes = [len(arrays["faces"])]
+    while f"lod{len(sizes)}_faces" in arrays:
+        sizes.append(len(arrays[f"lod{len(sizes)}_faces"]))
+    assert len(sizes) > 1 and sizes == sorted(sizes, reverse=True)
+    assert objhelper.build_lods(vertices[:1], faces[:0], faces[:0]) == []
+
+
+def split_corners(vertices, faces):
+    """give every triangle its own copies of its corners, like some exporters"""
+    return vertices[faces].reshape(-1, 3), np.arange(faces.size).reshape(-1, 3)
+
+
+def vector_area(vertices, loop):
+    pts = vertices[loop]
+    return np.cross(pts, np.roll(pts, -1, axis=0)).sum(axis=0) / 2
+
+
+def polygons_of(indices, offsets):
+    return [indices[a:b].tolist() for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def grid_triangles(cells):
+    """two triangles per unit square in the z=0 plane, facing +z"""
+    vertices, faces = [], []
+    for x, y in cells:
+        n = len(vertices)
+        vertices += [(x, y, 0), (x + 1, y, 0), (x + 1, y + 1, 0), (x, y + 1, 0)]
+        faces += [(n, n + 1, n + 2), (n, n + 2, n + 3)]
+    return np.array(vertices, dtype=float), np.array(faces)
+
+
+def test_weld_vertices():
+    vertices, faces = cube_mesh()
+    loose, loose_faces = split_corners(vertices, faces)
+    loose = loose + np.random.default_rng(6).uniform(-1e-7, 1e-7, loose.shape)
+    # plus a triangle that collapses to a line once welded
+    loose = np.vstack([loose, [[0, 0, 0], [0, 0, 1e-7], [1, 0, 0]]])
+    loose_faces = np.vstack([loose_faces, [[36, 37, 38]]])
+    welded, welded_faces, kept = objhelper.weld_vertices(loose, loose_faces)
+    assert len(welded) == 8
+    assert kept.tolist() == [True] * 12 + [False]
+    assert np.allclose(welded[welded_faces], vertices[faces], atol=1e-6)
+
+
+def test_merge_coplanar_faces_cube():
+    vertices, faces = cube_mesh()
+    indices, offsets = objhelper.merge_coplanar_faces(vertices, faces)
+    polygons = polygons_of(indices, offsets)
+    assert sorted(map(len, polygons)) == [4] * 6
+    assert outward(vertices, np.array(polygons)).all()
+
+
+def test_merge_coplanar_faces_patches():
+    # a 3x3 square becomes one quad, keeping its winding and area
+    vertices, faces = grid_triangles([(x, y) for x in range(3) for y in range(3)])
+    vertices, faces, _ = objhelper.weld_vertices(vertices, faces)
+    polygons = polygons_of(*objhelper.merge_coplanar_faces(vertices, faces))
+    assert len(polygons) == 1 and len(polygons[0]) == 4
+    assert np.allclose(vector_area(vertices, polygons[0]), (0, 0, 9))
+
+    # an L isn't convex so it stays in convex pieces that cover the same area
+    vertices, faces = grid_triangles([(0, 0), (1, 0), (2, 0), (0, 1), (0, 2)])
+    vertices, faces, _ = objhelper.weld_vertices(vertices, faces)
+    polygons = polygons_of(*objhelper.merge_coplanar_faces(vertices, faces))
+    assert 1 < len(polygons) < 5
+    areas = [vector_area(vertices, p) for p in polygons]
+    assert all(a[2] > 0 for a in areas)
+    assert np.allclose(np.sum(areas, axis=0), (0, 0, 5))
+
+    # and faces with different materials are never merged together
+    vertices, faces = grid_triangles([(0, 0), (1, 0)])
+    vertices, faces, _ = objhelper.weld_vertices(vertices, faces)
+    materials = np.array([0, 0, 1, 1])
+    polygons = polygons_of(*objhelper.merge_coplanar_faces(vertices, faces, materials))
+    assert len(polygons) == 2
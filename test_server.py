@@ -0,0 +1,98 @@
+"""Tests for the game server's snapshots, run with `python -m pytest`."""
+
+import asyncio
+import os
+import struct
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import minecrafttest as mc
+import server
+
+
+def make_entities(world, count):
+    entities = []
+    for i in range(count):
+        kind = mc.Player if i % 2 else mc.Entity
+        entity = kind(mc.Coordinate(i, 1, -i), world)
+        world.add_entity(entity)
+        entities.append(entity)
+    return entities
+
+
+def states(entities):
+    return {entity.id: server.entity_state(entity) for entity in entities}
+
+
+def test_entity_state_kinds():
+    world = mc.World()
+    entity, player = make_entities(world, 2)
+    assert server.entity_state(entity)[2] == server.KINDS.index(mc.Entity)
+    assert server.entity_state(player)[2] == server.KINDS.index(mc.Player)
+    # yaw wraps, so a full turn sends the same rotation
+    before = server.entity_state(player)
+    player.rotate(360, 0)
+    assert server.entity_state(player) == before
+
+
+def test_full_snapshot():
+    world = mc.World()
+    state = states(make_entities(world, 5))
+    payload = server.encode_snapshot(1, 0, {}, state, 12.5)
+    assert server.decode_snapshot(payload, {}) == (1, 0, 12.5, state)
+
+
+def test_delta_snapshot():
+    world = mc.World()
+    entities = make_entities(world, 6)
+    base = states(entities)
+    entities[0].pos.x += 1  # moved
+    entities[1].rotate(15, -5)  # turned
+    entities[2].pos.y -= 1  # moved and turned
+    entities[2].rotate(-30, 0)
+    gone = entities.pop(3)
+    world.remove_entity(gone)
+    new = mc.Player(mc.Coordinate(9, 9, 9), world)
+    entities.append(new)
+    state = states(entities)
+
+    payload = server.encode_snapshot(7, 4, base, state, 0.0)
+    head = struct.calcsize("<BIIdHH")
+    changes = 3 * 9 + 1 * 9  # id and mask for 3 changed entities and the new one
+    changes += 2 * 12 + 2 * 4  # 2 positions and 2 rotations among the changed
+    changes += 12 + 4 + 1  # everything about the new one
+    assert len(payload) == head + changes + 8  # plus the removed id
+
+    tick, base_tick, _, decoded = server.decode_snapshot(payload, {4: base})
+    assert (tick, base_tick) == (7, 4)
+    assert decoded == state
+    assert gone.id not in decoded
+
+    # nothing changed is just the header
+    unchanged = server.encode_snapshot(8, 7, state, state, 0.0)
+    assert len(unchanged) == head
+    assert server.decode_snapshot(unchanged, {7: state})[3] == state
+
+
+def test_bots_follow_the_server():
+    async def play():
+        game = server.GameServer(server.flat_world(16), tick_rate=200)
+        listener = await game.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        ticking = asyncio.create_task(game.run_ticks())
+        try:
+            bots = await server.run_bots("127.0.0.1", port, 2, 40, spread=4.0)
+        finally:
+            ticking.cancel()
+            listener.close()
+        return game, bots
+
+    game, bots = asyncio.run(play())
+    for bot in bots:
+        assert len(bot.received) == 40
+        assert bot.full < 40  # acked snapshots come as deltas
+        # each bot sees itself and the other, at decodable positions
+        assert len(bot.state) == 2 and bot.player_id in bot.state
+        x, y, z = struct.unpack("<fff", bot.state[bot.player_id][0])
+        assert abs(x) <= 16 and abs(z) <= 16 and y > 0
+    assert not game.clients  # both were dropped when they disconnected
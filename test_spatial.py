@@ -0,0 +1,137 @@
+"""Tests for the spatial indexes, run with `python -m pytest`."""
+
+import math
+import random
+
+import spatial
+
+
+def random_box(rng, spread=50.0, size=4.0):
+    x, y, z = (rng.uniform(-spread, spread) for _ in range(3))
+    w, h, d = (rng.uniform(0.1, size) for _ in range(3))
+    return (x, y, z, x + w, y + h, z + d)
+
+
+def brute_box(boxes, box):
+    return sorted(item for item, b in boxes.items() if spatial.overlaps(b, box))
+
+
+def brute_sphere(boxes, center, radius):
+    return sorted(
+        item for item, b in boxes.items() if spatial.sphere_overlaps(b, center, radius)
+    )
+
+
+def check_balanced(node):
+    # every inner node covers its children and the tree stays AVL balanced
+    if node.left is None:
+        return 0
+    assert node.left.parent is node and node.right.parent is node
+    assert spatial.contains(node.box, node.left.box)
+    assert spatial.contains(node.box, node.right.box)
+    hl = check_balanced(node.left)
+    hr = check_balanced(node.right)
+    assert abs(hl - hr) <= 1
+    return 1 + max(hl, hr)
+
+
+def test_bvh_matches_brute_force():
+    rng = random.Random(1)
+    tree = spatial.BVH()
+    boxes = {}
+    for i in range(400):
+        boxes[i] = random_box(rng)
+        tree.insert(i, boxes[i])
+    for i in range(0, 400, 3):
+        tree.remove(i)
+        del boxes[i]
+    for i in range(1, 400, 3):
+        boxes[i] = random_box(rng)
+        tree.update(i, boxes[i])
+    tree.remove(9999)  # unknown items are ignored
+
+    assert len(tree) == len(boxes)
+    assert check_balanced(tree.root) < 4 * math.log2(len(boxes))
+    for item, box in boxes.items():
+        assert tree.get_box(item) == box
+    for _ in range(50):
+        box = random_box(rng, size=20.0)
+        assert sorted(tree.query_box(box)) == brute_box(boxes, box)
+        center = tuple(rng.uniform(-50, 50) for _ in range(3))
+        radius = rng.uniform(0, 15)
+        assert sorted(tree.query_sphere(center, radius)) == brute_sphere(
+            boxes, center, radius
+        )
+
+
+def test_bvh_raycast_nearest_first():
+    rng = random.Random(2)
+    tree = spatial.BVH()
+    boxes = {i: random_box(rng) for i in range(200)}
+    for item, box in boxes.items():
+        tree.insert(item, box)
+    for _ in range(50):
+        origin = tuple(rng.uniform(-60, 60) for _ in range(3))
+        d = [rng.gauss(0, 1) for _ in range(3)]
+        n = math.sqrt(sum(c * c for c in d))
+        direction = tuple(c / n for c in d)
+        hits = tree.raycast(origin, direction, 80.0)
+        expected = {}
+        for item, box in boxes.items():
+            t = spatial.ray_box(origin, direction, box, 80.0)
+            if t is not None:
+                expected[item] = t
+        assert {item for _, item in hits} == set(expected)
+        assert [t for t, _ in hits] == sorted(expected.values())
+
+
+def test_bvh_update_inside_margin_keeps_tree():
+    tree = spatial.BVH(margin=0.5)
+    tree.insert("a", (0, 0, 0, 1, 1, 1))
+    assert not tree.update("a", (0.2, 0, 0, 1.2, 1, 1))
+    assert tree.get_box("a") == (0.2, 0, 0, 1.2, 1, 1)
+    assert tree.query_box((1.1, 0, 0, 1.15, 1, 1)) == ["a"]
+    assert tree.query_box((-0.1, 0, 0, 0.1, 1, 1)) == []
+    assert tree.update("a", (5, 5, 5, 6, 6, 6))
+    tree.remove("a")
+    assert len(tree) == 0 and tree.root is None
+
+
+def test_spatial_hash_matches_brute_force():
+    rng = random.Random(3)
+    grid = spatial.SpatialHash(cell_size=2.0)
+    boxes = {}
+    for i in range(300):
+        boxes[i] = random_box(rng, spread=20.0)
+        grid.insert(i, boxes[i])
+    for i in range(0, 300, 4):
+        grid.remove(i)
+        del boxes[i]
+    for i in range(1, 300, 4):
+        boxes[i] = random_box(rng, spread=20.0)
+        grid.update(i, boxes[i])
+    grid.remove(9999)
+
+    assert len(grid) == len(boxes)
+    # no empty buckets are left behind and every item is in all its cells
+    assert all(grid.cells.values())
+    for item, r in grid.ranges.items():
+        assert all(item in grid.cells[key] for key in grid._keys(r))
+    for _ in range(50):
+        box = random_box(rng, spread=20.0, size=10.0)
+        assert sorted(grid.query_box(box)) == brute_box(boxes, box)
+        center = tuple(rng.uniform(-20, 20) for _ in range(3))
+        radius = rng.uniform(0, 8)
+        assert sorted(grid.query_sphere(center, radius)) == brute_sphere(
+            boxes, center, radius
+        )
+
+    pairs = sorted(tuple(sorted(p)) for p in grid.pairs())
+    items = sorted(boxes)
+    expected = [
+        (a, b)
+        for n, a in enumerate(items)
+        for b in items[n + 1 :]
+        if spatial.overlaps(boxes[a], boxes[b])
+    ]
+    assert pairs == expected
@@ -0,0 +1,546 @@
+"""Regression tests for the engine, run with `python -m pytest`."""
+
+import json
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pytest
+
+import minecrafttest as mc
+
+
+def test_is_solid_far_apart_blocks():
+    # two blocks this far apart used to need a 24 GiB occupancy grid
+    world = mc.World()
+    world.add_block(mc.Block(mc.Coordinate(0, 0, 0), (255, 255, 255)))
+    world.add_block(mc.Block(mc.Coordinate(20000, 64, 20000), (255, 255, 255)))
+    cells = [(0, 0, 0), (20000, 64, 20000), (1, 0, 0), (-1, -1, -1), (20000, 65, 20000)]
+    assert world.is_solid(cells).tolist() == [True, True, False, False, False]
+
+    batch = mc.EntityBatch(world)
+    i = batch.spawn(mc.Coordinate(20000.5, 70, 20000.5))
+    for _ in range(60):
+        batch.step(1 / 20)
+    assert batch.on_ground[i]
+    assert np.isclose(batch.get_pos(i).y, 65)
+
+    world.remove_block(mc.Coordinate(0, 0, 0))
+    assert not world.is_solid([(0, 0, 0)])[0]
+
+
+def test_scheduler_entity_without_hitbox():
+    world = mc.World()
+    entity = mc.Entity(mc.Coordinate(0, 5, 0), world)
+    world.add_entity(entity)
+    player = mc.Player(mc.Coordinate(0, 0, 0), world)
+    scheduler = mc.EntityScheduler(world, player)
+    for _ in range(10):
+        scheduler.tick(1 / 30)
+    assert entity.pos.get() == (0, 5, 0)
+
+
+def test_governor_keeps_manual_settings():
+    options = mc.GameOptions()
+    options.adaptive_quality = False
+    options.render_distance = 200
+    options.outlines = False
+    mc.QualityGovernor(options)
+    assert options.render_distance == 200
+    assert not options.outlines
+
+
+def make_mob(world, x, y, z):
+    mob = mc.Entity(mc.Coordinate(x, y, z), world)
+    mob.hitbox = mc.Hitbox(
+        mob.pos, mc.Coordinate(-0.3, 0, -0.3), mc.Coordinate(0.3, 1.8, 0.3)
+    )
+    return mob
+
+
+def test_scheduler_follows_world_entities():
+    world = mc.World()
+    for x in range(-4, 5):
+        for z in range(-4, 5):
+            world.add_block(mc.Block(mc.Coordinate(x, 0, z), (255, 255, 255)))
+    player = mc.Player(mc.Coordinate(0, 1, 0), world)
+    world.add_entity(player)
+    early = make_mob(world, 2.5, 3, 2.5)
+    world.add_entity(early)
+    scheduler = mc.EntityScheduler(world, player)
+    late = make_mob(world, -2.5, 3, -2.5)
+    world.add_entity(late)  # added after the scheduler was made
+
+    for _ in range(300):
+        scheduler.tick(1 / 30)
+    for mob in (early, late):
+        assert mob.pos.y == 1  # fell onto the floor
+        assert mob.id in scheduler.sleeping
+    assert player.id not in scheduler.due
+
+    world.add_block(mc.Block(mc.Coordinate(3, 1, 3), (255, 255, 255)))
+    assert early.id not in scheduler.sleeping and early.id in scheduler.due
+    assert late.id in scheduler.sleeping  # too far away to be woken
+
+    world.remove_entity(late)
+    assert late.id not in scheduler.sleeping
+    assert late.id not in scheduler.last_update
+
+
+def test_batch_spawn_defaults_not_shared():
+    batch = mc.EntityBatch(mc.World())
+    i = batch.spawn(mc.Coordinate(0, 5, 0), gravity=False)
+    batch.set_velocity(i, mc.Coordinate(1, 0, 0))
+    j = batch.spawn(mc.Coordinate(0, 5, 0), gravity=False)
+    assert batch.vel[j].tolist() == [0, 0, 0]
+    assert batch.end[j].tolist() == [0.3, 1.8, 0.3]
+
+
+def test_batch_and_entity_agree_on_partial_blocks():
+    world = mc.World()
+    half = mc.Mesh.box((0, 0, 0), (1, 0.5, 1))
+    for x in range(-2, 3):
+        for z in range(-2, 3):
+            world.add_block(mc.Block(mc.Coordinate(x, 0, z), (255, 255, 255)))
+    world.add_block(mc.BlockModel.from_mesh(mc.Coordinate(0, 1, 0), (0, 0, 0), half))
+    assert len(world.partial) == 1
+
+    batch = mc.EntityBatch(world)
+    i = batch.spawn(mc.Coordinate(0.5, 3, 0.5))
+    j = batch.spawn(mc.Coordinate(-1.5, 1, 0.5), vel=mc.Coordinate(4, 0, 0))
+    for _ in range(40):
+        batch.step(1 / 20)
+    mob = make_mob(world, 0.5, 3, 0.5)
+    mob.move(0, -5, 0)
+    assert np.isclose(batch.get_pos(i).y, 1.5) and mob.pos.y == 1.5
+    # walks into the side of the half block and stops, like Entity.move
+    walker = make_mob(world, -1.5, 1, 0.5)
+    walker.move(5, 0, 0)
+    assert np.isclose(batch.get_pos(j).x, walker.pos.x)
+    assert np.isclose(walker.pos.x, -0.3)
+
+
+def test_save_callable_asset_by_mesh(tmp_path):
+    assets = mc.AssetRegistry()
+    assets.register("half", lambda: mc.Mesh.box((0, 0, 0), (1, 0.5, 1)))
+    world = mc.World()
+    model = mc.BlockModel.from_asset(mc.Coordinate(1, 0, 0), (1, 2, 3), assets, "half")
+    world.add_block(model)
+    path = tmp_path / "world.json"
+    world.save(path)
+
+    loaded = mc.World.load(path, mc.AssetRegistry())  # knows nothing of "half"
+    block = loaded.get_block(mc.Coordinate(1, 0, 0))
+    assert block.asset is None
+    assert block.mesh.vertices[:, 1].max() == 0.5
+
+
+def test_load_unregistered_asset_names_it(tmp_path):
+    path = tmp_path / "world.json"
+    block = {"type": "BlockModel", "pos": [0, 0, 0], "color": [1, 2, 3]}
+    block.update(transparent=False, asset="tree")
+    path.write_text(json.dumps({"blocks": [block], "meshes": [], "assets": {}}))
+    with pytest.raises(ValueError, match="'tree'"):
+        mc.World.load(path)
+
+
+def test_input_recorder_flushes_every_frame(tmp_path):
+    game = mc.Game(mc.World(), mc.pygame.Surface((80, 60)), mc.AssetRegistry(), True)
+    path = tmp_path / "session.jsonl"
+    with mc.InputRecorder(str(path), game, str(tmp_path / "world.json")) as recorder:
+        recorder.record({"events": [], "keys": ["w"], "mouse": [0, 0]})
+        lines = path.read_text().splitlines()
+        assert len(lines) == 2 and json.loads(lines[1])["keys"] == ["w"]
+    assert recorder.file.closed
+
+
+def test_asset_failures(tmp_path):
+    assets = mc.AssetRegistry()
+    assets.register("missing", str(tmp_path / "missing.obj"))
+    assets.get("missing")
+    assets.wait()
+    assert isinstance(assets.failed["missing"], OSError)
+
+    def broken():
+        raise TypeError("a bug")
+
+    assets.register("broken", broken)
+    assets.get("broken")
+    with pytest.raises(TypeError):
+        assets.wait()
+    assert "broken" in assets.failed
+
+
+def raycast_world():
+    world = mc.World()
+    world.add_block(mc.Block(mc.Coordinate(0, 0, 0), (255, 255, 255)))
+    half = mc.Mesh.box((0, 0, 0), (1, 0.5, 1))
+    world.add_block(mc.BlockModel.from_mesh(mc.Coordinate(3, 0, 0), (0, 0, 0), half))
+    return world
+
+
+def test_raycast_partial_blocks():
+    world = raycast_world()
+    C = mc.Coordinate
+    # over the half block and on to the full one behind it
+    hit = world.raycast(C(5.5, 0.75, 0.5), C(-1, 0, 0))
+    assert hit.block.pos.get() == (0, 0, 0) and hit.distance == 4.5
+    assert hit.get_adjacent().get() == (1, 0, 0)
+    # into the side of the half block
+    hit = world.raycast(C(5.5, 0.25, 0.5), C(-1, 0, 0))
+    assert hit.block.pos.get() == (3, 0, 0)
+    assert np.isclose(hit.distance, 1.5) and np.allclose(hit.normal, (1, 0, 0))
+    assert hit.get_adjacent().get() == (4, 0, 0)
+    # onto its top, from inside its cell
+    hit = world.raycast(C(3.5, 0.75, 0.5), C(0, -1, 0))
+    assert np.isclose(hit.distance, 0.25) and np.allclose(hit.normal, (0, 1, 0))
+    assert np.isclose(hit.point.y, 0.5)
+    assert hit.get_adjacent().get() == (3, 1, 0)
+    assert world.raycast(C(5.5, 0.75, 0.5), C(-1, 0, 0), max_dist=4) is None
+
+
+def test_raycast_from_inside_a_block():
+    world = raycast_world()
+    hit = world.raycast(mc.Coordinate(0.5, 0.5, 0.5), mc.Coordinate(1, 0, 0))
+    assert hit.block.pos.get() == (0, 0, 0) and hit.distance == 0
+    assert tuple(hit.normal) == (0, 0, 0)
+    assert hit.get_adjacent() is None
+
+
+def test_raycast_many_matches_raycast():
+    world = raycast_world()
+    rng = np.random.default_rng(4)
+    origins = rng.uniform((-3, -1, -3), (7, 3, 4), (200, 3))
+    # mostly aimed somewhere along the two blocks
+    directions = rng.uniform((0, 0, 0), (4, 1, 1), (200, 3)) - origins
+    directions[0] = 0  # rays with no direction hit nothing
+    origins[1] = (0.5, 0.5, 0.5)  # starts inside a block
+    dist, normals, blocks = world.raycast_many(origins, directions, 8)
+    assert dist[0] == np.inf and blocks[0] is None
+    assert dist[1] == 0 and blocks[1].pos.get() == (0, 0, 0)
+    hits = 0
+    for i in range(1, 200):
+        hit = world.raycast(mc.Coordinate(*origins[i]), mc.Coordinate(*directions[i]))
+        if hit is None:
+            assert blocks[i] is None and dist[i] == np.inf
+            continue
+        hits += 1
+        assert blocks[i] is hit.block
+        assert np.isclose(dist[i], hit.distance)
+        assert np.allclose(normals[i], hit.normal)
+    assert hits > 20
+
+
+def test_move_does_not_tunnel_through_slabs():
+    world = mc.World()
+    world.add_block(mc.BlockSlab(mc.Coordinate(0, 0, 0), (255, 255, 255)))
+    mob = make_mob(world, 0.5, 10, 0.5)
+    # far more than a block in one step still stops on the slab's hitbox
+    assert mob.move(0, -50, 0) == (0, -9, 0)
+    assert mob.pos.y == 1
+    assert mob.move(0, -1, 0) == (0, 0, 0)
+
+
+def test_move_against_half_height_slab():
+    world = mc.World()
+    half = mc.Mesh.box((0, 0, 0), (1, 0.5, 1))
+    world.add_block(mc.BlockModel.from_mesh(mc.Coordinate(0, 0, 0), (0, 0, 0), half))
+    mob = make_mob(world, 0.5, 3, 0.5)
+    mob.move(0, -5, 0)
+    assert mob.pos.y == 0.5
+    # the side of the slab stops a walk below its top, but not one above it
+    low = make_mob(world, -2, 0, 0.5)
+    assert low.move(5, 0, 0) == (1.7, 0, 0)
+    high = make_mob(world, -2, 0.5, 0.5)
+    assert high.move(5, 0, 0) == (5, 0, 0)
+
+
+def test_move_against_offgrid_slab():
+    world = mc.World()
+    slab = mc.BlockSlab(mc.Coordinate(0.5, 0, 0.5), (255, 255, 255))
+    world.add_block(slab)
+    assert slab in world.offgrid
+    mob = make_mob(world, 1, 5, 1)
+    mob.move(0, -10, 0)
+    assert mob.pos.y == 1
+    # right beside it the mob falls past
+    mob = make_mob(world, 2, 5, 1)
+    mob.move(0, -10, 0)
+    assert mob.pos.y == -5
+
+
+def test_move_slides_along_walls():
+    world = mc.World()
+    for z in range(-3, 4):
+        world.add_block(mc.BlockSlab(mc.Coordinate(2, 0, z), (255, 255, 255)))
+    mob = make_mob(world, 0.5, 0, 0.5)
+    dx, dy, dz = mob.move(3, 0, 2)
+    assert np.isclose(dx, 1.2) and dz == 2
+    assert np.isclose(mob.pos.x, 1.7) and mob.pos.z == 2.5
+    # a mob stuck inside a slab can still get out of it
+    stuck = make_mob(world, 2.5, 0.5, 0.5)
+    assert stuck.move(3, 0, 0) == (3, 0, 0)
+
+
+def test_lod_by_screen_size():
+    options = mc.GameOptions()
+    camera = mc.Camera(mc.Coordinate(0, 0, 0))
+    screen = mc.Screen(mc.pygame.Surface((80, 60)), camera, options)
+    model = mc.BlockModel.from_mesh(
+        mc.Coordinate(0, 0, 0), (0, 0, 0), mc.Mesh.box((0, 0, 0), (1, 1, 1))
+    )
+    levels = []
+    for dist in (0, 2, 5, 10, 20, 50, 200):
+        model.pos.x = dist
+        levels.append(screen.get_lod(model))
+    assert levels[0] == 0 and levels[-1] == len(options.lod_thresholds)
+    assert levels == sorted(levels)
+    # a higher bias drops detail sooner
+    model.pos.x = 10
+    options.lod_bias = 4
+    assert screen.get_lod(model) > levels[3]
+
+
+def make_screen(camera):
+    return mc.Screen(mc.pygame.Surface((160, 120)), camera, mc.GameOptions())
+
+
+def add_wall(world, x, lo, hi, **kwargs):
+    """a wall of blocks across the yz plane at x"""
+    for y in range(lo, hi):
+        for z in range(lo, hi):
+            world.add_block(mc.Block(mc.Coordinate(x, y, z), (255, 255, 255), **kwargs))
+
+
+def test_chunk_visibility():
+    world = mc.World()
+    assert world.get_chunk_visibility((0, 0, 0)) == (mc._ALL_FACES,) * 6
+    add_wall(world, 8, 0, 16)
+    vis = world.get_chunk_visibility((0, 0, 0))
+    # -x and +x are cut off from each other but still see the other faces
+    assert vis[0] == mc._ALL_FACES & ~0b10 and vis[1] == mc._ALL_FACES & ~0b01
+    assert vis[2] == vis[3] == vis[4] == vis[5] == mc._ALL_FACES
+
+    world.remove_block(mc.Coordinate(8, 15, 15))  # a gap in the corner
+    assert world.get_chunk_visibility((0, 0, 0)) == (mc._ALL_FACES,) * 6
+
+    glass = mc.World()
+    add_wall(glass, 8, 0, 16, transparent=True)
+    assert glass.get_chunk_visibility((0, 0, 0)) == (mc._ALL_FACES,) * 6
+
+
+def test_reachable_chunks_stop_at_walls():
+    world = mc.World()
+    add_wall(world, 20, 0, 16)  # fills chunk (1, 0, 0) across
+    world.add_block(mc.Block(mc.Coordinate(40, 8, 8), (255, 255, 255)))
+    screen = make_screen(mc.Camera(mc.Coordinate(8, 8, 8), yaw=90))
+    assert screen.get_reachable_chunks(world, screen.get_frustum()) == {
+        (0, 0, 0),
+        (1, 0, 0),
+    }
+    world.remove_block(mc.Coordinate(20, 8, 8))
+    reached = screen.get_reachable_chunks(world, screen.get_frustum())
+    assert (2, 0, 0) in reached
+    # nothing is reached behind the camera
+    screen.camera.yaw = 270
+    assert (1, 0, 0) not in screen.get_reachable_chunks(world, screen.get_frustum())
+
+
+def test_cull_occluded():
+    world = mc.World()
+    add_wall(world, 6, -4, 17)
+    behind = mc.Block(mc.Coordinate(20, 6, 6), (255, 255, 255))
+    front = mc.Block(mc.Coordinate(3, 6, 9), (255, 255, 255))
+    aside = mc.Block(mc.Coordinate(20, 6, 60), (255, 255, 255))
+    for block in (behind, front, aside):
+        world.add_block(block)
+    screen = make_screen(mc.Camera(mc.Coordinate(0.5, 6.5, 6.5), yaw=90))
+
+    kept = screen.cull_occluded(world, list(world.blocks.values()))
+    assert behind not in kept and screen.draws_saved == 1
+    assert front in kept and aside in kept
+    assert len(kept) == len(world.blocks) - 1
+    # seen through a hole in the wall, and kept
+    world.remove_block(mc.Coordinate(6, 6, 6))
+    kept = screen.cull_occluded(world, list(world.blocks.values()))
+    assert behind in kept and screen.draws_saved == 0
+
+
+def test_cull_occluded_keeps_blocks_behind_glass():
+    world = mc.World()
+    add_wall(world, 6, -4, 17, transparent=True)
+    behind = mc.Block(mc.Coordinate(20, 6, 6), (255, 255, 255))
+    world.add_block(behind)
+    screen = make_screen(mc.Camera(mc.Coordinate(0.5, 6.5, 6.5), yaw=90))
+    assert behind in screen.cull_occluded(world, list(world.blocks.values()))
+
+
+def test_save_load_round_trip(tmp_path):
+    C = mc.Coordinate
+    assets = mc.AssetRegistry()
+    tree = str(tmp_path / "tree.obj")  # never loaded, only saved by name
+    assets.register("tree", tree, ((0, 0, 0), (1, 2, 1)))
+    half = mc.Mesh.box((0, 0, 0), (1, 0.5, 1))
+    world = mc.World()
+    world.add_block(mc.Block(C(0, 0, 0), (1, 2, 3)))
+    world.add_block(mc.Block(C(1, 0, 0), (4, 5, 6), transparent=True))
+    world.add_block(mc.BlockSlab(C(2, 0, 0), (7, 8, 9), bottom=False))
+    world.add_block(mc.BlockSlab(C(2.5, 1, 0.5), (7, 8, 9)))  # off the grid
+    world.add_block(mc.BlockStairs(C(3, 0, 0), (1, 1, 1), direction="e"))
+    world.add_block(mc.BlockVerticalSlab(C(4, 0, 0), (2, 2, 2), left=False))
+    world.add_block(mc.BlockModel.from_mesh(C(5, 0, 0), (3, 3, 3), half))
+    world.add_block(mc.BlockModel.from_mesh(C(6, 0, 0), (3, 3, 3), half))
+    world.add_block(mc.BlockModel.from_asset(C(7, 0, 0), (4, 4, 4), assets, "tree"))
+    path = tmp_path / "world.json"
+    world.save(path)
+    assert len(json.loads(path.read_text())["meshes"]) == 1  # shared, saved once
+
+    loaded_assets = mc.AssetRegistry()
+    loaded = mc.World.load(path, loaded_assets)
+    assert loaded.blocks.keys() == world.blocks.keys()
+    for key, block in world.blocks.items():
+        other = loaded.blocks[key]
+        assert type(other) is type(block)
+        assert other.pos.get() == block.pos.get()
+        assert tuple(other.color) == tuple(block.color)
+        assert other.transparent == block.transparent
+        assert other.get_state() == block.get_state()
+        assert other.hitbox.bounds() == block.hitbox.bounds()
+    assert len(loaded.offgrid) == len(world.offgrid) == 2  # tall tree too
+    assert loaded_assets.sources["tree"] == tree
+    models = [loaded.get_block(C(x, 0, 0)) for x in (5, 6, 7)]
+    assert models[0].mesh is models[1].mesh
+    assert models[0].mesh.faces == half.faces
+    assert models[2].asset == "tree"
+
+
+def test_heightmap_follows_block_changes():
+    C = mc.Coordinate
+    rng = np.random.default_rng(7)
+    tall = mc.Mesh.box((0, 0, 0), (1, 2, 1))  # sticks out of its cell
+    world = mc.World()
+    for _ in range(600):
+        pos = C(*rng.integers((-2, 0, -2), (2, 6, 2)).tolist())
+        op = rng.integers(3)
+        if op == 0:
+            world.set_block(mc.Block(pos, (255, 255, 255)))
+        elif op == 1:
+            world.set_block(mc.BlockModel.from_mesh(pos, (0, 0, 0), tall))
+        else:
+            world.remove_block(pos)
+
+        columns = {}
+        for (x, y, z), block in world.blocks.items():
+            if block not in world.offgrid:
+                columns.setdefault((x, z), []).append(y)
+        assert world.heights == {key: max(ys) for key, ys in columns.items()}
+    for x in range(-2, 2):
+        for z in range(-2, 2):
+            y = world.get_height(x + 0.5, z + 0.5)
+            if y is None:
+                assert world.get_top_block(x, z) is None
+                assert world.get_ground(x, z) is None
+            else:
+                assert world.get_top_block(x, z) is world.blocks[(x, y, z)]
+                assert world.get_ground(x, z) == y + 1
+
+
+def test_ground_of_partial_blocks():
+    C = mc.Coordinate
+    world = mc.World()
+    world.add_block(mc.Block(C(0, 0, 0), (255, 255, 255)))
+    half = mc.Mesh.box((0, 0, 0), (1, 0.5, 1))
+    world.add_block(mc.BlockModel.from_mesh(C(0, 1, 0), (9, 9, 9), half))
+    assert world.get_height(0, 0) == 1 and world.get_ground(0, 0) == 1.5
+    assert world.get_top_color(0, 0) == (9, 9, 9)
+    world.add_block(mc.Block(C(0.5, 5, 0.5), (255, 255, 255)))  # off the grid
+    assert world.get_height(0, 0) == 1
+
+
+def test_minimap_redraws_dirty_tiles():
+    world = mc.World()
+    world.add_block(mc.Block(mc.Coordinate(0, 0, 0), (255, 255, 255)))
+    minimap = mc.Minimap(world, scale=1, radius=16)
+    surface = mc.pygame.Surface((64, 64))
+    center = mc.Coordinate(8, 0, 8)
+    minimap.render(surface, center, 0)
+    assert minimap.redrawn == 9  # 3x3 tiles around the center
+    minimap.render(surface, center, 0)
+    assert minimap.redrawn == 0
+    world.add_block(mc.Block(mc.Coordinate(20, 3, 2), (255, 0, 0)))
+    minimap.render(surface, center, 0)
+    assert minimap.redrawn == 1
+    # x 20, z 2 is at (4, 13) in tile (1, 0), which has z going up
+    r, g, b, _ = minimap.tiles[(1, 0)].get_at((4, 13))
+    assert r > 200 and g == b == 0
+    minimap.close()
+    world.remove_block(mc.Coordinate(0, 0, 0))
+    assert not minimap.dirty
+
+
+def box_world(seed):
+    """blocks scattered over several chunks, some off the grid or partial"""
+    C = mc.Coordinate
+    rng = np.random.default_rng(seed)
+    half = mc.Mesh.box((0, 0, 0), (1, 0.5, 1))
+    world = mc.World()
+    for x, y, z in rng.integers(-20, 20, (1500, 3)).tolist():
+        kind = rng.integers(10)
+        if kind == 0:
+            world.set_block(mc.BlockModel.from_mesh(C(x, y, z), (0, 0, 0), half))
+        elif kind == 1:
+            world.set_block(mc.Block(C(x + 0.5, y, z), (255, 255, 255)))
+        else:
+            world.set_block(mc.Block(C(x, y, z), (255, 255, 255)))
+    return world, rng
+
+
+def blocks_in_box_by_cell(world, lo, hi):
+    out = {}
+    for x in range(lo[0], hi[0]):
+        for y in range(lo[1], hi[1]):
+            for z in range(lo[2], hi[2]):
+                block = world.get_block_at(x, y, z)
+                if block is not None and block not in world.offgrid:
+                    out[(x, y, z)] = block
+    return out
+
+
+def test_blocks_in_box_match_the_cell_loop():
+    world, rng = box_world(8)
+    n = mc.SMALL_BOX_CELLS
+    sizes = [(1, 1, 1), (2, 4, 4), (n, 1, 1), (n + 1, 1, 1), (3, 3, 4), (11, 7, 9)]
+    sizes += [(0, 5, 5), (5, -2, 5)]  # empty boxes
+    for _ in range(2):
+        for size in sizes:
+            for _ in range(20):
+                lo = tuple(rng.integers(-24, 20, 3).tolist())
+                hi = tuple(a + b for a, b in zip(lo, size))
+                expected = blocks_in_box_by_cell(world, lo, hi)
+                assert world.get_blocks_in_box(lo, hi) == expected
+                mask = world.get_solid_mask(lo, hi)
+                assert mask.shape == tuple(max(s, 0) for s in size)
+                cells = (np.argwhere(mask) + lo).tolist()
+                assert sorted(map(tuple, cells)) == sorted(expected)
+        # the chunk grids are rebuilt after blocks change
+        for key in list(world.blocks)[::3]:
+            world.remove_block(mc.Coordinate(*key))
+
+
+def test_cell_queries_match_blocks():
+    world, rng = box_world(9)
+    cells = rng.integers(-22, 22, (3000, 3))
+    solid = world.is_solid(cells)
+    kinds = world.get_cell_kinds(cells)
+    for cell, is_solid, kind in zip(cells.tolist(), solid.tolist(), kinds.tolist()):
+        block = world.get_block_at(*cell)
+        on_grid = block is not None and block not in world.offgrid
+        assert is_solid == on_grid
+        if not on_grid:
+            assert kind == mc.CELL_EMPTY
+        elif block in world.partial:
+            assert kind == mc.CELL_PARTIAL
+        else:
+            assert kind == mc.CELL_FULL
+    assert world.is_solid(cells.reshape(30, 100, 3)).shape == (30, 100)